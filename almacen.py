@@ -0,0 +1,331 @@
+"""
+Almacén analítico local con las tablas de todas las consultas.
+
+Las tablas que arman procesar_deudas, procesar_deudas_historicas y procesar_cheques_rechazados se
+guardan en una base SQLite (en utils.DIRECTORIO_DATOS) a medida que se resume cada CUIT: utils
+las entrega a ALMACEN.recibir y se escriben por lotes. Las tablas están indexadas por CUIT, período
+y entidad, así que las preguntas sobre toda la cartera ("exposición por entidad en situación 3 o
+peor en el último período") se responden con datos locales, sin volver a consultar la API.
+
+    python almacen.py exposicion --situacion-minima 3
+    python almacen.py sql "SELECT periodo, COUNT(*) FROM deudas GROUP BY periodo"
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+import utils
+
+RUTA_ALMACEN = os.path.join(utils.DIRECTORIO_DATOS, "almacen.sqlite")
+
+# Filas acumuladas a partir de las cuales se escribe el lote sin esperar al final de la consulta
+FILAS_POR_LOTE = 20000
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS deudas (
+    cuit TEXT NOT NULL,
+    periodo TEXT NOT NULL,
+    entidad TEXT NOT NULL,
+    denominacion TEXT,
+    situacion INTEGER NOT NULL,
+    fecha_sit1 TEXT,
+    monto REAL NOT NULL,
+    dias_atraso INTEGER,
+    refinanciaciones INTEGER,
+    recategorizacion_obligatoria INTEGER,
+    situacion_juridica INTEGER,
+    irrecuperable_disposicion_tecnica INTEGER,
+    en_revision INTEGER,
+    proceso_judicial INTEGER,
+    ingresado REAL NOT NULL,
+    PRIMARY KEY (cuit, periodo, entidad)
+);
+CREATE INDEX IF NOT EXISTS idx_deudas_periodo ON deudas (periodo, situacion);
+CREATE INDEX IF NOT EXISTS idx_deudas_entidad ON deudas (entidad, periodo);
+CREATE TABLE IF NOT EXISTS historicas (
+    cuit TEXT NOT NULL,
+    periodo TEXT NOT NULL,
+    entidad TEXT NOT NULL,
+    situacion INTEGER NOT NULL,
+    monto REAL NOT NULL,
+    en_revision INTEGER,
+    proceso_judicial INTEGER,
+    ingresado REAL NOT NULL,
+    PRIMARY KEY (cuit, periodo, entidad)
+);
+CREATE INDEX IF NOT EXISTS idx_historicas_periodo ON historicas (periodo, situacion);
+CREATE INDEX IF NOT EXISTS idx_historicas_entidad ON historicas (entidad, periodo);
+CREATE TABLE IF NOT EXISTS cheques (
+    cuit TEXT NOT NULL,
+    entidad TEXT NOT NULL,
+    nro_cheque TEXT NOT NULL,
+    causal TEXT,
+    fecha_rechazo TEXT,
+    monto REAL,
+    fecha_pago TEXT,
+    fecha_pago_multa TEXT,
+    estado_multa TEXT,
+    cuenta_personal INTEGER,
+    en_revision INTEGER,
+    proceso_judicial INTEGER,
+    ingresado REAL NOT NULL,
+    PRIMARY KEY (cuit, entidad, nro_cheque)
+);
+CREATE INDEX IF NOT EXISTS idx_cheques_entidad ON cheques (entidad);
+CREATE INDEX IF NOT EXISTS idx_cheques_fecha ON cheques (fecha_rechazo);
+"""
+
+# Tabla -> columnas de la tabla y las columnas del DataFrame de procesar_* de las que salen
+COLUMNAS_TABLAS = {
+    'deudas': {
+        'periodo': 'Período',
+        'entidad': 'Entidad',
+        'denominacion': 'Denominación',
+        'situacion': 'Situación',
+        'fecha_sit1': 'Fecha Situación 1',
+        'monto': 'Monto',
+        'dias_atraso': 'Días Atraso Pago',
+        'refinanciaciones': 'Refinanciaciones',
+        'recategorizacion_obligatoria': 'Recategorización Obligatoria',
+        'situacion_juridica': 'Situación Jurídica',
+        'irrecuperable_disposicion_tecnica': 'Irrecup. por Disposición Técnica',
+        'en_revision': 'En Revisión',
+        'proceso_judicial': 'Proceso Judicial'
+    },
+    'historicas': {
+        'periodo': 'Período',
+        'entidad': 'Entidad',
+        'situacion': 'Situación',
+        'monto': 'Monto',
+        'en_revision': 'En Revisión',
+        'proceso_judicial': 'Proceso Judicial'
+    },
+    'cheques': {
+        'entidad': 'Entidad',
+        'nro_cheque': 'Número Cheque',
+        'causal': 'Causal',
+        'fecha_rechazo': 'Fecha Rechazo',
+        'monto': 'Monto',
+        'fecha_pago': 'Fecha Pago',
+        'fecha_pago_multa': 'Fecha Pago Multa',
+        'estado_multa': 'Estado Multa',
+        'cuenta_personal': 'Cuenta Personal',
+        'en_revision': 'En Revisión',
+        'proceso_judicial': 'Proceso Judicial'
+    }
+}
+
+
+def conectar(ruta=None):
+    """
+    Abre el almacén (creándolo si no existe) en modo WAL, apto para varios procesos
+    """
+    ruta = ruta or RUTA_ALMACEN
+    os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+    conexion = sqlite3.connect(ruta, timeout=30, isolation_level=None)
+    conexion.execute("PRAGMA journal_mode=WAL")
+    conexion.execute("PRAGMA synchronous=NORMAL")
+    conexion.executescript(ESQUEMA)
+    return conexion
+
+
+def _filas_tabla(tabla, cuit, df, ingresado):
+    """
+    Convierte un DataFrame de procesar_* en tuplas para la tabla, con el CUIT como texto
+    """
+    columnas = COLUMNAS_TABLAS[tabla]
+    valores = []
+    for columna in columnas.values():
+        serie = df[columna] if columna in df.columns else pd.Series([None] * len(df), index=df.index)
+        # bool de numpy/pandas no se adapta solo a SQLite
+        valores.append(serie.astype(object).where(serie.notna(), None).map(
+            lambda valor: int(valor) if isinstance(valor, bool) else valor
+        ).tolist())
+    return [(cuit, *fila, ingresado) for fila in zip(*valores)]
+
+
+class Almacen:
+    """
+    Acumula las tablas de cada CUIT y las escribe por lotes. Cada CUIT reemplaza lo que ya había
+    guardado para los mismos períodos (deudas e históricas) o para todos sus cheques; una tabla de
+    cheques vacía borra los que tenía.
+    """
+
+    def __init__(self, ruta=None, filas_por_lote=FILAS_POR_LOTE):
+        self.ruta = ruta
+        self.filas_por_lote = filas_por_lote
+        self._pendientes = []
+        self._filas = 0
+        self._lock = threading.Lock()
+        self._escritura = threading.Lock()
+
+    def recibir(self, cuit, df_deudas, df_historico, df_cheques):
+        """
+        Receptor de utils.resumir_cuit: recibe las tablas de un CUIT (vacías si el endpoint respondió
+        sin datos, None si no se consultó o falló)
+        """
+        ingresado = time.time()
+        tablas = {}
+        for tabla, df in (('deudas', df_deudas), ('historicas', df_historico), ('cheques', df_cheques)):
+            if df is not None and not df.empty:
+                tablas[tabla] = _filas_tabla(tabla, cuit, df, ingresado)
+        # Los cheques se reemplazan por CUIT: sin cheques informados se borran los que había
+        if df_cheques is not None and df_cheques.empty:
+            tablas['cheques'] = []
+        if not tablas:
+            return
+
+        with self._lock:
+            self._pendientes.append((cuit, tablas))
+            self._filas += sum(len(filas) for filas in tablas.values())
+            completo = self._filas >= self.filas_por_lote
+        if completo:
+            self.volcar()
+
+    def volcar(self):
+        """
+        Escribe lo acumulado en una sola transacción
+        """
+        with self._lock:
+            pendientes, self._pendientes, self._filas = self._pendientes, [], 0
+        if not pendientes:
+            return 0
+
+        with self._escritura:
+            conexion = conectar(self.ruta)
+            try:
+                conexion.execute("BEGIN IMMEDIATE")
+                for cuit, tablas in pendientes:
+                    for tabla, filas in tablas.items():
+                        if tabla == 'cheques':
+                            conexion.execute("DELETE FROM cheques WHERE cuit = ?", (cuit,))
+                        else:
+                            conexion.executemany(
+                                f"DELETE FROM {tabla} WHERE cuit = ? AND periodo = ?",
+                                {(cuit, fila[1]) for fila in filas}
+                            )
+                        marcadores = ", ".join("?" for _ in range(len(COLUMNAS_TABLAS[tabla]) + 2))
+                        conexion.executemany(
+                            f"INSERT OR REPLACE INTO {tabla} (cuit, {', '.join(COLUMNAS_TABLAS[tabla])}, ingresado) "
+                            f"VALUES ({marcadores})",
+                            filas
+                        )
+                conexion.execute("COMMIT")
+            except Exception:
+                conexion.execute("ROLLBACK")
+                raise
+            finally:
+                conexion.close()
+        return len(pendientes)
+
+
+ALMACEN = Almacen()
+
+
+def consultar(sql, parametros=(), ruta=None):
+    """
+    Ejecuta una consulta de solo lectura sobre el almacén y devuelve un DataFrame
+    """
+    conexion = conectar(ruta)
+    try:
+        conexion.execute("PRAGMA query_only = ON")
+        return pd.read_sql_query(sql, conexion, params=parametros)
+    finally:
+        conexion.close()
+
+
+def _filtro_cuits(cuits):
+    """
+    Condición SQL y parámetros para limitar una consulta a una cartera (sin filtro si cuits es None)
+    """
+    if cuits is None:
+        return "", ()
+    cuits = [str(cuit) for cuit in cuits]
+    return " AND cuit IN (SELECT value FROM json_each(?))", (json.dumps(cuits),)
+
+
+def ultimo_periodo(ruta=None):
+    """
+    Período más reciente con deudas guardadas, o None si el almacén está vacío
+    """
+    return consultar("SELECT MAX(periodo) AS periodo FROM deudas", ruta=ruta)['periodo'].iloc[0]
+
+
+def exposicion_por_entidad(situacion_minima=3, periodo=None, cuits=None, ruta=None):
+    """
+    Deudores y monto total por entidad en situación situacion_minima o peor, en un período
+    (por defecto el último), opcionalmente limitado a una cartera
+    """
+    periodo = periodo or ultimo_periodo(ruta)
+    filtro, parametros = _filtro_cuits(cuits)
+    return consultar(
+        "SELECT entidad AS 'Entidad', COUNT(DISTINCT cuit) AS 'Deudores', SUM(monto) AS 'Monto (miles $)' "
+        f"FROM deudas WHERE periodo = ? AND situacion >= ?{filtro} "
+        "GROUP BY entidad ORDER BY SUM(monto) DESC",
+        (periodo, situacion_minima, *parametros), ruta
+    )
+
+
+def exposicion_por_situacion(periodo=None, cuits=None, ruta=None):
+    """
+    Deudores y monto total por situación en un período (por defecto el último)
+    """
+    periodo = periodo or ultimo_periodo(ruta)
+    filtro, parametros = _filtro_cuits(cuits)
+    return consultar(
+        "SELECT situacion AS 'Situación', COUNT(DISTINCT cuit) AS 'Deudores', SUM(monto) AS 'Monto (miles $)' "
+        f"FROM deudas WHERE periodo = ?{filtro} GROUP BY situacion ORDER BY situacion",
+        (periodo, *parametros), ruta
+    )
+
+
+def evolucion_por_situacion(cuits=None, ruta=None):
+    """
+    Monto total por período y situación a partir de las deudas históricas
+    """
+    filtro, parametros = _filtro_cuits(cuits)
+    return consultar(
+        "SELECT periodo AS 'Período', situacion AS 'Situación', SUM(monto) AS 'Monto (miles $)' "
+        f"FROM historicas WHERE 1 = 1{filtro} GROUP BY periodo, situacion ORDER BY periodo, situacion",
+        parametros, ruta
+    )
+
+
+def cheques_por_entidad(cuits=None, ruta=None):
+    """
+    Cheques rechazados, librador y monto total por entidad
+    """
+    filtro, parametros = _filtro_cuits(cuits)
+    return consultar(
+        "SELECT entidad AS 'Entidad', COUNT(*) AS 'Cheques', COUNT(DISTINCT cuit) AS 'Libradores', "
+        f"SUM(monto) AS 'Monto' FROM cheques WHERE 1 = 1{filtro} GROUP BY entidad ORDER BY COUNT(*) DESC",
+        parametros, ruta
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subcomandos = parser.add_subparsers(dest='comando', required=True)
+
+    exposicion = subcomandos.add_parser('exposicion', help="Exposición por entidad en el último período")
+    exposicion.add_argument('--situacion-minima', type=int, default=3)
+    exposicion.add_argument('--periodo', help="Período AAAAMM (por defecto el último)")
+
+    sql = subcomandos.add_parser('sql', help="Ejecutar una consulta SQL de solo lectura")
+    sql.add_argument('consulta')
+
+    args = parser.parse_args()
+
+    if args.comando == 'exposicion':
+        print(exposicion_por_entidad(args.situacion_minima, args.periodo).to_string(index=False))
+    elif args.comando == 'sql':
+        print(consultar(args.consulta).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
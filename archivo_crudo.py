@@ -0,0 +1,333 @@
+"""
+Archivo de las respuestas crudas de la API, comprimidas y guardadas por contenido.
+
+Con BCRA_ARCHIVO_CRUDO=1, cada respuesta 200 o 404 que llega de la API (no las que salen de la
+caché) se guarda tal como la devolvió el BCRA. El cuerpo se comprime (zstd si está instalado el
+paquete zstandard, si no zlib) y se guarda en datos/archivo_crudo/objetos/ con el hash de su
+contenido como nombre, así que una respuesta idéntica a una anterior no ocupa lugar de nuevo. Un
+índice SQLite registra cada consulta: (cuit, endpoint, obtenido) -> hash.
+
+Con el archivo se pueden volver a interpretar y resumir los CUITs sin consultar la API, por ejemplo
+para reconstruir el almacén local o probar un cambio en el resumen:
+
+    python archivo_crudo.py estadisticas
+    python archivo_crudo.py mostrar 20123456789 --endpoint historicas
+    python archivo_crudo.py reprocesar --salida informe.csv --hasta 2025-06-30
+"""
+import argparse
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime
+
+import pandas as pd
+
+import utils
+from cache_global import ENDPOINTS_CACHEABLES
+from utils import hash_cuerpo
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DIRECTORIO_ARCHIVO = os.path.join(utils.DIRECTORIO_DATOS, "archivo_crudo")
+
+# Compresión de los objetos nuevos y extensión de archivo de cada una
+COMPRESION = "zstd" if zstandard is not None else "zlib"
+EXTENSIONES = {"zstd": ".zst", "zlib": ".zz"}
+NIVEL_ZSTD = 10
+NIVEL_ZLIB = 6
+
+# Consultas acumuladas a partir de las cuales se escribe el índice sin esperar al final del lote
+FILAS_POR_LOTE = 5000
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS objetos (
+    hash TEXT PRIMARY KEY,
+    compresion TEXT NOT NULL,
+    bytes INTEGER NOT NULL,
+    bytes_comprimidos INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS respuestas (
+    cuit TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    obtenido REAL NOT NULL,
+    estado INTEGER NOT NULL,
+    hash TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_respuestas_cuit ON respuestas (cuit, endpoint, obtenido);
+CREATE INDEX IF NOT EXISTS idx_respuestas_obtenido ON respuestas (obtenido);
+"""
+
+
+def comprimir(cuerpo, compresion=COMPRESION):
+    """
+    Comprime el cuerpo de una respuesta
+    """
+    if compresion == "zstd":
+        return zstandard.ZstdCompressor(level=NIVEL_ZSTD).compress(cuerpo)
+    return zlib.compress(cuerpo, NIVEL_ZLIB)
+
+
+def descomprimir(datos, compresion):
+    """
+    Recupera el cuerpo original de un objeto del archivo
+    """
+    if compresion == "zstd":
+        if zstandard is None:
+            raise RuntimeError("El objeto está comprimido con zstd: instale el paquete zstandard para leerlo")
+        return zstandard.ZstdDecompressor().decompress(datos)
+    return zlib.decompress(datos)
+
+
+def conectar(directorio=None):
+    """
+    Abre el índice del archivo (creándolo si no existe) en modo WAL, apto para varios procesos
+    """
+    directorio = directorio or DIRECTORIO_ARCHIVO
+    os.makedirs(directorio, exist_ok=True)
+    conexion = sqlite3.connect(os.path.join(directorio, "indice.sqlite"), timeout=30, isolation_level=None)
+    conexion.execute("PRAGMA journal_mode=WAL")
+    conexion.execute("PRAGMA synchronous=NORMAL")
+    conexion.executescript(ESQUEMA)
+    return conexion
+
+
+class ArchivoCrudo:
+    """
+    Guarda los objetos apenas llegan (una sola vez por contenido) y acumula las filas del índice
+    para escribirlas por lotes
+    """
+
+    def __init__(self, directorio=None, filas_por_lote=FILAS_POR_LOTE):
+        self.directorio = directorio or DIRECTORIO_ARCHIVO
+        self.filas_por_lote = filas_por_lote
+        self._respuestas = []
+        self._objetos = []
+        self._lock = threading.Lock()
+        self._escritura = threading.Lock()
+
+    def _ruta_objeto(self, hash_objeto, compresion):
+        """
+        Archivo de un objeto: objetos/<dos primeros caracteres del hash>/<hash>.<extensión>
+        """
+        return os.path.join(self.directorio, "objetos", hash_objeto[:2], hash_objeto + EXTENSIONES[compresion])
+
+    def buscar_objeto(self, hash_objeto):
+        """
+        (ruta, compresion) del objeto guardado con ese hash, o None si no está
+        """
+        for compresion in EXTENSIONES:
+            ruta = self._ruta_objeto(hash_objeto, compresion)
+            if os.path.exists(ruta):
+                return ruta, compresion
+        return None
+
+    def guardar(self, endpoint, cuit, estado, cuerpo, obtenido=None):
+        """
+        Archiva una respuesta recién descargada y devuelve su hash
+        """
+        cuerpo = cuerpo or b""
+        hash_objeto = hash_cuerpo(cuerpo)
+        if self.buscar_objeto(hash_objeto) is None:
+            datos = comprimir(cuerpo)
+            ruta = self._ruta_objeto(hash_objeto, COMPRESION)
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temporal, "wb") as archivo:
+                archivo.write(datos)
+            os.replace(temporal, ruta)
+            objeto = (hash_objeto, COMPRESION, len(cuerpo), len(datos))
+        else:
+            objeto = None
+
+        with self._lock:
+            self._respuestas.append((str(cuit), endpoint, obtenido or time.time(), int(estado), hash_objeto))
+            if objeto:
+                self._objetos.append(objeto)
+            completo = len(self._respuestas) >= self.filas_por_lote
+        if completo:
+            self.volcar()
+        return hash_objeto
+
+    def volcar(self):
+        """
+        Escribe en el índice las consultas acumuladas, en una sola transacción
+        """
+        with self._lock:
+            respuestas, self._respuestas = self._respuestas, []
+            objetos, self._objetos = self._objetos, []
+        if not respuestas:
+            return 0
+
+        with self._escritura:
+            conexion = conectar(self.directorio)
+            try:
+                conexion.execute("BEGIN IMMEDIATE")
+                conexion.executemany("INSERT OR IGNORE INTO objetos VALUES (?, ?, ?, ?)", objetos)
+                conexion.executemany("INSERT INTO respuestas VALUES (?, ?, ?, ?, ?)", respuestas)
+                conexion.execute("COMMIT")
+            except Exception:
+                conexion.execute("ROLLBACK")
+                raise
+            finally:
+                conexion.close()
+        return len(respuestas)
+
+    def leer(self, hash_objeto):
+        """
+        Cuerpo original de la respuesta con ese hash
+        """
+        encontrado = self.buscar_objeto(hash_objeto)
+        if encontrado is None:
+            raise KeyError(f"No está en el archivo el objeto {hash_objeto}")
+        ruta, compresion = encontrado
+        with open(ruta, "rb") as archivo:
+            return descomprimir(archivo.read(), compresion)
+
+
+ARCHIVO_CRUDO = ArchivoCrudo()
+
+# Las consultas que quedaron sin escribir al terminar el proceso se escriben igual
+atexit.register(ARCHIVO_CRUDO.volcar)
+
+
+def consultar(sql, parametros=(), directorio=None):
+    """
+    Ejecuta una consulta de solo lectura sobre el índice y devuelve un DataFrame
+    """
+    conexion = conectar(directorio)
+    try:
+        conexion.execute("PRAGMA query_only = ON")
+        return pd.read_sql_query(sql, conexion, params=parametros)
+    finally:
+        conexion.close()
+
+
+def ultimas_respuestas(cuits=None, hasta=None, directorio=None):
+    """
+    Última respuesta archivada de cada CUIT y endpoint (obtenida hasta el instante indicado, en
+    segundos desde epoch)
+    """
+    condiciones, parametros = ["obtenido <= ?"], [hasta if hasta is not None else time.time()]
+    if cuits is not None:
+        condiciones.append("cuit IN (SELECT value FROM json_each(?))")
+        parametros.append(json.dumps([str(cuit) for cuit in cuits]))
+    # Con MAX(), SQLite devuelve las demás columnas de la fila que tiene el máximo
+    return consultar(
+        "SELECT cuit, endpoint, estado, hash, MAX(obtenido) AS obtenido FROM respuestas "
+        f"WHERE {' AND '.join(condiciones)} GROUP BY cuit, endpoint",
+        parametros, directorio
+    )
+
+
+def respuesta_archivada(cuit, endpoint, hasta=None, archivo=None):
+    """
+    (estado, datos, obtenido) de la última respuesta archivada de un CUIT y endpoint, o None.
+    datos es el JSON interpretado si el estado fue 200.
+    """
+    archivo = archivo or ARCHIVO_CRUDO
+    df = ultimas_respuestas([cuit], hasta, archivo.directorio)
+    df = df[df['endpoint'] == endpoint]
+    if df.empty:
+        return None
+    fila = df.iloc[0]
+    datos = json.loads(archivo.leer(fila['hash'])) if fila['estado'] == 200 else None
+    return int(fila['estado']), datos, float(fila['obtenido'])
+
+
+def reprocesar(cuits=None, hasta=None, archivo=None):
+    """
+    Vuelve a interpretar y resumir los CUITs con sus últimas respuestas archivadas, sin consultar
+    la API. Las tablas de cada CUIT pasan por los receptores de utils (almacén, matriz), así que
+    también sirve para reconstruirlos. Devuelve el informe resumido.
+    """
+    archivo = archivo or ARCHIVO_CRUDO
+    df = ultimas_respuestas(cuits, hasta, archivo.directorio)
+    respuestas = {}
+    for fila in df.itertuples(index=False):
+        # Un 404 se resume como respuesta sin datos; cualquier otro error, como consulta fallida
+        datos = json.loads(archivo.leer(fila.hash)) if fila.estado == 200 else {} if fila.estado == 404 else None
+        respuestas.setdefault(fila.cuit, {})[fila.endpoint] = datos
+
+    orden = [str(cuit) for cuit in cuits] if cuits is not None else sorted(respuestas)
+    resultados = [
+        utils.resumir_cuit(cuit, respuestas[cuit].get('deudas'), respuestas[cuit].get('historicas'),
+                           respuestas[cuit].get('cheques'))
+        for cuit in orden if cuit in respuestas
+    ]
+    utils.volcar_datos_locales()
+    if not resultados:
+        return pd.DataFrame(columns=list(utils.TIPOS_RESULTADOS)).astype(utils.TIPOS_RESULTADOS)
+    return pd.DataFrame(resultados).astype(utils.TIPOS_RESULTADOS)
+
+
+def estadisticas(directorio=None):
+    """
+    Consultas archivadas, objetos distintos y tamaño original y comprimido
+    """
+    consultas = consultar("SELECT COUNT(*) AS n, COUNT(DISTINCT cuit) AS cuits FROM respuestas", directorio=directorio)
+    objetos = consultar(
+        "SELECT COUNT(*) AS n, COALESCE(SUM(bytes), 0) AS bytes, COALESCE(SUM(bytes_comprimidos), 0) AS comprimidos "
+        "FROM objetos", directorio=directorio
+    )
+    return {
+        'consultas': int(consultas['n'].iloc[0]),
+        'cuits': int(consultas['cuits'].iloc[0]),
+        'objetos': int(objetos['n'].iloc[0]),
+        'mb_originales': float(objetos['bytes'].iloc[0]) / 1e6,
+        'mb_comprimidos': float(objetos['comprimidos'].iloc[0]) / 1e6
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subcomandos = parser.add_subparsers(dest='comando', required=True)
+
+    subcomandos.add_parser('estadisticas', help="Tamaño del archivo y consultas guardadas")
+
+    mostrar = subcomandos.add_parser('mostrar', help="Última respuesta archivada de un CUIT")
+    mostrar.add_argument('cuit')
+    mostrar.add_argument('--endpoint', choices=list(ENDPOINTS_CACHEABLES), default='deudas')
+
+    reproceso = subcomandos.add_parser('reprocesar', help="Resume los CUITs archivados sin consultar la API")
+    reproceso.add_argument('--archivo', help="CSV o Excel con una columna 'CUIT' (por defecto, todos)")
+    reproceso.add_argument('--hasta', help="Usar las respuestas obtenidas hasta esta fecha (AAAA-MM-DD)")
+    reproceso.add_argument('--salida', help="Archivo CSV con el informe resumido")
+    args = parser.parse_args()
+
+    if args.comando == 'estadisticas':
+        for clave, valor in estadisticas().items():
+            print(f"{clave}: {valor:,.2f}" if isinstance(valor, float) else f"{clave}: {valor}")
+        return
+
+    if args.comando == 'mostrar':
+        respuesta = respuesta_archivada(args.cuit, args.endpoint)
+        if respuesta is None:
+            print("No hay respuestas archivadas para ese CUIT y endpoint.")
+            return
+        estado, datos, obtenido = respuesta
+        print(f"Estado {estado}, obtenida el {datetime.fromtimestamp(obtenido):%d/%m/%Y %H:%M:%S}")
+        print(json.dumps(datos, ensure_ascii=False, indent=2))
+        return
+
+    cuits = None
+    if args.archivo:
+        df_cuits = pd.read_csv(args.archivo) if args.archivo.endswith('.csv') else pd.read_excel(args.archivo)
+        cuits, _ = utils.separar_cuits(','.join(df_cuits['CUIT'].astype(str).tolist()))
+    # Hasta el final del día indicado
+    hasta = datetime.strptime(args.hasta, "%Y-%m-%d").timestamp() + 86400 if args.hasta else None
+    df_resultados = reprocesar(cuits, hasta)
+    if args.salida:
+        utils.formatear_resultados(df_resultados).to_csv(args.salida, index=False)
+    else:
+        print(utils.formatear_resultados(df_resultados).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
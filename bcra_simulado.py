@@ -0,0 +1,358 @@
+"""
+Servidor local que simula la API de Central de Deudores del BCRA.
+
+Sirve los endpoints Deudas, Deudas/Historicas y Deudas/ChequesRechazados con la misma
+forma de JSON que la API real, usando datos sintéticos deterministas por CUIT y de tamaño
+configurable. Permite inyectar latencia, errores 400/404/429/5xx y timeouts para hacer
+benchmarks y reproducir corridas lentas sin consultar api.bcra.gob.ar.
+
+Uso:
+    python bcra_simulado.py --puerto 8080 --latencia-ms 50 --tasa-429 0.02
+    BCRA_API_URL=http://localhost:8080/centraldedeudores/v1.0 streamlit run app.py
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Prefijo de los endpoints, igual al de la API real
+PREFIJO_API = "/centraldedeudores/v1.0"
+
+# Configuración por defecto del simulador
+CONFIGURACION_POR_DEFECTO = {
+    'semilla': 0,
+    'entidades': 3,               # Máximo de entidades por CUIT
+    'periodos_historicos': 24,    # Cantidad de períodos en Deudas/Historicas
+    'periodo_actual': None,       # YYYYMM; por defecto el mes anterior
+    'prob_sin_datos': 0.05,       # Fracción de CUITs sin datos (404 en todos los endpoints)
+    'prob_cheques': 0.1,          # Fracción de CUITs con cheques rechazados
+    'cheques': 3,                 # Máximo de cheques rechazados por CUIT
+    'prob_irregular': 0.15,       # Probabilidad de que una entidad informe situación > 1
+    'latencia_ms': 0.0,           # Latencia base por respuesta
+    'jitter_ms': 0.0,             # Variación aleatoria uniforme sobre la latencia base
+    'tasa_400': 0.0,              # Fracción de respuestas 400 para CUITs válidos
+    'tasa_429': 0.0,              # Fracción de respuestas 429 (con Retry-After)
+    'tasa_5xx': 0.0,              # Fracción de respuestas 500/502/503
+    'tasa_timeout': 0.0,          # Fracción de solicitudes que se demoran demora_timeout_s
+    'demora_timeout_s': 60.0
+}
+
+ENTIDADES_SIMULADAS = [
+    "BANCO DE LA NACION ARGENTINA", "BANCO DE GALICIA Y BUENOS AIRES S.A.U.",
+    "BANCO SANTANDER ARGENTINA S.A.", "BANCO MACRO S.A.", "BBVA ARGENTINA S.A.",
+    "BANCO DE LA PROVINCIA DE BUENOS AIRES", "BANCO CREDICOOP COOPERATIVO LIMITADO",
+    "INDUSTRIAL AND COMMERCIAL BANK OF CHINA (ARGENTINA) S.A.U.", "BANCO PATAGONIA S.A.",
+    "BANCO HIPOTECARIO S.A.", "TARJETA NARANJA S.A.U.", "BANCO SUPERVIELLE S.A."
+]
+
+CAUSALES_SIMULADAS = ["SIN FONDOS SUFICIENTES DISPONIBLES EN CUENTA", "DEFECTOS FORMALES"]
+
+RUTA_ENDPOINT = re.compile(r'/Deudas/(?:(Historicas|ChequesRechazados)/)?([^/?]+)/?$')
+
+
+def _periodo_anterior(periodo, meses):
+    """
+    Resta meses a un período YYYYMM
+    """
+    anio, mes = int(periodo[:4]), int(periodo[4:])
+    total = anio * 12 + (mes - 1) - meses
+    return f"{total // 12:04d}{total % 12 + 1:02d}"
+
+
+def _periodo_actual(configuracion):
+    if configuracion['periodo_actual']:
+        return str(configuracion['periodo_actual'])
+    hoy = date.today()
+    return _periodo_anterior(f"{hoy.year:04d}{hoy.month:02d}", 1)
+
+
+def _generador_cuit(cuit, configuracion):
+    """
+    Generador aleatorio determinista para un CUIT, para que las respuestas sean estables entre consultas
+    """
+    return random.Random(f"{configuracion['semilla']}:{cuit}")
+
+
+def _sin_datos(cuit, configuracion):
+    return _generador_cuit(cuit, configuracion).random() < configuracion['prob_sin_datos']
+
+
+def _entidades_cuit(rng, configuracion):
+    cantidad = rng.randint(1, max(1, configuracion['entidades']))
+    if cantidad <= len(ENTIDADES_SIMULADAS):
+        return rng.sample(ENTIDADES_SIMULADAS, cantidad)
+    return [f"ENTIDAD SIMULADA {i:04d}" for i in rng.sample(range(10000), cantidad)]
+
+
+def _perfil_entidades(cuit, configuracion):
+    """
+    Perfil estable de las entidades de un CUIT: situación actual, monto base y hace cuántos
+    meses empezó la situación irregular, para que Deudas e Historicas sean coherentes entre sí
+    """
+    rng = _generador_cuit(cuit, configuracion)
+    rng.random()
+
+    perfil = []
+    for entidad in _entidades_cuit(rng, configuracion):
+        irregular = rng.random() < configuracion['prob_irregular']
+        perfil.append({
+            'entidad': entidad,
+            'situacion': rng.choice([2, 3, 4, 5, 6]) if irregular else 1,
+            'monto': round(rng.uniform(1, 5000), 1),
+            'meses_irregular': rng.randint(1, max(1, configuracion['periodos_historicos'])) if irregular else 0
+        })
+    return perfil, rng
+
+
+def generar_deudas(cuit, configuracion):
+    """
+    Payload sintético de Deudas/{cuit}
+    """
+    perfil, rng = _perfil_entidades(cuit, configuracion)
+
+    entidades = []
+    for datos in perfil:
+        situacion = datos['situacion']
+        entidades.append({
+            'entidad': datos['entidad'],
+            'situacion': situacion,
+            'fechaSit1': f"20{rng.randint(10, 24)}-{rng.randint(1, 12):02d}-01",
+            'monto': datos['monto'],
+            'diasAtrasoPago': 0 if situacion == 1 else rng.randint(31, 720),
+            'refinanciaciones': rng.random() < 0.05,
+            'recategorizacionOblig': False,
+            'situacionJuridica': situacion >= 5 and rng.random() < 0.3,
+            'irrecDisposicionTecnica': situacion == 6,
+            'enRevision': False,
+            'procesoJud': situacion >= 4 and rng.random() < 0.2
+        })
+    return {
+        'status': 200,
+        'results': {
+            'identificacion': int(cuit),
+            'denominacion': f"DEUDOR SIMULADO {cuit}",
+            'periodos': [{'periodo': _periodo_actual(configuracion), 'entidades': entidades}]
+        }
+    }
+
+
+def generar_historicas(cuit, configuracion):
+    """
+    Payload sintético de Deudas/Historicas/{cuit}
+    """
+    perfil, rng = _perfil_entidades(cuit, configuracion)
+    actual = _periodo_actual(configuracion)
+
+    periodos = []
+    for meses in range(configuracion['periodos_historicos']):
+        periodos.append({
+            'periodo': _periodo_anterior(actual, meses),
+            'entidades': [
+                {
+                    'entidad': datos['entidad'],
+                    'situacion': datos['situacion'] if meses < datos['meses_irregular'] else 1,
+                    'monto': round(datos['monto'] * rng.uniform(0.8, 1.2), 1),
+                    'enRevision': False,
+                    'procesoJud': False
+                }
+                for datos in perfil
+            ]
+        })
+    return {
+        'status': 200,
+        'results': {
+            'identificacion': int(cuit),
+            'denominacion': f"DEUDOR SIMULADO {cuit}",
+            'periodos': periodos
+        }
+    }
+
+
+def generar_cheques(cuit, configuracion):
+    """
+    Payload sintético de Deudas/ChequesRechazados/{cuit}, o None si el CUIT no tiene cheques
+    """
+    rng = _generador_cuit(f"cheques:{cuit}", configuracion)
+    if rng.random() >= configuracion['prob_cheques']:
+        return None
+
+    detalle = []
+    for _ in range(rng.randint(1, max(1, configuracion['cheques']))):
+        pagado = rng.random() < 0.5
+        detalle.append({
+            'nroCheque': rng.randint(10000000, 99999999),
+            'fechaRechazo': f"20{rng.randint(18, 24)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            'monto': round(rng.uniform(1000, 500000), 2),
+            'fechaPago': f"2024-{rng.randint(1, 12):02d}-15" if pagado else None,
+            'fechaPagoMulta': None,
+            'estadoMulta': rng.choice(["IMPAGA", "PAGADA", None]),
+            'ctaPersonal': rng.random() < 0.7,
+            'denomJuridica': None,
+            'enRevision': False,
+            'procesoJud': False
+        })
+    return {
+        'status': 200,
+        'results': {
+            'identificacion': int(cuit),
+            'denominacion': f"DEUDOR SIMULADO {cuit}",
+            'causales': [{
+                'causal': rng.choice(CAUSALES_SIMULADAS),
+                'entidades': [{'entidad': rng.choice([7, 11, 14, 17, 72, 285]), 'detalle': detalle}]
+            }]
+        }
+    }
+
+
+class ManejadorBCRA(BaseHTTPRequestHandler):
+    """
+    Atiende las solicitudes GET con la misma forma de respuesta que la API del BCRA
+    """
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _responder(self, estado, cuerpo, encabezados=None):
+        datos = json.dumps(cuerpo, ensure_ascii=False).encode('utf-8')
+        self.send_response(estado)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(datos)))
+        for nombre, valor in (encabezados or {}).items():
+            self.send_header(nombre, valor)
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def _error(self, estado, mensaje, encabezados=None):
+        self._responder(estado, {'status': estado, 'errorMessages': [mensaje]}, encabezados)
+
+    def do_GET(self):
+        configuracion = self.server.configuracion
+        rng = self.server.aleatorio()
+
+        # Latencia inyectada
+        demora = configuracion['latencia_ms'] + rng.uniform(0, configuracion['jitter_ms'])
+        if demora > 0:
+            time.sleep(demora / 1000)
+
+        coincidencia = RUTA_ENDPOINT.search(self.path)
+        if not coincidencia:
+            self._error(404, "Recurso inexistente.")
+            return
+
+        endpoint, cuit = coincidencia.group(1) or "Deudas", coincidencia.group(2)
+
+        if not re.match(r'^\d{11}$', cuit):
+            self._error(400, "Parámetro erróneo: la identificación debe tener 11 dígitos.")
+            return
+
+        # Fallas inyectadas
+        sorteo = rng.random()
+        if sorteo < configuracion['tasa_timeout']:
+            time.sleep(configuracion['demora_timeout_s'])
+            self._error(504, "Tiempo de espera agotado.")
+            return
+        sorteo -= configuracion['tasa_timeout']
+        if sorteo < configuracion['tasa_429']:
+            self._error(429, "Demasiadas solicitudes.", {"Retry-After": "1"})
+            return
+        sorteo -= configuracion['tasa_429']
+        if sorteo < configuracion['tasa_5xx']:
+            self._error(rng.choice([500, 502, 503]), "Error interno del servidor.")
+            return
+        sorteo -= configuracion['tasa_5xx']
+        if sorteo < configuracion['tasa_400']:
+            self._error(400, "Parámetro erróneo.")
+            return
+
+        if _sin_datos(cuit, configuracion):
+            self._error(404, "No se encontró datos para la identificación ingresada.")
+            return
+
+        if endpoint == "Historicas":
+            cuerpo = generar_historicas(cuit, configuracion)
+        elif endpoint == "ChequesRechazados":
+            cuerpo = generar_cheques(cuit, configuracion)
+        else:
+            cuerpo = generar_deudas(cuit, configuracion)
+
+        if cuerpo is None:
+            self._error(404, "No se encontró datos para la identificación ingresada.")
+            return
+
+        self._responder(200, cuerpo)
+
+
+class ServidorBCRA(ThreadingHTTPServer):
+    """
+    Servidor HTTP multihilo con la configuración del simulador
+    """
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, direccion, configuracion, verbose=False):
+        super().__init__(direccion, ManejadorBCRA)
+        self.configuracion = configuracion
+        self.verbose = verbose
+        self._semilla_local = threading.local()
+
+    def aleatorio(self):
+        """
+        Generador aleatorio por hilo para latencias y fallas inyectadas
+        """
+        if not hasattr(self._semilla_local, 'rng'):
+            self._semilla_local.rng = random.Random()
+        return self._semilla_local.rng
+
+    @property
+    def url_base(self):
+        host, puerto = self.server_address[:2]
+        return f"http://{host}:{puerto}{PREFIJO_API}"
+
+
+def iniciar_servidor(host="127.0.0.1", puerto=0, verbose=False, **configuracion):
+    """
+    Inicia el simulador en un hilo en segundo plano y devuelve el servidor.
+    Con puerto=0 se elige un puerto libre; la URL base queda en servidor.url_base.
+    Para detenerlo: servidor.shutdown()
+    """
+    config = dict(CONFIGURACION_POR_DEFECTO)
+    desconocidas = set(configuracion) - set(config)
+    if desconocidas:
+        raise ValueError(f"Opciones de simulador desconocidas: {', '.join(sorted(desconocidas))}")
+    config.update(configuracion)
+
+    servidor = ServidorBCRA((host, puerto), config, verbose)
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+    return servidor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--puerto', type=int, default=8080)
+    parser.add_argument('--verbose', action='store_true', help="Registrar cada solicitud")
+    for opcion, valor in CONFIGURACION_POR_DEFECTO.items():
+        tipo = str if opcion == 'periodo_actual' else type(valor)
+        parser.add_argument(f"--{opcion.replace('_', '-')}", type=tipo, default=valor)
+    args = parser.parse_args()
+
+    configuracion = {opcion: getattr(args, opcion) for opcion in CONFIGURACION_POR_DEFECTO}
+    servidor = ServidorBCRA((args.host, args.puerto), dict(CONFIGURACION_POR_DEFECTO, **configuracion), args.verbose)
+    print(f"Simulador de la API del BCRA escuchando en {servidor.url_base}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+Micro-benchmark de construcción de los gráficos de deudas actuales.
+
+Compara la construcción anterior (una traza por fila / una máscara por situación)
+con la construcción vectorizada de graficos.py, midiendo tiempo de armado y tamaño
+del JSON que se envía al navegador, según la cantidad de entidades del deudor.
+
+Uso:
+    python benchmarks/bench_graficos.py
+    python benchmarks/bench_graficos.py --entidades 10 100 1000 --repeticiones 20
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils import SITUACION_COLORS, SITUACION_MAP
+from graficos import figura_deuda_por_situacion, figura_deuda_por_entidad
+
+
+def generar_deudas(cantidad_entidades, semilla=0):
+    """
+    Genera deudas actuales sintéticas: una o dos situaciones por entidad
+    """
+    rng = np.random.default_rng(semilla)
+    filas = cantidad_entidades + cantidad_entidades // 3
+    return pd.DataFrame({
+        'Entidad': [f"ENTIDAD {i:05d}" for i in rng.integers(0, cantidad_entidades, filas)],
+        'Situación': rng.choice([1, 2, 3, 4, 5, 6], size=filas, p=[0.6, 0.15, 0.1, 0.07, 0.05, 0.03]),
+        'Monto': rng.gamma(2.0, 500.0, size=filas).round(1)
+    })
+
+
+def figura_situacion_por_bucle(df_situacion):
+    """
+    Construcción anterior: una traza go.Bar por fila
+    """
+    fig = go.Figure()
+    for idx, row in df_situacion.iterrows():
+        fig.add_trace(go.Bar(
+            x=[row['Descripción']],
+            y=[row['Monto']],
+            name=f"Situación {int(row['Situación'])}",
+            marker_color=SITUACION_COLORS[int(row['Situación'])]
+        ))
+    fig.update_layout(
+        title="Deuda por Situación Crediticia",
+        xaxis_title="Situación",
+        yaxis_title="Monto Total (miles de $)",
+        xaxis_tickangle=-45,
+        height=500,
+        barmode='group'
+    )
+    return fig
+
+
+def figura_entidad_por_bucle(df_deudas):
+    """
+    Construcción anterior: agregación por entidad y situación, y una máscara booleana por situación
+    """
+    df_entidad = df_deudas.groupby(['Entidad', 'Situación']).agg({'Monto': 'sum'}).reset_index()
+
+    fig = go.Figure()
+    for situacion in sorted(df_entidad['Situación'].unique()):
+        df_filtrado = df_entidad[df_entidad['Situación'] == situacion]
+        fig.add_trace(go.Bar(
+            x=df_filtrado['Entidad'],
+            y=df_filtrado['Monto'],
+            name=f"Situación {int(situacion)}: {SITUACION_MAP[int(situacion)]}",
+            marker_color=SITUACION_COLORS[int(situacion)]
+        ))
+    fig.update_layout(
+        title="Deuda por Entidad y Situación Crediticia",
+        xaxis_title="Entidad Financiera",
+        yaxis_title="Monto Total (miles de $)",
+        xaxis_tickangle=-45,
+        height=500,
+        barmode='stack',
+        legend_title="Situación Crediticia"
+    )
+    return fig
+
+
+def medir(constructor, datos, repeticiones):
+    """
+    Devuelve la mediana del tiempo de construcción (ms), la cantidad de trazas y el tamaño del JSON
+    """
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        fig = constructor(datos)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return {
+        'ms': round(statistics.median(tiempos), 3),
+        'trazas': len(fig.data),
+        'bytes_json': len(fig.to_json())
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entidades', type=int, nargs='+', default=[5, 20, 100, 500, 2000])
+    parser.add_argument('--repeticiones', type=int, default=10)
+    parser.add_argument('--salida', help="Ruta opcional para guardar los resultados en JSON")
+    args = parser.parse_args()
+
+    resultados = []
+    print(f"{'entidades':>10} {'gráfico':>10} {'versión':>11} {'ms':>10} {'trazas':>7} {'bytes JSON':>11}")
+
+    for cantidad in args.entidades:
+        df_deudas = generar_deudas(cantidad)
+
+        df_situacion = df_deudas.groupby('Situación').agg({'Monto': 'sum'}).reset_index()
+        df_situacion['Descripción'] = df_situacion['Situación'].map(SITUACION_MAP)
+        df_situacion = df_situacion.sort_values('Situación')
+
+        casos = [
+            ('situación', 'bucle', figura_situacion_por_bucle, df_situacion),
+            ('situación', 'vectorial', figura_deuda_por_situacion, df_situacion),
+            ('entidad', 'bucle', figura_entidad_por_bucle, df_deudas),
+            ('entidad', 'vectorial', figura_deuda_por_entidad, df_deudas),
+        ]
+        for grafico, version, constructor, datos in casos:
+            medicion = medir(constructor, datos, args.repeticiones)
+            medicion.update({'entidades': cantidad, 'grafico': grafico, 'version': version})
+            resultados.append(medicion)
+            print(f"{cantidad:>10} {grafico:>10} {version:>11} {medicion['ms']:>10.3f} "
+                  f"{medicion['trazas']:>7} {medicion['bytes_json']:>11}")
+
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as archivo:
+            json.dump(resultados, archivo, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
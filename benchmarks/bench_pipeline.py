@@ -0,0 +1,212 @@
+"""
+Benchmark de punta a punta de procesar_lista_cuits contra el servidor simulado de la API.
+
+Para cada combinación de tamaño de cartera y latencia simulada, corre procesar_lista_cuits
+en modo secuencial en un proceso nuevo (para medir el pico de memoria de forma aislada), con un
+directorio de datos temporal y sin snapshots, almacén, matriz ni archivo de respuestas, y reporta:
+
+- CUITs por segundo y tiempo total
+- latencia por CUIT (p50 / p95 / p99)
+- pico de memoria residente (RSS)
+- tiempo propio por etapa (marcadores de perfilado.py): red, parseo JSON, armado de
+  DataFrames (procesar_*), resumen, actualización de progreso de Streamlit y pausa
+
+Los resultados se guardan en JSON (con el commit de git) para comparar corridas:
+
+    python benchmarks/bench_pipeline.py
+    python benchmarks/bench_pipeline.py --tamanos 10 1000 --latencias-ms 0 20
+    python benchmarks/bench_pipeline.py --comparar benchmarks/resultados/pipeline_<commit>_<fecha>.json
+
+Con los valores por defecto la corrida completa es larga: 50.000 CUITs con 100 ms de
+latencia y tres consultas secuenciales por CUIT demoran varias horas.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(RAIZ)
+
+DIRECTORIO_RESULTADOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resultados')
+
+
+def _commit_actual():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconocido"
+
+
+def _pico_rss_mb():
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa KB y macOS bytes
+    return pico / 1024 / (1024 if sys.platform == 'darwin' else 1)
+
+
+def _percentil(valores, percentil):
+    import numpy as np
+    return float(np.percentile(valores, percentil)) if valores else 0.0
+
+
+def ejecutar_escenario(tamano, latencia_ms, semilla=0):
+    """
+    Corre procesar_lista_cuits para una cartera sintética contra el simulador y mide cada etapa
+    con los marcadores de perfilado.py. Se fija el modo secuencial porque la latencia por CUIT
+    solo se puede medir envolviendo utils.procesar_cuit, que los modos async y procesos no usan.
+    """
+    import utils
+    from bcra_simulado import iniciar_servidor
+    from perfilado import ETAPAS_PIPELINE, perfilar_lote
+
+    logging.getLogger('streamlit').setLevel(logging.ERROR)
+
+    servidor = iniciar_servidor(latencia_ms=latencia_ms, semilla=semilla)
+    utils.BCRA_API_URL = servidor.url_base
+    utils.PAUSA_ENTRE_CUITS = 0
+
+    por_cuit = []
+
+    # La latencia por CUIT se mide envolviendo procesar_cuit; las etapas, con el perfil del lote
+    procesar_cuit_original = utils.procesar_cuit
+
+    def procesar_cuit_medido(cuit, *args, **kwargs):
+        inicio = time.perf_counter()
+        resultado = procesar_cuit_original(cuit, *args, **kwargs)
+        por_cuit.append(time.perf_counter() - inicio)
+        return resultado
+
+    utils.procesar_cuit = procesar_cuit_medido
+
+    cuits = [str(20000000000 + i) for i in range(tamano)]
+    with perfilar_lote() as perfil:
+        df_resultados = utils.procesar_lista_cuits(",".join(cuits), modo="secuencial")
+    total = perfil.duracion
+
+    servidor.shutdown()
+
+    # Tiempo propio de cada etapa: 'procesar' no está incluido en 'resumen'
+    medidos = perfil.etapas_s()
+    tiempos = {etapa: medidos.get(etapa, 0.0) for etapa in ETAPAS_PIPELINE}
+    tiempos['sin medir'] = max(total - sum(medidos.values()), 0.0)
+
+    return {
+        'tamano': tamano,
+        'latencia_ms': latencia_ms,
+        'filas': 0 if df_resultados is None else len(df_resultados),
+        'total_s': round(total, 4),
+        'cuits_por_s': round(tamano / total, 2) if total > 0 else None,
+        'latencia_cuit_ms': {
+            'p50': round(_percentil(por_cuit, 50) * 1000, 3),
+            'p95': round(_percentil(por_cuit, 95) * 1000, 3),
+            'p99': round(_percentil(por_cuit, 99) * 1000, 3)
+        },
+        'pico_rss_mb': round(_pico_rss_mb(), 1),
+        'etapas_s': {etapa: round(valor, 4) for etapa, valor in tiempos.items()}
+    }
+
+
+def correr_en_subproceso(tamano, latencia_ms):
+    """
+    Ejecuta un escenario en un proceso nuevo y devuelve su resultado. El proceso usa un directorio
+    de datos vacío y ninguna caché compartida, así que no aprovecha respuestas de otras corridas ni
+    escribe en las del usuario; tampoco limita las consultas por segundo, usa los CUITs testigo de
+    la cartera y no guarda snapshots, almacén, matriz ni archivo de respuestas
+    """
+    with tempfile.TemporaryDirectory(prefix="bench_pipeline_") as directorio_datos:
+        entorno = dict(
+            os.environ,
+            BCRA_DATOS_DIR=directorio_datos,
+            BCRA_CACHE_ARCHIVO="",
+            BCRA_MAX_RPS="0",
+            BCRA_CUITS_TESTIGO="",
+            BCRA_SNAPSHOTS="0",
+            BCRA_ALMACEN="0",
+            BCRA_MATRIZ="0",
+            BCRA_ARCHIVO_CRUDO="0"
+        )
+        proceso = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--escenario', str(tamano), str(latencia_ms)],
+            capture_output=True, text=True, check=True, env=entorno
+        )
+    return json.loads(proceso.stdout.strip().splitlines()[-1])
+
+
+def comparar(anterior, actual):
+    """
+    Imprime la variación de CUITs/s y p95 por escenario entre dos corridas
+    """
+    claves = {(r['tamano'], r['latencia_ms']): r for r in anterior['escenarios']}
+    print(f"\nComparación contra {anterior['commit']} ({anterior['fecha']})")
+    print(f"{'tamaño':>8} {'lat. ms':>8} {'CUITs/s ant.':>13} {'CUITs/s act.':>13} {'var.':>8} {'p95 ant.':>10} {'p95 act.':>10}")
+    for resultado in actual['escenarios']:
+        previo = claves.get((resultado['tamano'], resultado['latencia_ms']))
+        if not previo:
+            continue
+        variacion = (resultado['cuits_por_s'] / previo['cuits_por_s'] - 1) * 100 if previo['cuits_por_s'] else 0
+        print(f"{resultado['tamano']:>8} {resultado['latencia_ms']:>8} {previo['cuits_por_s']:>13} "
+              f"{resultado['cuits_por_s']:>13} {variacion:>7.1f}% {previo['latencia_cuit_ms']['p95']:>10} "
+              f"{resultado['latencia_cuit_ms']['p95']:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tamanos', type=int, nargs='+', default=[10, 1000, 50000])
+    parser.add_argument('--latencias-ms', type=float, nargs='+', default=[0, 20, 100])
+    parser.add_argument('--salida', help="Archivo JSON de salida (por defecto en benchmarks/resultados/)")
+    parser.add_argument('--comparar', help="Archivo JSON de una corrida anterior para comparar")
+    parser.add_argument('--escenario', nargs=2, metavar=('TAMANO', 'LATENCIA_MS'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.escenario:
+        resultado = ejecutar_escenario(int(args.escenario[0]), float(args.escenario[1]))
+        print(json.dumps(resultado))
+        return
+
+    corrida = {
+        'commit': _commit_actual(),
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'escenarios': []
+    }
+
+    print(f"{'tamaño':>8} {'lat. ms':>8} {'total s':>9} {'CUITs/s':>9} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'RSS MB':>7}  etapas (s)")
+    for tamano in args.tamanos:
+        for latencia in args.latencias_ms:
+            resultado = correr_en_subproceso(tamano, latencia)
+            corrida['escenarios'].append(resultado)
+            latencias = resultado['latencia_cuit_ms']
+            etapas = ", ".join(f"{etapa}={valor:.2f}" for etapa, valor in resultado['etapas_s'].items())
+            print(f"{tamano:>8} {latencia:>8} {resultado['total_s']:>9.2f} {resultado['cuits_por_s']:>9} "
+                  f"{latencias['p50']:>8} {latencias['p95']:>8} {latencias['p99']:>8} "
+                  f"{resultado['pico_rss_mb']:>7}  {etapas}")
+
+    salida = args.salida
+    if not salida:
+        os.makedirs(DIRECTORIO_RESULTADOS, exist_ok=True)
+        salida = os.path.join(
+            DIRECTORIO_RESULTADOS,
+            f"pipeline_{corrida['commit']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        )
+    with open(salida, 'w', encoding='utf-8') as archivo:
+        json.dump(corrida, archivo, ensure_ascii=False, indent=2)
+    print(f"\nResultados guardados en {salida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as archivo:
+            comparar(json.load(archivo), corrida)
+
+
+if __name__ == '__main__':
+    main()
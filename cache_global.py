@@ -0,0 +1,378 @@
+"""
+Caché compartida entre sesiones de las respuestas de la API y de los resultados de las carteras.
+
+CACHE_RESPUESTAS guarda el cuerpo crudo de cada respuesta por (endpoint, CUIT), así que dos
+analistas que consultan carteras con CUITs en común pagan una sola vez cada consulta. Vive en
+memoria del proceso con un tope de bytes y desalojo LRU; si está definido BCRA_CACHE_ARCHIVO,
+además se escribe en un archivo SQLite que comparten todos los procesos (trabajadores de la cola,
+servicio HTTP, varias instancias de Streamlit).
+
+Mientras el período publicado siga siendo el mismo (registrar_periodo, que se alimenta de
+utils.verificar_periodo), las respuestas de Deudas e Históricas no vencen; al publicarse uno nuevo
+se descartan todas juntas. Cheques rechazados conserva la vigencia por tiempo.
+
+CACHE_LOTES guarda los DataFrames de resultados de cada consulta múltiple: la sesión de Streamlit
+solo conserva la clave, y la página la recupera desde la URL después de recargar.
+
+CACHE_PROCESADO guarda, por el hash de cada cuerpo, las tablas interpretadas y la fila del informe
+resumido de cada CUIT: una respuesta idéntica a una ya procesada (lo habitual al repetir una cartera
+el mes siguiente) no se vuelve a interpretar ni a resumir.
+"""
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+
+from metricas import REGISTRO as REGISTRO_METRICAS
+
+# Tope de memoria de la caché de respuestas, en MB
+CACHE_MAXIMO_MB = float(os.environ.get("BCRA_CACHE_MB", "256"))
+
+# Tope de memoria de la caché de resultados de carteras, en MB
+CACHE_LOTES_MAXIMO_MB = float(os.environ.get("BCRA_CACHE_LOTES_MB", "256"))
+
+# Tope de memoria de las tablas y resúmenes memorizados por hash de respuesta, en MB
+CACHE_PROCESADO_MAXIMO_MB = float(os.environ.get("BCRA_CACHE_PROCESADO_MB", "256"))
+
+# Segundos que una respuesta se considera vigente (la Central de Deudores se actualiza una vez por mes)
+CACHE_VIGENCIA = float(os.environ.get("BCRA_CACHE_VIGENCIA", str(12 * 3600)))
+
+# Archivo SQLite compartido entre procesos (sin archivo, la caché es solo en memoria)
+CACHE_ARCHIVO = os.environ.get("BCRA_CACHE_ARCHIVO", "")
+
+# Endpoints y estados que se guardan: un 404 significa "sin datos" y también se reutiliza
+ENDPOINTS_CACHEABLES = ("deudas", "historicas", "cheques")
+ESTADOS_CACHEABLES = (200, 404)
+
+# Endpoints cuyo contenido cambia solo al publicarse un período nuevo
+ENDPOINTS_POR_PERIODO = ("deudas", "historicas")
+
+# Segundos durante los que una verificación del período publicado sigue valiendo
+INTERVALO_VERIFICACION_PERIODO = float(os.environ.get("BCRA_VERIFICACION_PERIODO", "600"))
+
+# Bytes estimados por entrada además del cuerpo (clave, tupla y nodo del OrderedDict)
+SOBRECARGA_ENTRADA = 200
+
+
+class CacheRespuestas:
+    """
+    Caché LRU de respuestas crudas por (endpoint, cuit), acotada en bytes y segura entre hilos.
+    obtener() devuelve (estado, cuerpo) o None; el cuerpo es b"" para los 404.
+    """
+
+    def __init__(self, maximo_bytes, vigencia=CACHE_VIGENCIA, ruta=None):
+        self.maximo_bytes = maximo_bytes
+        self.vigencia = vigencia
+        self.ruta = ruta
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self._conexion = None
+        self.reiniciar_estadisticas()
+        self.bytes = 0
+        # Período publicado, desde cuándo se lo conoce y cuándo se lo verificó por última vez
+        self.periodo = None
+        self.periodo_desde = 0.0
+        self.periodo_verificado = 0.0
+
+    def reiniciar_estadisticas(self):
+        self.aciertos = 0
+        self.aciertos_archivo = 0
+        self.fallos = 0
+        self.desalojos = 0
+
+    def _archivo(self):
+        """
+        Abre el archivo compartido la primera vez que se usa y descarta las respuestas vencidas
+        """
+        if self._conexion is None and self.ruta:
+            os.makedirs(os.path.dirname(os.path.abspath(self.ruta)), exist_ok=True)
+            conexion = sqlite3.connect(self.ruta, timeout=30, isolation_level=None, check_same_thread=False)
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute("PRAGMA synchronous=NORMAL")
+            conexion.execute("""
+                CREATE TABLE IF NOT EXISTS respuestas (
+                    endpoint TEXT NOT NULL,
+                    cuit TEXT NOT NULL,
+                    estado INTEGER NOT NULL,
+                    cuerpo BLOB NOT NULL,
+                    obtenido REAL NOT NULL,
+                    PRIMARY KEY (endpoint, cuit)
+                )
+            """)
+            conexion.execute("""
+                CREATE TABLE IF NOT EXISTS periodo (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    periodo TEXT NOT NULL,
+                    desde REAL NOT NULL
+                )
+            """)
+            conexion.execute(
+                "DELETE FROM respuestas WHERE endpoint NOT IN ('deudas', 'historicas') AND obtenido < ?",
+                (time.time() - self.vigencia,)
+            )
+            self._conexion = conexion
+        return self._conexion
+
+    def _agregar(self, clave, estado, cuerpo, obtenido):
+        anterior = self._entradas.pop(clave, None)
+        if anterior is not None:
+            self.bytes -= len(anterior[1]) + SOBRECARGA_ENTRADA
+        self._entradas[clave] = (estado, cuerpo, obtenido)
+        self.bytes += len(cuerpo) + SOBRECARGA_ENTRADA
+        while self.bytes > self.maximo_bytes and self._entradas:
+            _, (_, cuerpo_desalojado, _) = self._entradas.popitem(last=False)
+            self.bytes -= len(cuerpo_desalojado) + SOBRECARGA_ENTRADA
+            self.desalojos += 1
+
+    def _limite_vigencia(self, endpoint):
+        """
+        Momento desde el que una respuesta sigue vigente: para Deudas e Históricas, desde que se
+        conoce el período publicado, si se lo verificó hace poco; si no, según la vigencia por tiempo
+        """
+        ahora = time.time()
+        if endpoint in ENDPOINTS_POR_PERIODO and ahora - self.periodo_verificado < INTERVALO_VERIFICACION_PERIODO:
+            return self.periodo_desde
+        return ahora - self.vigencia
+
+    def obtener(self, endpoint, cuit):
+        """
+        Busca la respuesta en memoria y, si no está, en el archivo compartido
+        """
+        if endpoint not in ENDPOINTS_CACHEABLES:
+            return None
+
+        clave = (endpoint, cuit)
+        with self._lock:
+            limite = self._limite_vigencia(endpoint)
+            entrada = self._entradas.get(clave)
+            if entrada is not None and entrada[2] < limite:
+                self._entradas.pop(clave)
+                self.bytes -= len(entrada[1]) + SOBRECARGA_ENTRADA
+                entrada = None
+            if entrada is not None:
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+            elif self.ruta:
+                fila = self._archivo().execute(
+                    "SELECT estado, cuerpo, obtenido FROM respuestas WHERE endpoint = ? AND cuit = ? AND obtenido >= ?",
+                    (endpoint, cuit, limite)
+                ).fetchone()
+                if fila is not None:
+                    entrada = (fila[0], bytes(fila[1]), fila[2])
+                    self._agregar(clave, *entrada)
+                    self.aciertos_archivo += 1
+            if entrada is None:
+                self.fallos += 1
+
+        REGISTRO_METRICAS.registrar_cache(endpoint, entrada is not None)
+        return None if entrada is None else (entrada[0], entrada[1])
+
+    def guardar(self, endpoint, cuit, estado, cuerpo):
+        """
+        Guarda una respuesta si su endpoint y estado son cacheables
+        """
+        if endpoint not in ENDPOINTS_CACHEABLES or estado not in ESTADOS_CACHEABLES:
+            return
+        cuerpo = cuerpo if estado == 200 and cuerpo is not None else b""
+        obtenido = time.time()
+        with self._lock:
+            self._agregar((endpoint, cuit), estado, cuerpo, obtenido)
+            if self.ruta:
+                self._archivo().execute(
+                    "INSERT OR REPLACE INTO respuestas (endpoint, cuit, estado, cuerpo, obtenido) VALUES (?, ?, ?, ?, ?)",
+                    (endpoint, cuit, estado, cuerpo, obtenido)
+                )
+
+    def periodo_vigente(self):
+        """
+        Devuelve el período verificado hace menos de INTERVALO_VERIFICACION_PERIODO, o None
+        """
+        if time.time() - self.periodo_verificado < INTERVALO_VERIFICACION_PERIODO:
+            return self.periodo
+        return None
+
+    def registrar_periodo(self, periodo):
+        """
+        Registra el período publicado que informó la API. Si es distinto del conocido (en este
+        proceso o en el archivo compartido), descarta de una vez las respuestas de Deudas e
+        Históricas anteriores. Devuelve True si cambió el período.
+        """
+        ahora = time.time()
+        with self._lock:
+            conocido, desde = self.periodo, self.periodo_desde
+            if self.ruta:
+                fila = self._archivo().execute("SELECT periodo, desde FROM periodo WHERE id = 1").fetchone()
+                if fila is not None:
+                    conocido, desde = fila
+
+            cambio = conocido is not None and conocido != periodo
+            if cambio:
+                desde = ahora
+            elif conocido is None:
+                # Primera verificación: lo que ya estaba en caché conserva la vigencia por tiempo
+                desde = ahora - self.vigencia
+            if self.ruta and (cambio or conocido is None):
+                self._archivo().execute("BEGIN IMMEDIATE")
+                try:
+                    self._archivo().execute(
+                        "DELETE FROM respuestas WHERE endpoint IN ('deudas', 'historicas') AND obtenido < ?", (desde,)
+                    )
+                    self._archivo().execute(
+                        "INSERT OR REPLACE INTO periodo (id, periodo, desde) VALUES (1, ?, ?)", (periodo, desde)
+                    )
+                    self._archivo().execute("COMMIT")
+                except Exception:
+                    self._archivo().execute("ROLLBACK")
+                    raise
+
+            # Otro proceso pudo haber detectado el cambio antes: se descartan igual las copias en memoria
+            for clave in [
+                clave for clave, entrada in self._entradas.items()
+                if clave[0] in ENDPOINTS_POR_PERIODO and entrada[2] < desde
+            ]:
+                estado, cuerpo, obtenido = self._entradas.pop(clave)
+                self.bytes -= len(cuerpo) + SOBRECARGA_ENTRADA
+
+            self.periodo, self.periodo_desde, self.periodo_verificado = periodo, desde, ahora
+        return cambio
+
+    def invalidar(self, endpoints=None):
+        """
+        Descarta las respuestas de los endpoints indicados (todas si endpoints es None),
+        en memoria y en el archivo compartido
+        """
+        endpoints = tuple(endpoints or ENDPOINTS_CACHEABLES)
+        with self._lock:
+            for clave in [clave for clave in self._entradas if clave[0] in endpoints]:
+                estado, cuerpo, obtenido = self._entradas.pop(clave)
+                self.bytes -= len(cuerpo) + SOBRECARGA_ENTRADA
+            if self.ruta:
+                marcadores = ", ".join("?" for _ in endpoints)
+                self._archivo().execute(f"DELETE FROM respuestas WHERE endpoint IN ({marcadores})", endpoints)
+
+    def estadisticas(self):
+        """
+        Devuelve entradas, memoria usada y aciertos/fallos desde el último reinicio
+        """
+        with self._lock:
+            consultas = self.aciertos + self.aciertos_archivo + self.fallos
+            return {
+                'entradas': len(self._entradas),
+                'mb': round(self.bytes / 1024 / 1024, 2),
+                'maximo_mb': round(self.maximo_bytes / 1024 / 1024, 2),
+                'aciertos': self.aciertos,
+                'aciertos_archivo': self.aciertos_archivo,
+                'fallos': self.fallos,
+                'desalojos': self.desalojos,
+                'tasa_aciertos': round((self.aciertos + self.aciertos_archivo) / consultas, 4) if consultas else None,
+                'archivo': self.ruta or None,
+                'periodo': self.periodo
+            }
+
+
+class CacheLotes:
+    """
+    Caché LRU de DataFrames de resultados por clave, acotada en bytes y segura entre hilos.
+    Las sesiones guardan la clave que devuelve guardar() en lugar del DataFrame.
+    """
+
+    def __init__(self, maximo_bytes):
+        self.maximo_bytes = maximo_bytes
+        self.bytes = 0
+        self._lotes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def guardar(self, df, clave=None):
+        clave = clave or uuid.uuid4().hex[:16]
+        tamano = int(df.memory_usage(deep=True).sum())
+        with self._lock:
+            anterior = self._lotes.pop(clave, None)
+            if anterior is not None:
+                self.bytes -= anterior[1]
+            self._lotes[clave] = (df, tamano)
+            self.bytes += tamano
+            # El lote recién guardado se conserva aunque por sí solo supere el tope
+            while self.bytes > self.maximo_bytes and len(self._lotes) > 1:
+                _, (_, tamano_desalojado) = self._lotes.popitem(last=False)
+                self.bytes -= tamano_desalojado
+        return clave
+
+    def obtener(self, clave):
+        """
+        Devuelve el DataFrame de la clave, o None si no existe o ya fue desalojado
+        """
+        if not clave:
+            return None
+        with self._lock:
+            lote = self._lotes.get(clave)
+            if lote is None:
+                return None
+            self._lotes.move_to_end(clave)
+            return lote[0]
+
+    def limpiar(self):
+        with self._lock:
+            self._lotes.clear()
+            self.bytes = 0
+
+
+class CacheProcesado:
+    """
+    Caché LRU, acotada en bytes y segura entre hilos, de lo que se obtiene al procesar respuestas.
+    Las claves son tuplas cuyo primer elemento es el tipo de entrada ('tabla' o 'resumen'), que
+    separa los aciertos en las estadísticas. obtener() devuelve (encontrado, valor), porque None
+    también es un valor válido (una respuesta sin filas).
+    """
+
+    def __init__(self, maximo_bytes):
+        self.maximo_bytes = maximo_bytes
+        self.bytes = 0
+        self.aciertos = Counter()
+        self.fallos = Counter()
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self.fallos[clave[0]] += 1
+                return False, None
+            self._entradas.move_to_end(clave)
+            self.aciertos[clave[0]] += 1
+            return True, entrada[0]
+
+    def guardar(self, clave, valor, tamano):
+        tamano += SOBRECARGA_ENTRADA
+        with self._lock:
+            anterior = self._entradas.pop(clave, None)
+            if anterior is not None:
+                self.bytes -= anterior[1]
+            self._entradas[clave] = (valor, tamano)
+            self.bytes += tamano
+            while self.bytes > self.maximo_bytes and self._entradas:
+                _, (_, tamano_desalojado) = self._entradas.popitem(last=False)
+                self.bytes -= tamano_desalojado
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'entradas': len(self._entradas),
+                'mb': self.bytes / (1024 * 1024),
+                'aciertos': dict(self.aciertos),
+                'fallos': dict(self.fallos)
+            }
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+            self.bytes = 0
+            self.aciertos.clear()
+            self.fallos.clear()
+
+
+CACHE_RESPUESTAS = CacheRespuestas(int(CACHE_MAXIMO_MB * 1024 * 1024), CACHE_VIGENCIA, CACHE_ARCHIVO or None)
+CACHE_LOTES = CacheLotes(int(CACHE_LOTES_MAXIMO_MB * 1024 * 1024))
+CACHE_PROCESADO = CacheProcesado(int(CACHE_PROCESADO_MAXIMO_MB * 1024 * 1024))
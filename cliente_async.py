@@ -0,0 +1,286 @@
+"""
+Cliente asíncrono de la API de Central de Deudores del BCRA.
+
+Contrapartes asíncronas de obtener_deudas, obtener_deudas_historicas y obtener_cheques_rechazados
+sobre aiohttp, con un único event loop, conexiones persistentes (keep-alive) y un límite de
+conexiones. procesar_cuits_async procesa una cartera con una cantidad acotada de consultas en vuelo;
+cada consulta en vuelo cuesta unos pocos KB en lugar de un hilo.
+
+Desde Streamlit se usa a través de un loop en segundo plano (ejecutar_en_segundo_plano); desde la
+línea de comandos:
+
+    python cliente_async.py --cuits 20123456789,27234567890 --concurrencia 200 --salida resultados.csv
+    python cliente_async.py --archivo cartera.csv --concurrencia 500
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import threading
+import time
+
+import aiohttp
+import pandas as pd
+
+import utils
+from cache_global import CACHE_RESPUESTAS
+from metricas import REGISTRO as REGISTRO_METRICAS
+from perfilado import etapa
+
+# Consultas simultáneas por defecto en procesar_cuits_async
+CONCURRENCIA_POR_DEFECTO = int(os.environ.get("BCRA_CONCURRENCIA", "20"))
+
+# Conexiones TCP abiertas como máximo contra la API
+LIMITE_CONEXIONES = int(os.environ.get("BCRA_LIMITE_CONEXIONES", "100"))
+
+# Segundos que una conexión ociosa se mantiene abierta para reutilizarla
+KEEPALIVE_SEGUNDOS = 30
+
+_loop_fondo = None
+_loop_lock = threading.Lock()
+
+
+def crear_sesion(limite_conexiones=None):
+    """
+    Crea una sesión de aiohttp con límite de conexiones y keep-alive.
+    La verificación SSL se desactiva igual que en consultar_api.
+    """
+    conector = aiohttp.TCPConnector(
+        limit=limite_conexiones or LIMITE_CONEXIONES,
+        keepalive_timeout=KEEPALIVE_SEGUNDOS,
+        ssl=False
+    )
+    return aiohttp.ClientSession(
+        connector=conector,
+        timeout=aiohttp.ClientTimeout(total=utils.BCRA_API_TIMEOUT)
+    )
+
+
+async def descargar_api_async(sesion, url, tipo_consulta="general", cuit=None):
+    """
+    Descarga una respuesta de la API del BCRA sin interpretarla.
+    Devuelve (estado, cuerpo): estado es el código HTTP o 'timeout'/'error', y cuerpo los bytes
+    de la respuesta si fue 200. No muestra mensajes: el llamador decide cómo informar los errores.
+    Con cuit, la respuesta se busca y se guarda en la caché compartida con consultar_api.
+    Una respuesta 429 se reintenta como en utils.descargar_api.
+    """
+    if cuit is not None:
+        respuesta = CACHE_RESPUESTAS.obtener(tipo_consulta, cuit)
+        if respuesta is not None:
+            estado, cuerpo = respuesta
+            return estado, cuerpo if estado == 200 else None
+
+    for reintento in range(utils.REINTENTOS_429 + 1):
+        espera = utils.LIMITADOR_API.reservar()
+        if espera > 0:
+            await asyncio.sleep(espera)
+
+        inicio = time.perf_counter()
+        try:
+            with etapa('red'):
+                async with sesion.get(url) as response:
+                    cuerpo = await response.read()
+                    estado = response.status
+                    retry_after = response.headers.get('Retry-After')
+        except asyncio.TimeoutError:
+            REGISTRO_METRICAS.registrar_llamada(
+                tipo_consulta, "timeout", 0, time.perf_counter() - inicio, reintentos=int(reintento > 0)
+            )
+            return "timeout", None
+        except aiohttp.ClientError:
+            REGISTRO_METRICAS.registrar_llamada(
+                tipo_consulta, "error", 0, time.perf_counter() - inicio, reintentos=int(reintento > 0)
+            )
+            return "error", None
+
+        REGISTRO_METRICAS.registrar_llamada(
+            tipo_consulta, estado, len(cuerpo), time.perf_counter() - inicio, reintentos=int(reintento > 0)
+        )
+        if estado != 429 or reintento == utils.REINTENTOS_429:
+            break
+        await asyncio.sleep(utils.espera_reintento(retry_after))
+
+    if cuit is not None:
+        utils.guardar_respuesta(tipo_consulta, cuit, estado, cuerpo)
+    return estado, cuerpo if estado == 200 else None
+
+
+async def consultar_api_async(sesion, url, tipo_consulta="general", cuit=None):
+    """
+    Consulta la API del BCRA de forma asíncrona. Devuelve (estado, datos) con el JSON ya
+    interpretado si la respuesta fue 200.
+    """
+    estado, cuerpo = await descargar_api_async(sesion, url, tipo_consulta, cuit)
+    if cuerpo is None:
+        return estado, None
+
+    try:
+        with etapa('json'):
+            return estado, json.loads(cuerpo)
+    except ValueError:
+        return "error", None
+
+
+# Ruta de cada endpoint relativa a BCRA_API_URL
+RUTAS_ENDPOINTS = {
+    "deudas": "Deudas",
+    "historicas": "Deudas/Historicas",
+    "cheques": "Deudas/ChequesRechazados"
+}
+
+
+async def obtener_deudas_async(sesion, cuit):
+    return await consultar_api_async(sesion, f"{utils.BCRA_API_URL}/Deudas/{cuit}", "deudas", cuit)
+
+
+async def obtener_deudas_historicas_async(sesion, cuit):
+    return await consultar_api_async(sesion, f"{utils.BCRA_API_URL}/Deudas/Historicas/{cuit}", "historicas", cuit)
+
+
+async def obtener_cheques_rechazados_async(sesion, cuit):
+    return await consultar_api_async(sesion, f"{utils.BCRA_API_URL}/Deudas/ChequesRechazados/{cuit}", "cheques", cuit)
+
+
+async def descargar_cuit_async(sesion, cuit, semaforo, incidencias):
+    """
+    Descarga en paralelo las respuestas de los tres endpoints de un CUIT, sin interpretarlas.
+    Devuelve los cuerpos (deudas, históricas, cheques) como utils.cuerpo_para_resumir.
+    Las respuestas distintas de 200 se agregan a incidencias como (cuit, endpoint, estado).
+    """
+    async def con_semaforo(endpoint):
+        async with semaforo:
+            estado, cuerpo = await descargar_api_async(
+                sesion, f"{utils.BCRA_API_URL}/{RUTAS_ENDPOINTS[endpoint]}/{cuit}", endpoint, cuit
+            )
+        # La falta de cheques rechazados (404) es el caso normal y no se informa
+        if estado != 200 and not (endpoint == "cheques" and estado == 404):
+            incidencias.append((cuit, endpoint, estado))
+        return utils.cuerpo_para_resumir(estado, cuerpo)
+
+    return await asyncio.gather(*(con_semaforo(endpoint) for endpoint in RUTAS_ENDPOINTS))
+
+
+async def procesar_cuit_async(sesion, cuit, semaforo, incidencias):
+    """
+    Consulta los tres endpoints de un CUIT en paralelo y devuelve su fila del informe resumido.
+    Las respuestas distintas de 200 se agregan a incidencias como (cuit, endpoint, estado).
+    """
+    cuerpos = await descargar_cuit_async(sesion, cuit, semaforo, incidencias)
+
+    with etapa('resumen'):
+        return utils.resumir_respuestas(cuit, *cuerpos)
+
+
+async def procesar_cuits_async(cuits, concurrencia=None, limite_conexiones=None, al_avanzar=None):
+    """
+    Procesa una lista de CUITs válidos con como máximo `concurrencia` consultas en vuelo.
+    Devuelve (resultados, incidencias), con los resultados en el orden de entrada.
+    al_avanzar(completados, total) se llama cada vez que termina un CUIT.
+    """
+    concurrencia = concurrencia or CONCURRENCIA_POR_DEFECTO
+    semaforo = asyncio.Semaphore(concurrencia)
+    resultados = [None] * len(cuits)
+    incidencias = []
+    pendientes = iter(enumerate(cuits))
+    completados = 0
+
+    async def trabajador():
+        nonlocal completados
+        # Cada trabajador toma el siguiente CUIT pendiente: no se crea una tarea por CUIT
+        for posicion, cuit in pendientes:
+            resultados[posicion] = await procesar_cuit_async(sesion, cuit, semaforo, incidencias)
+            completados += 1
+            if al_avanzar is not None:
+                al_avanzar(completados, len(cuits))
+
+    async with crear_sesion(limite_conexiones) as sesion:
+        # Cada CUIT abre hasta tres consultas, así que alcanza con un tercio de trabajadores
+        cantidad_trabajadores = max(1, min(len(cuits), -(-concurrencia // 3)))
+        await asyncio.gather(*(trabajador() for _ in range(cantidad_trabajadores)))
+
+    # Escribir en el almacén local las tablas acumuladas sin bloquear el loop
+    await asyncio.get_running_loop().run_in_executor(None, utils.volcar_datos_locales)
+    return resultados, incidencias
+
+
+def obtener_loop_fondo():
+    """
+    Devuelve un event loop que corre en un hilo en segundo plano, compartido por todo el proceso.
+    Streamlit ejecuta cada script en su propio hilo, sin loop; las corrutinas se envían a este.
+    """
+    global _loop_fondo
+
+    with _loop_lock:
+        if _loop_fondo is None:
+            _loop_fondo = asyncio.new_event_loop()
+            threading.Thread(target=_loop_fondo.run_forever, name="bcra-asyncio", daemon=True).start()
+    return _loop_fondo
+
+
+def ejecutar_en_segundo_plano(corrutina):
+    """
+    Envía una corrutina al loop en segundo plano y devuelve un concurrent.futures.Future.
+    La tarea hereda el contexto del llamador, de modo que el perfilado por etapas sigue activo.
+    """
+    loop = obtener_loop_fondo()
+    futuro = asyncio.run_coroutine_threadsafe(_con_contexto(corrutina, contextvars.copy_context()), loop)
+    return futuro
+
+
+async def _con_contexto(corrutina, contexto):
+    # Crear la tarea dentro del contexto copiado para que herede sus variables
+    tarea = contexto.run(asyncio.ensure_future, corrutina)
+    return await tarea
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    entrada = parser.add_mutually_exclusive_group(required=True)
+    entrada.add_argument('--cuits', help="CUITs separados por comas")
+    entrada.add_argument('--archivo', help="Archivo CSV o Excel con una columna 'CUIT'")
+    parser.add_argument('--concurrencia', type=int, default=CONCURRENCIA_POR_DEFECTO)
+    parser.add_argument('--limite-conexiones', type=int, default=LIMITE_CONEXIONES)
+    parser.add_argument('--procesos', type=int,
+                        help="Resumir en un grupo de N procesos (ver procesamiento_paralelo.py)")
+    parser.add_argument('--salida', help="Archivo CSV de salida (por defecto se imprime un resumen)")
+    args = parser.parse_args()
+
+    if args.archivo:
+        df_cuits = pd.read_csv(args.archivo) if args.archivo.endswith('.csv') else pd.read_excel(args.archivo)
+        cuits_texto = ','.join(df_cuits['CUIT'].astype(str).tolist())
+    else:
+        cuits_texto = args.cuits
+
+    cuits_validos, cuits_invalidos = utils.separar_cuits(cuits_texto)
+    for cuit in cuits_invalidos:
+        print(f"CUIT/CUIL/CDI inválido ignorado: {cuit}")
+
+    def informar(completados, total):
+        if completados % 100 == 0 or completados == total:
+            print(f"\r{completados}/{total} CUITs procesados", end="", flush=True)
+
+    inicio = time.perf_counter()
+    if args.procesos:
+        from procesamiento_paralelo import procesar_cuits_en_procesos
+        resultados, incidencias = asyncio.run(procesar_cuits_en_procesos(
+            cuits_validos, args.procesos, args.concurrencia, args.limite_conexiones, informar
+        ))
+    else:
+        resultados, incidencias = asyncio.run(
+            procesar_cuits_async(cuits_validos, args.concurrencia, args.limite_conexiones, informar)
+        )
+    duracion = time.perf_counter() - inicio
+    print(f"\n{len(cuits_validos)} CUITs en {duracion:.1f} s ({len(cuits_validos) / duracion:.1f} CUITs/s), "
+          f"{len(incidencias)} consultas con incidencias")
+
+    df_resultados = pd.DataFrame(resultados).astype(utils.TIPOS_RESULTADOS)
+    if args.salida:
+        utils.formatear_resultados(df_resultados).to_csv(args.salida, index=False)
+        print(f"Resultados guardados en {args.salida}")
+    else:
+        print(df_resultados.head(20).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
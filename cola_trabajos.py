@@ -0,0 +1,554 @@
+"""
+Cola local de trabajos para procesar carteras fuera del script de Streamlit.
+
+Los trabajos se guardan en una base SQLite (en utils.DIRECTORIO_DATOS) y los ejecutan procesos
+trabajadores independientes, así un lote largo no bloquea la sesión de quien lo pidió ni se
+pierde si se cierra el navegador. Los resultados se guardan por CUIT a medida que avanzan, de
+modo que un trabajo interrumpido se retoma donde quedó.
+
+Los trabajadores procesan cada trabajo en tramos; al terminar un tramo, si hay trabajos de otros
+usuarios esperando, el trabajo vuelve a la cola y se atiende al usuario que hace más tiempo que no
+tiene turno. Así un lote grande no demora los lotes chicos de los demás.
+
+    python cola_trabajos.py trabajador --cantidad 4
+    python cola_trabajos.py encolar --usuario analista1 --archivo cartera.csv
+    python cola_trabajos.py listar
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+import utils
+
+RUTA_COLA = os.path.join(utils.DIRECTORIO_DATOS, "cola_trabajos.sqlite")
+
+# CUITs que un trabajador procesa antes de ceder el turno a trabajos de otros usuarios
+TAMANO_TRAMO = int(os.environ.get("BCRA_TAMANO_TRAMO", "200"))
+
+# Segundos sin latido tras los cuales un trabajo en curso se considera abandonado
+LATIDO_MAXIMO = 120
+
+# Segundos entre consultas a la cola cuando no hay trabajos pendientes
+ESPERA_SIN_TRABAJOS = 2.0
+
+ESTADOS_FINALES = ('terminado', 'error', 'cancelado')
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS trabajos (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    usuario TEXT NOT NULL,
+    estado TEXT NOT NULL DEFAULT 'pendiente',
+    modo TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    procesados INTEGER NOT NULL DEFAULT 0,
+    creado REAL NOT NULL,
+    iniciado REAL,
+    finalizado REAL,
+    ultimo_turno REAL NOT NULL DEFAULT 0,
+    trabajador TEXT,
+    latido REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_trabajos_estado ON trabajos (estado, usuario);
+CREATE TABLE IF NOT EXISTS trabajo_cuits (
+    trabajo_id INTEGER NOT NULL,
+    posicion INTEGER NOT NULL,
+    cuit TEXT NOT NULL,
+    PRIMARY KEY (trabajo_id, posicion)
+);
+CREATE TABLE IF NOT EXISTS resultados (
+    trabajo_id INTEGER NOT NULL,
+    posicion INTEGER NOT NULL,
+    fila TEXT NOT NULL,
+    PRIMARY KEY (trabajo_id, posicion)
+);
+CREATE TABLE IF NOT EXISTS incidencias (
+    trabajo_id INTEGER NOT NULL,
+    posicion INTEGER NOT NULL,
+    endpoint TEXT NOT NULL,
+    estado TEXT NOT NULL,
+    PRIMARY KEY (trabajo_id, posicion, endpoint)
+);
+CREATE TABLE IF NOT EXISTS trabajadores (
+    nombre TEXT PRIMARY KEY,
+    latido REAL NOT NULL,
+    trabajo_id INTEGER
+);
+"""
+
+
+def conectar(ruta=None):
+    """
+    Abre la base de la cola (creándola si no existe) en modo WAL, apta para varios procesos
+    """
+    ruta = ruta or RUTA_COLA
+    os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+    conexion = sqlite3.connect(ruta, timeout=30, isolation_level=None)
+    conexion.row_factory = sqlite3.Row
+    conexion.execute("PRAGMA journal_mode=WAL")
+    conexion.execute("PRAGMA synchronous=NORMAL")
+    conexion.executescript(ESQUEMA)
+    return conexion
+
+
+def encolar_trabajo(cuits_texto, usuario, modo="async", ruta=None):
+    """
+    Encola un trabajo con los CUITs válidos de cuits_texto y devuelve (id, cuits inválidos).
+    Devuelve id None si no hay ningún CUIT válido.
+    """
+    cuits_validos, cuits_invalidos = utils.separar_cuits(cuits_texto)
+    if not cuits_validos:
+        return None, cuits_invalidos
+
+    conexion = conectar(ruta)
+    try:
+        conexion.execute("BEGIN IMMEDIATE")
+        cursor = conexion.execute(
+            "INSERT INTO trabajos (usuario, modo, total, creado) VALUES (?, ?, ?, ?)",
+            (usuario, modo, len(cuits_validos), time.time())
+        )
+        trabajo_id = cursor.lastrowid
+        conexion.executemany(
+            "INSERT INTO trabajo_cuits (trabajo_id, posicion, cuit) VALUES (?, ?, ?)",
+            ((trabajo_id, posicion, cuit) for posicion, cuit in enumerate(cuits_validos))
+        )
+        conexion.execute("COMMIT")
+    except Exception:
+        conexion.execute("ROLLBACK")
+        raise
+    finally:
+        conexion.close()
+    return trabajo_id, cuits_invalidos
+
+
+def tomar_trabajo(conexion, trabajador):
+    """
+    Toma el próximo trabajo pendiente con reparto equitativo entre usuarios: primero el usuario con
+    menos trabajos en curso, después el que hace más tiempo que no tiene turno, y dentro de cada
+    usuario el trabajo más antiguo. Devuelve la fila del trabajo o None.
+    """
+    conexion.execute("BEGIN IMMEDIATE")
+    try:
+        fila = conexion.execute("""
+            SELECT t.* FROM trabajos t
+            WHERE t.estado = 'pendiente'
+            ORDER BY
+                (SELECT COUNT(*) FROM trabajos e WHERE e.usuario = t.usuario AND e.estado = 'en_curso'),
+                (SELECT MAX(e.ultimo_turno) FROM trabajos e WHERE e.usuario = t.usuario),
+                t.id
+            LIMIT 1
+        """).fetchone()
+        if fila is not None:
+            ahora = time.time()
+            conexion.execute("""
+                UPDATE trabajos
+                SET estado = 'en_curso', trabajador = ?, latido = ?, ultimo_turno = ?,
+                    iniciado = COALESCE(iniciado, ?)
+                WHERE id = ?
+            """, (trabajador, ahora, ahora, ahora, fila['id']))
+        conexion.execute("COMMIT")
+    except Exception:
+        conexion.execute("ROLLBACK")
+        raise
+    return fila
+
+
+def hay_otros_usuarios_esperando(conexion, usuario):
+    return conexion.execute(
+        "SELECT 1 FROM trabajos WHERE estado = 'pendiente' AND usuario != ? LIMIT 1", (usuario,)
+    ).fetchone() is not None
+
+
+def cuits_pendientes(conexion, trabajo_id, limite):
+    """
+    Devuelve hasta `limite` pares (posición, cuit) del trabajo que todavía no tienen resultado
+    """
+    return conexion.execute("""
+        SELECT c.posicion, c.cuit FROM trabajo_cuits c
+        LEFT JOIN resultados r ON r.trabajo_id = c.trabajo_id AND r.posicion = c.posicion
+        WHERE c.trabajo_id = ? AND r.posicion IS NULL
+        ORDER BY c.posicion
+        LIMIT ?
+    """, (trabajo_id, limite)).fetchall()
+
+
+def filas_serializables(resultados):
+    """
+    Normaliza las filas del resumen a los tipos de TIPOS_RESULTADOS y las convierte en
+    diccionarios con tipos nativos de Python, aptos para JSON
+    """
+    df = pd.DataFrame(resultados).astype(utils.TIPOS_RESULTADOS)
+    columnas = list(df.columns)
+    return [dict(zip(columnas, valores)) for valores in zip(*(df[columna].tolist() for columna in columnas))]
+
+
+def incidencias_por_posicion(tramo, incidencias):
+    """
+    Convierte las incidencias (cuit, endpoint, estado) de un tramo de filas (posicion, cuit) en
+    (posicion, endpoint, estado)
+    """
+    posiciones = {}
+    for fila in tramo:
+        posiciones.setdefault(fila['cuit'], []).append(fila['posicion'])
+    return [
+        (posicion, endpoint, str(estado))
+        for cuit, endpoint, estado in incidencias for posicion in posiciones.get(str(cuit), [])
+    ]
+
+
+def guardar_resultados(conexion, trabajo_id, posiciones, resultados, incidencias=(), trabajador=None):
+    """
+    Guarda los resultados de un tramo con sus incidencias (posicion, endpoint, estado) y actualiza el
+    avance y el latido del trabajo. Con trabajador, no guarda nada y devuelve False si el trabajo ya
+    no está en curso a su nombre (lo recuperó otro trabajador o lo cancelaron).
+    """
+    filas = filas_serializables(resultados)
+    conexion.execute("BEGIN IMMEDIATE")
+    try:
+        if trabajador is not None and conexion.execute(
+            "SELECT 1 FROM trabajos WHERE id = ? AND estado = 'en_curso' AND trabajador = ?", (trabajo_id, trabajador)
+        ).fetchone() is None:
+            conexion.execute("ROLLBACK")
+            return False
+        conexion.executemany(
+            "INSERT OR REPLACE INTO resultados (trabajo_id, posicion, fila) VALUES (?, ?, ?)",
+            ((trabajo_id, posicion, json.dumps(fila, ensure_ascii=False)) for posicion, fila in zip(posiciones, filas))
+        )
+        # Las incidencias de un intento anterior de las mismas posiciones se reemplazan
+        conexion.executemany(
+            "DELETE FROM incidencias WHERE trabajo_id = ? AND posicion = ?",
+            ((trabajo_id, posicion) for posicion in posiciones)
+        )
+        conexion.executemany(
+            "INSERT OR REPLACE INTO incidencias (trabajo_id, posicion, endpoint, estado) VALUES (?, ?, ?, ?)",
+            ((trabajo_id, posicion, endpoint, estado) for posicion, endpoint, estado in incidencias)
+        )
+        conexion.execute("""
+            UPDATE trabajos
+            SET procesados = (SELECT COUNT(*) FROM resultados WHERE trabajo_id = ?), latido = ?
+            WHERE id = ?
+        """, (trabajo_id, time.time(), trabajo_id))
+        conexion.execute("COMMIT")
+    except Exception:
+        conexion.execute("ROLLBACK")
+        raise
+    return True
+
+
+def procesar_tramo(cuits, modo):
+    """
+    Procesa un tramo de CUITs fuera de Streamlit y devuelve (filas del resumen, incidencias), con
+    las incidencias como (cuit, endpoint, estado) para las respuestas que no fueron 200
+    """
+    utils.verificar_periodo(cuits)
+    try:
+        return _procesar_tramo(cuits, modo)
+    finally:
+        utils.volcar_datos_locales()
+
+
+def _procesar_tramo(cuits, modo):
+    if modo == "secuencial":
+        incidencias = []
+        return [utils.procesar_cuit(cuit, incidencias) for cuit in cuits], incidencias
+
+    if modo == "procesos":
+        from procesamiento_paralelo import procesar_cuits_en_procesos
+        columnas, incidencias = asyncio.run(procesar_cuits_en_procesos(cuits))
+        return pd.DataFrame(columnas).to_dict('records'), incidencias
+
+    from cliente_async import procesar_cuits_async
+    return asyncio.run(procesar_cuits_async(cuits))
+
+
+class LatidoEnCurso:
+    """
+    Renueva el latido del trabajo en un hilo mientras se procesa un tramo, para que un tramo
+    lento no lo haga parecer abandonado. Se detiene sola si el trabajo deja de ser del trabajador.
+    """
+
+    def __init__(self, ruta, trabajo_id, trabajador, intervalo=LATIDO_MAXIMO / 4):
+        self.ruta = ruta
+        self.trabajo_id = trabajo_id
+        self.trabajador = trabajador
+        self.intervalo = intervalo
+        self._detener = threading.Event()
+        self._hilo = threading.Thread(target=self._latir, daemon=True)
+
+    def _latir(self):
+        conexion = conectar(self.ruta)
+        try:
+            while not self._detener.wait(self.intervalo):
+                cursor = conexion.execute(
+                    "UPDATE trabajos SET latido = ? WHERE id = ? AND estado = 'en_curso' AND trabajador = ?",
+                    (time.time(), self.trabajo_id, self.trabajador)
+                )
+                registrar_latido(conexion, self.trabajador, self.trabajo_id)
+                if cursor.rowcount == 0:
+                    return
+        finally:
+            conexion.close()
+
+    def __enter__(self):
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *excepcion):
+        self._detener.set()
+        self._hilo.join()
+
+
+def ruta_de_conexion(conexion):
+    """
+    Archivo de la base abierta en una conexión
+    """
+    return conexion.execute("PRAGMA database_list").fetchone()['file']
+
+
+def ejecutar_trabajo(conexion, trabajo, trabajador):
+    """
+    Procesa tramos del trabajo hasta terminarlo, hasta que lo cancelen, hasta que deba ceder el
+    turno a otro usuario o hasta que deje de estar a nombre de este trabajador
+    """
+    trabajo_id = trabajo['id']
+    ruta = ruta_de_conexion(conexion)
+    while True:
+        if conexion.execute(
+            "SELECT 1 FROM trabajos WHERE id = ? AND estado = 'en_curso' AND trabajador = ?", (trabajo_id, trabajador)
+        ).fetchone() is None:
+            # Cancelado o recuperado por otro trabajador mientras se procesaba el tramo anterior
+            return
+
+        tramo = cuits_pendientes(conexion, trabajo_id, TAMANO_TRAMO)
+        if not tramo:
+            conexion.execute(
+                "UPDATE trabajos SET estado = 'terminado', finalizado = ?, latido = ? "
+                "WHERE id = ? AND estado = 'en_curso' AND trabajador = ?",
+                (time.time(), time.time(), trabajo_id, trabajador)
+            )
+            return
+
+        posiciones = [fila['posicion'] for fila in tramo]
+        with LatidoEnCurso(ruta, trabajo_id, trabajador):
+            resultados, incidencias = procesar_tramo([fila['cuit'] for fila in tramo], trabajo['modo'])
+        if not guardar_resultados(conexion, trabajo_id, posiciones, resultados,
+                                  incidencias_por_posicion(tramo, incidencias), trabajador):
+            return
+        registrar_latido(conexion, trabajador, trabajo_id)
+
+        if hay_otros_usuarios_esperando(conexion, trabajo['usuario']):
+            conexion.execute(
+                "UPDATE trabajos SET estado = 'pendiente', trabajador = NULL "
+                "WHERE id = ? AND estado = 'en_curso' AND trabajador = ?",
+                (trabajo_id, trabajador)
+            )
+            return
+
+
+def registrar_latido(conexion, trabajador, trabajo_id=None):
+    conexion.execute(
+        "INSERT OR REPLACE INTO trabajadores (nombre, latido, trabajo_id) VALUES (?, ?, ?)",
+        (trabajador, time.time(), trabajo_id)
+    )
+
+
+def recuperar_trabajos_abandonados(conexion):
+    """
+    Devuelve a la cola los trabajos en curso cuyo trabajador dejó de dar señales.
+    Los CUITs ya procesados no se vuelven a consultar.
+    """
+    cursor = conexion.execute(
+        "UPDATE trabajos SET estado = 'pendiente', trabajador = NULL WHERE estado = 'en_curso' AND latido < ?",
+        (time.time() - LATIDO_MAXIMO,)
+    )
+    return cursor.rowcount
+
+
+def ciclo_trabajador(nombre=None, una_vez=False, ruta=None):
+    """
+    Bucle de un proceso trabajador: toma trabajos de la cola y los procesa
+    """
+    nombre = nombre or f"{socket.gethostname()}:{os.getpid()}"
+    conexion = conectar(ruta)
+    try:
+        while True:
+            registrar_latido(conexion, nombre)
+            recuperar_trabajos_abandonados(conexion)
+            trabajo = tomar_trabajo(conexion, nombre)
+            if trabajo is None:
+                if una_vez:
+                    return
+                time.sleep(ESPERA_SIN_TRABAJOS)
+                continue
+            try:
+                ejecutar_trabajo(conexion, trabajo, nombre)
+            except Exception as e:
+                conexion.execute(
+                    "UPDATE trabajos SET estado = 'error', error = ?, finalizado = ? WHERE id = ? AND trabajador = ?",
+                    (str(e), time.time(), trabajo['id'], nombre)
+                )
+    finally:
+        conexion.execute("DELETE FROM trabajadores WHERE nombre = ?", (nombre,))
+        conexion.close()
+
+
+def estado_trabajo(trabajo_id, ruta=None):
+    """
+    Devuelve el estado de un trabajo como diccionario, o None si no existe. Incluye cuántos CUITs
+    no tuvieron información (404) y cuántos tuvieron consultas fallidas (otros estados).
+    """
+    conexion = conectar(ruta)
+    try:
+        fila = conexion.execute("""
+            SELECT t.*,
+                (SELECT COUNT(DISTINCT posicion) FROM incidencias i
+                 WHERE i.trabajo_id = t.id AND i.estado = '404') AS sin_datos,
+                (SELECT COUNT(DISTINCT posicion) FROM incidencias i
+                 WHERE i.trabajo_id = t.id AND i.estado != '404') AS fallidos
+            FROM trabajos t WHERE t.id = ?
+        """, (trabajo_id,)).fetchone()
+        return dict(fila) if fila is not None else None
+    finally:
+        conexion.close()
+
+
+def incidencias_trabajo(trabajo_id, ruta=None):
+    """
+    Devuelve las incidencias de un trabajo (posición, cuit, endpoint, estado) como DataFrame
+    """
+    conexion = conectar(ruta)
+    try:
+        return pd.read_sql_query("""
+            SELECT i.posicion, c.cuit, i.endpoint, i.estado FROM incidencias i
+            JOIN trabajo_cuits c ON c.trabajo_id = i.trabajo_id AND c.posicion = i.posicion
+            WHERE i.trabajo_id = ?
+            ORDER BY i.posicion, i.endpoint
+        """, conexion, params=(trabajo_id,))
+    finally:
+        conexion.close()
+
+
+def listar_trabajos(usuario=None, limite=20, ruta=None):
+    """
+    Devuelve los últimos trabajos (de un usuario o de todos) como DataFrame
+    """
+    conexion = conectar(ruta)
+    try:
+        consulta = "SELECT id, usuario, estado, modo, total, procesados, creado, finalizado, error FROM trabajos"
+        parametros = ()
+        if usuario:
+            consulta += " WHERE usuario = ?"
+            parametros = (usuario,)
+        return pd.read_sql_query(consulta + " ORDER BY id DESC LIMIT ?", conexion, params=parametros + (limite,))
+    finally:
+        conexion.close()
+
+
+def cancelar_trabajo(trabajo_id, ruta=None):
+    conexion = conectar(ruta)
+    try:
+        conexion.execute(
+            "UPDATE trabajos SET estado = 'cancelado', finalizado = ? WHERE id = ? AND estado IN ('pendiente', 'en_curso')",
+            (time.time(), trabajo_id)
+        )
+    finally:
+        conexion.close()
+
+
+def iterar_resultados(trabajo_id, desde=0, ruta=None):
+    """
+    Genera (posición, fila) de los resultados ya guardados de un trabajo, en orden de entrada,
+    a partir de la posición `desde`
+    """
+    conexion = conectar(ruta)
+    try:
+        cursor = conexion.execute(
+            "SELECT posicion, fila FROM resultados WHERE trabajo_id = ? AND posicion >= ? ORDER BY posicion",
+            (trabajo_id, desde)
+        )
+        for posicion, fila in cursor:
+            yield posicion, json.loads(fila)
+    finally:
+        conexion.close()
+
+
+def resultados_trabajo(trabajo_id, ruta=None):
+    """
+    Devuelve los resultados de un trabajo con el esquema de procesar_lista_cuits
+    """
+    filas = [fila for _, fila in iterar_resultados(trabajo_id, ruta=ruta)]
+    if not filas:
+        return pd.DataFrame(columns=list(utils.TIPOS_RESULTADOS)).astype(utils.TIPOS_RESULTADOS)
+    return pd.DataFrame(filas).astype(utils.TIPOS_RESULTADOS)
+
+
+def hay_trabajadores_activos(ruta=None):
+    conexion = conectar(ruta)
+    try:
+        return conexion.execute(
+            "SELECT 1 FROM trabajadores WHERE latido > ? LIMIT 1", (time.time() - LATIDO_MAXIMO,)
+        ).fetchone() is not None
+    finally:
+        conexion.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subcomandos = parser.add_subparsers(dest='comando', required=True)
+
+    trabajador = subcomandos.add_parser('trabajador', help="Ejecutar procesos trabajadores")
+    trabajador.add_argument('--cantidad', type=int, default=1, help="Cantidad de procesos trabajadores")
+    trabajador.add_argument('--una-vez', action='store_true', help="Terminar cuando la cola quede vacía")
+
+    encolar = subcomandos.add_parser('encolar', help="Encolar un trabajo")
+    entrada = encolar.add_mutually_exclusive_group(required=True)
+    entrada.add_argument('--cuits', help="CUITs separados por comas")
+    entrada.add_argument('--archivo', help="Archivo CSV o Excel con una columna 'CUIT'")
+    encolar.add_argument('--usuario', default=os.environ.get("USER", "cli"))
+    encolar.add_argument('--modo', choices=list(utils.MODOS_CONSULTA), default="async")
+
+    subcomandos.add_parser('listar', help="Listar los últimos trabajos")
+
+    cancelar = subcomandos.add_parser('cancelar', help="Cancelar un trabajo")
+    cancelar.add_argument('trabajo_id', type=int)
+
+    args = parser.parse_args()
+
+    if args.comando == 'trabajador':
+        if args.cantidad == 1:
+            ciclo_trabajador(una_vez=args.una_vez)
+            return
+        procesos = [
+            multiprocessing.Process(target=ciclo_trabajador, kwargs={'una_vez': args.una_vez})
+            for _ in range(args.cantidad)
+        ]
+        for proceso in procesos:
+            proceso.start()
+        for proceso in procesos:
+            proceso.join()
+    elif args.comando == 'encolar':
+        if args.archivo:
+            df_cuits = pd.read_csv(args.archivo) if args.archivo.endswith('.csv') else pd.read_excel(args.archivo)
+            cuits_texto = ','.join(df_cuits['CUIT'].astype(str).tolist())
+        else:
+            cuits_texto = args.cuits
+        trabajo_id, invalidos = encolar_trabajo(cuits_texto, args.usuario, args.modo)
+        for cuit in invalidos:
+            print(f"CUIT/CUIL/CDI inválido ignorado: {cuit}")
+        print(f"Trabajo encolado: {trabajo_id}" if trabajo_id else "No se encontraron CUITs válidos")
+    elif args.comando == 'listar':
+        print(listar_trabajos().to_string(index=False))
+    elif args.comando == 'cancelar':
+        cancelar_trabajo(args.trabajo_id)
+
+
+if __name__ == '__main__':
+    main()
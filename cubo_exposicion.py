@@ -0,0 +1,248 @@
+"""
+Cubo de exposición de cada cartera por entidad × situación × período.
+
+Al terminar cada consulta múltiple, las deudas históricas de la cartera guardadas en el almacén se
+agregan una sola vez en dos arreglos densos (monto total y cantidad de deudores por entidad,
+situación y período) y se guardan en datos/cubos/<cartera>.npz. La página de consulta múltiple
+corta y pivotea ese cubo, que tiene pocas decenas de entidades, 6 situaciones y 24 períodos, sin
+volver a las filas del almacén en cada cambio de filtro.
+
+    python cubo_exposicion.py construir --archivo cartera.csv
+    python cubo_exposicion.py pivot <cartera> --filas entidad --columnas periodo --situacion-minima 3
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import utils
+
+DIRECTORIO_CUBOS = os.path.join(utils.DIRECTORIO_DATOS, "cubos")
+
+# Ejes del cubo y su nombre para mostrar
+DIMENSIONES = {'entidad': 'Entidad', 'situacion': 'Situación', 'periodo': 'Período'}
+
+# Medidas del cubo y su nombre para mostrar
+MEDIDAS = {'monto': 'Monto (miles $)', 'deudores': 'Deudores'}
+
+SITUACIONES = list(range(1, 7))
+
+
+class CuboExposicion:
+    """
+    Monto y cantidad de deudores por entidad × situación × período de una cartera. Al sumar sobre
+    varias entidades, un deudor con deudas en dos entidades cuenta dos veces.
+    """
+
+    def __init__(self, entidades, periodos, monto, deudores, cartera=None, creado=None):
+        self.entidades = np.asarray(entidades, dtype=np.str_)
+        self.periodos = [str(periodo) for periodo in periodos]
+        self.monto = monto
+        self.deudores = deudores
+        self.cartera = cartera
+        self.creado = creado if creado is not None else time.time()
+
+    @classmethod
+    def desde_agregado(cls, df, cartera=None):
+        """
+        Arma el cubo a partir de filas ya agregadas (entidad, situacion, periodo, monto, deudores)
+        """
+        df = df[df['situacion'].between(1, 6)]
+        codigos_entidad, entidades = pd.factorize(df['entidad'], sort=True)
+        codigos_periodo, periodos = pd.factorize(df['periodo'].astype(str), sort=True)
+        forma = (len(entidades), len(SITUACIONES), len(periodos))
+
+        monto = np.zeros(forma, dtype=np.float64)
+        deudores = np.zeros(forma, dtype=np.int32)
+        posicion = (codigos_entidad, df['situacion'].to_numpy(dtype=np.intp) - 1, codigos_periodo)
+        np.add.at(monto, posicion, df['monto'].to_numpy(dtype=np.float64))
+        np.add.at(deudores, posicion, df['deudores'].to_numpy(dtype=np.int32))
+        return cls(entidades, periodos, monto, deudores, cartera)
+
+    @property
+    def vacio(self):
+        """
+        Si el cubo no tiene datos (la cartera no tiene deudas históricas en el almacén)
+        """
+        return self.monto.size == 0
+
+    def etiquetas(self, dimension):
+        """
+        Valores de un eje del cubo
+        """
+        if dimension == 'entidad':
+            return list(self.entidades)
+        if dimension == 'situacion':
+            return SITUACIONES
+        return self.periodos
+
+    def rebanar(self, entidades=None, situaciones=None, desde=None, hasta=None):
+        """
+        Sub-cubo con las entidades, situaciones y rango de períodos indicados (None = todos)
+        """
+        indices_entidad = np.arange(len(self.entidades)) if entidades is None else \
+            np.flatnonzero(np.isin(self.entidades, list(entidades)))
+        periodos = np.array(self.periodos)
+        en_rango = np.ones(len(periodos), dtype=bool)
+        if desde is not None:
+            en_rango &= periodos >= str(desde)
+        if hasta is not None:
+            en_rango &= periodos <= str(hasta)
+        indices_periodo = np.flatnonzero(en_rango)
+
+        monto = self.monto[indices_entidad][:, :, indices_periodo]
+        deudores = self.deudores[indices_entidad][:, :, indices_periodo]
+        if situaciones is not None:
+            # El eje de situaciones se conserva completo, con ceros en las no elegidas
+            excluidas = [situacion - 1 for situacion in SITUACIONES if situacion not in set(situaciones)]
+            monto[:, excluidas, :] = 0
+            deudores[:, excluidas, :] = 0
+        return CuboExposicion(self.entidades[indices_entidad], periodos[indices_periodo], monto, deudores,
+                              self.cartera, self.creado)
+
+    def pivotear(self, filas, columnas=None, medida='monto'):
+        """
+        Suma la medida sobre los ejes que no se muestran: una serie por filas o una tabla filas × columnas
+        """
+        ejes = list(DIMENSIONES)
+        valores = self.monto if medida == 'monto' else self.deudores
+        mostrados = [filas] if columnas is None else [filas, columnas]
+        if len(set(mostrados)) != len(mostrados):
+            raise ValueError("Filas y columnas deben ser ejes distintos")
+
+        sumados = tuple(eje for eje, nombre in enumerate(ejes) if nombre not in mostrados)
+        tabla = valores.sum(axis=sumados)
+        indice = pd.Index(self.etiquetas(filas), name=DIMENSIONES[filas])
+        if columnas is None:
+            return pd.Series(tabla, index=indice, name=MEDIDAS[medida])
+        if ejes.index(filas) > ejes.index(columnas):
+            tabla = tabla.T
+        return pd.DataFrame(tabla, index=indice, columns=pd.Index(self.etiquetas(columnas), name=DIMENSIONES[columnas]))
+
+    def tabla(self, dimension):
+        """
+        Deudores y monto por valor de un eje, ordenados por monto
+        """
+        df = pd.concat([self.pivotear(dimension, medida='deudores'), self.pivotear(dimension)], axis=1)
+        df = df[df[MEDIDAS['deudores']] > 0]
+        if dimension == 'entidad':
+            df = df.sort_values(MEDIDAS['monto'], ascending=False)
+        return df.reset_index()
+
+    def concentracion(self):
+        """
+        Concentración del monto entre entidades: participación de la mayor, de las cinco mayores e
+        índice de Herfindahl-Hirschman (0 a 10.000)
+        """
+        montos = np.sort(self.monto.sum(axis=(1, 2)))[::-1]
+        total = montos.sum()
+        if total <= 0:
+            return {'entidades': 0, 'mayor': 0.0, 'cinco_mayores': 0.0, 'hhi': 0.0}
+        participaciones = montos / total
+        return {
+            'entidades': int((montos > 0).sum()),
+            'mayor': float(participaciones[0]),
+            'cinco_mayores': float(participaciones[:5].sum()),
+            'hhi': float((participaciones ** 2).sum() * 10000)
+        }
+
+    def guardar(self, ruta):
+        """
+        Guarda el cubo en un .npz (escritura atómica)
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+        temporal = ruta + ".tmp"
+        with open(temporal, "wb") as archivo:
+            np.savez_compressed(
+                archivo, entidades=self.entidades, periodos=np.array(self.periodos, dtype=np.str_),
+                monto=self.monto, deudores=self.deudores, cartera=np.str_(self.cartera or ""),
+                creado=np.float64(self.creado)
+            )
+        os.replace(temporal, ruta)
+        return ruta
+
+    @classmethod
+    def cargar(cls, ruta):
+        """
+        Carga un cubo guardado con guardar
+        """
+        with np.load(ruta, allow_pickle=False) as datos:
+            return cls(datos['entidades'], datos['periodos'], datos['monto'], datos['deudores'],
+                       str(datos['cartera']) or None, float(datos['creado']))
+
+
+def ruta_cubo(cartera, directorio=None):
+    """
+    Archivo del cubo de una cartera
+    """
+    return os.path.join(directorio or DIRECTORIO_CUBOS, f"{cartera}.npz")
+
+
+def construir_cubo(cuits, ruta_almacen=None):
+    """
+    Agrega en el almacén las deudas históricas de la cartera y arma su cubo
+    """
+    # Import diferido: snapshots y almacen importan utils
+    import almacen
+    from snapshots import identificar_cartera
+    filtro, parametros = almacen._filtro_cuits(cuits)
+    df = almacen.consultar(
+        "SELECT entidad, situacion, periodo, SUM(monto) AS monto, COUNT(*) AS deudores "
+        f"FROM historicas WHERE 1 = 1{filtro} GROUP BY entidad, situacion, periodo",
+        parametros, ruta_almacen
+    )
+    return CuboExposicion.desde_agregado(df, identificar_cartera(np.asarray(cuits, dtype=np.int64)))
+
+
+def guardar_cubo_cartera(cuits, directorio=None):
+    """
+    Arma y guarda el cubo de la cartera; se llama al terminar cada consulta múltiple
+    """
+    cubo = construir_cubo(cuits)
+    return cubo.guardar(ruta_cubo(cubo.cartera, directorio))
+
+
+def cubo_cartera(cuits, directorio=None):
+    """
+    Cubo guardado de la cartera, o uno nuevo armado desde el almacén si todavía no existe
+    """
+    from snapshots import identificar_cartera
+    ruta = ruta_cubo(identificar_cartera(np.asarray(cuits, dtype=np.int64)), directorio)
+    if os.path.exists(ruta):
+        return CuboExposicion.cargar(ruta)
+    return CuboExposicion.cargar(guardar_cubo_cartera(cuits, directorio))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subcomandos = parser.add_subparsers(dest='comando', required=True)
+
+    construir = subcomandos.add_parser('construir', help="Arma el cubo de una cartera desde el almacén")
+    construir.add_argument('--archivo', required=True, help="CSV o Excel con una columna CUIT")
+
+    pivot = subcomandos.add_parser('pivot', help="Tabla dinámica sobre el cubo de una cartera")
+    pivot.add_argument('cartera', help="Identificador de la cartera (nombre del archivo en datos/cubos)")
+    pivot.add_argument('--filas', choices=list(DIMENSIONES), default='entidad')
+    pivot.add_argument('--columnas', choices=list(DIMENSIONES))
+    pivot.add_argument('--medida', choices=list(MEDIDAS), default='monto')
+    pivot.add_argument('--situacion-minima', type=int, default=1)
+    pivot.add_argument('--desde', help="Período AAAAMM inicial")
+    pivot.add_argument('--hasta', help="Período AAAAMM final")
+    args = parser.parse_args()
+
+    if args.comando == 'construir':
+        df_cuits = pd.read_csv(args.archivo) if args.archivo.endswith('.csv') else pd.read_excel(args.archivo)
+        cuits, _ = utils.separar_cuits(','.join(df_cuits['CUIT'].astype(str).tolist()))
+        print(guardar_cubo_cartera(cuits))
+        return
+
+    cubo = CuboExposicion.cargar(ruta_cubo(args.cartera)).rebanar(
+        situaciones=range(args.situacion_minima, 7), desde=args.desde, hasta=args.hasta
+    )
+    print(cubo.pivotear(args.filas, args.columnas, args.medida).to_string())
+
+
+if __name__ == '__main__':
+    main()
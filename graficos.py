@@ -0,0 +1,376 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+from utils import SITUACION_COLORS, SITUACION_MAP
+
+# Cantidad máxima de figuras que se mantienen en memoria
+MAX_FIGURAS_CACHE = 64
+
+# Cantidad máxima de puntos que se envían al navegador por gráfico de evolución
+MAX_PUNTOS_GRAFICO = 2000
+
+# Agrupaciones de períodos disponibles para los gráficos de evolución
+FRECUENCIAS_PERIODO = {
+    "Mensual": None,
+    "Trimestral": "Q",
+    "Anual": "Y"
+}
+
+# Caché de figuras compartida por todas las sesiones, con desalojo LRU
+_cache_figuras = OrderedDict()
+_cache_lock = threading.Lock()
+
+def hash_datos(*datos):
+    """
+    Calcula un hash del contenido de los datos de entrada de un gráfico.
+    Los DataFrames se hashean por valores, índice, columnas y tipos; el resto por su representación.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for dato in datos:
+        if isinstance(dato, pd.DataFrame):
+            h.update(pd.util.hash_pandas_object(dato, index=True).to_numpy().tobytes())
+            h.update(repr(list(dato.columns)).encode('utf-8'))
+            h.update(repr(list(dato.dtypes.astype(str))).encode('utf-8'))
+        else:
+            h.update(repr(dato).encode('utf-8'))
+    return h.hexdigest()
+
+def figura_cacheada(constructor, *datos, **opciones):
+    """
+    Devuelve la figura generada por el constructor, reutilizándola si los datos de entrada no cambiaron.
+    La clave combina el nombre del constructor con el hash del contenido de los datos y las opciones.
+    """
+    clave = (constructor.__name__, hash_datos(*datos, sorted(opciones.items())))
+
+    with _cache_lock:
+        if clave in _cache_figuras:
+            _cache_figuras.move_to_end(clave)
+            return _cache_figuras[clave]
+
+    fig = constructor(*datos, **opciones)
+
+    with _cache_lock:
+        _cache_figuras[clave] = fig
+        while len(_cache_figuras) > MAX_FIGURAS_CACHE:
+            _cache_figuras.popitem(last=False)
+
+    return fig
+
+def limpiar_cache_figuras():
+    """
+    Vacía la caché de figuras
+    """
+    with _cache_lock:
+        _cache_figuras.clear()
+
+def agrupar_top_n(df, columna_serie, top_n, columna_valor='Monto', etiqueta_otros='Otros'):
+    """
+    Conserva las top_n series con mayor monto total y agrupa el resto en una serie "Otros"
+    """
+    totales = df.groupby(columna_serie)[columna_valor].sum()
+    if len(totales) <= top_n:
+        return df
+
+    principales = totales.nlargest(top_n).index
+    series = df[columna_serie].where(df[columna_serie].isin(principales), etiqueta_otros)
+
+    return (
+        df.assign(**{columna_serie: series})
+        .groupby(['FechaPeriodo', columna_serie], as_index=False, sort=False)[columna_valor]
+        .sum()
+    )
+
+def agrupar_periodos(df, columna_serie, frecuencia, columna_valor='Monto'):
+    """
+    Agrupa los períodos mensuales en baldes (trimestral 'Q' o anual 'Y') usando el saldo promedio del balde
+    """
+    baldes = df['FechaPeriodo'].dt.to_period(frecuencia).dt.to_timestamp()
+
+    return (
+        df.assign(FechaPeriodo=baldes)
+        .groupby(['FechaPeriodo', columna_serie], as_index=False)[columna_valor]
+        .mean()
+    )
+
+def lttb(x, y, umbral):
+    """
+    Largest-Triangle-Three-Buckets: devuelve los índices de los puntos a conservar para
+    representar la serie (x, y) con a lo sumo `umbral` puntos preservando su forma visual.
+    x debe estar ordenado de forma creciente.
+    """
+    n = len(x)
+    if umbral >= n or umbral < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    # Baldes intermedios (el primer y el último punto siempre se conservan)
+    bordes = 1 + (np.arange(umbral - 1) * (n - 2)) // (umbral - 2)
+    indices = np.empty(umbral, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+
+    anterior = 0
+    for i in range(umbral - 2):
+        inicio, fin = bordes[i], bordes[i + 1]
+
+        # Promedio del balde siguiente como tercer vértice del triángulo
+        siguiente_inicio = fin
+        siguiente_fin = bordes[i + 2] if i + 2 < len(bordes) else n
+        x_prom = x[siguiente_inicio:siguiente_fin].mean()
+        y_prom = y[siguiente_inicio:siguiente_fin].mean()
+
+        # Área del triángulo para cada candidato del balde actual
+        areas = np.abs(
+            (x[anterior] - x_prom) * (y[inicio:fin] - y[anterior])
+            - (x[anterior] - x[inicio:fin]) * (y_prom - y[anterior])
+        )
+        anterior = inicio + int(np.argmax(areas))
+        indices[i + 1] = anterior
+
+    return indices
+
+def reducir_serie_temporal(df, columna_serie, max_puntos=MAX_PUNTOS_GRAFICO, top_n=None, frecuencia=None,
+                           columna_valor='Monto'):
+    """
+    Limita la cantidad de puntos de un gráfico de evolución antes de enviarlo al navegador.
+    Aplica, en orden: top-N series más "Otros", agrupación de períodos y LTTB por serie.
+    """
+    if df.empty:
+        return df
+
+    if top_n:
+        df = agrupar_top_n(df, columna_serie, top_n, columna_valor)
+
+    if frecuencia:
+        df = agrupar_periodos(df, columna_serie, frecuencia, columna_valor)
+
+    if len(df) <= max_puntos:
+        return df.sort_values('FechaPeriodo', kind='stable', ignore_index=True)
+
+    # Repartir el presupuesto de puntos entre las series y submuestrear cada una con LTTB
+    df = df.sort_values([columna_serie, 'FechaPeriodo'])
+    puntos_por_serie = max(3, max_puntos // df[columna_serie].nunique())
+
+    partes = []
+    for _, df_serie in df.groupby(columna_serie, sort=False):
+        indices = lttb(
+            df_serie['FechaPeriodo'].to_numpy().astype('datetime64[s]').astype(np.int64),
+            df_serie[columna_valor].to_numpy(),
+            puntos_por_serie
+        )
+        partes.append(df_serie.iloc[indices])
+
+    return pd.concat(partes).sort_values('FechaPeriodo', kind='stable', ignore_index=True)
+
+def figura_evolucion_situacion(df_evolucion):
+    """
+    Gráfico de líneas con la evolución de la deuda por situación crediticia
+    """
+    fig = px.line(
+        df_evolucion,
+        x='FechaPeriodo',
+        y='Monto',
+        color='SituaciónTexto',
+        markers=True,
+        title="Evolución de Deudas por Situación Crediticia",
+        labels={
+            'FechaPeriodo': 'Período',
+            'Monto': 'Monto Total (miles de $)',
+            'SituaciónTexto': 'Situación'
+        },
+        height=500
+    )
+    fig.update_layout(
+        xaxis_title="Período",
+        yaxis_title="Monto Total (miles de $)",
+        legend_title="Situación Crediticia",
+        hovermode="x unified"
+    )
+    fig.update_traces(hovertemplate='%{y:,.2f} miles de $<extra></extra>')
+    return fig
+
+def figura_evolucion_entidad(df_evolucion_entidad):
+    """
+    Gráfico de líneas con la evolución de la deuda por entidad financiera
+    """
+    fig = px.line(
+        df_evolucion_entidad,
+        x='FechaPeriodo',
+        y='Monto',
+        color='Entidad',
+        markers=True,
+        title="Evolución de Deudas por Entidad",
+        labels={
+            'FechaPeriodo': 'Período',
+            'Monto': 'Monto Total (miles de $)',
+            'Entidad': 'Entidad Financiera'
+        },
+        height=500
+    )
+    fig.update_layout(
+        xaxis_title="Período",
+        yaxis_title="Monto Total (miles de $)",
+        legend_title="Entidad Financiera",
+        hovermode="x unified"
+    )
+    fig.update_traces(hovertemplate='%{y:,.2f} miles de $<extra></extra>')
+    return fig
+
+def figura_deuda_por_situacion(df_situacion):
+    """
+    Gráfico de barras con la deuda total por situación crediticia.
+    Usa una única traza con un arreglo de colores en lugar de una traza por fila.
+    """
+    colores = df_situacion['Situación'].astype(int).map(SITUACION_COLORS)
+
+    fig = go.Figure(go.Bar(
+        x=df_situacion['Descripción'],
+        y=df_situacion['Monto'],
+        marker_color=colores.to_numpy(),
+        customdata=df_situacion['Situación'].to_numpy(),
+        hovertemplate='Situación %{customdata}<br>%{y:,.2f} miles de $<extra></extra>'
+    ))
+    fig.update_layout(
+        title="Deuda por Situación Crediticia",
+        xaxis_title="Situación",
+        yaxis_title="Monto Total (miles de $)",
+        xaxis_tickangle=-45,
+        height=500,
+        barmode='group'
+    )
+    return fig
+
+def agregar_entidad_situacion(df_entidad):
+    """
+    Agrega la deuda por situación y entidad en una sola pasada, ordenada por situación.
+    Devuelve los arreglos de situaciones, entidades y montos, y los límites de cada situación
+    para poder cortar las trazas sin aplicar una máscara booleana por situación.
+    """
+    agregado = df_entidad.groupby(['Situación', 'Entidad'], sort=True)['Monto'].sum()
+
+    situaciones = agregado.index.get_level_values('Situación').to_numpy()
+    entidades = agregado.index.get_level_values('Entidad').to_numpy()
+    montos = agregado.to_numpy()
+
+    # Posiciones donde empieza cada situación dentro de los arreglos ordenados
+    inicios = np.flatnonzero(np.r_[True, situaciones[1:] != situaciones[:-1]])
+    limites = np.r_[inicios, len(situaciones)]
+
+    return situaciones, entidades, montos, limites
+
+def figura_deuda_por_entidad(df_entidad):
+    """
+    Gráfico de barras apiladas con la deuda por entidad y situación crediticia.
+    Se construye desde una única agregación, con una traza por situación (como máximo seis).
+    """
+    situaciones, entidades, montos, limites = agregar_entidad_situacion(df_entidad)
+
+    trazas = []
+    for inicio, fin in zip(limites[:-1], limites[1:]):
+        situacion = int(situaciones[inicio])
+        trazas.append(go.Bar(
+            x=entidades[inicio:fin],
+            y=montos[inicio:fin],
+            name=f"Situación {situacion}: {SITUACION_MAP.get(situacion, 'Desconocida')}",
+            marker_color=SITUACION_COLORS.get(situacion, "#CCCCCC")
+        ))
+
+    fig = go.Figure(trazas)
+    fig.update_layout(
+        title="Deuda por Entidad y Situación Crediticia",
+        xaxis_title="Entidad Financiera",
+        yaxis_title="Monto Total (miles de $)",
+        xaxis_tickangle=-45,
+        height=500,
+        barmode='stack',
+        legend_title="Situación Crediticia"
+    )
+    return fig
+
+def figura_migracion(df_tasas):
+    """
+    Mapa de calor con las tasas de migración entre situaciones (filas: situación de origen)
+    """
+    tasas = df_tasas.to_numpy()
+    fig = go.Figure(go.Heatmap(
+        z=tasas,
+        x=df_tasas.columns.astype(str),
+        y=df_tasas.index.astype(str),
+        text=np.char.mod('%.1f%%', tasas * 100),
+        texttemplate='%{text}',
+        colorscale='Reds',
+        zmin=0,
+        zmax=1,
+        hovertemplate='De situación %{y} a %{x}: %{text}<extra></extra>'
+    ))
+    fig.update_layout(
+        title="Migración entre Situaciones (mes a mes)",
+        xaxis_title="Situación del mes siguiente",
+        yaxis_title="Situación de origen",
+        yaxis_autorange='reversed',
+        height=500
+    )
+    return fig
+
+def figura_distribucion_situacion(categoria_counts):
+    """
+    Gráfico de torta con la distribución de CUITs por situación crediticia
+    """
+    return px.pie(
+        categoria_counts,
+        values='Cantidad',
+        names='Descripción',
+        title="Distribución de CUITs por Situación Crediticia",
+        color='Situación',
+        color_discrete_map={
+            0: "#CCCCCC",  # Gris para sin datos
+            1: "#4CAF50",  # Verde
+            2: "#8BC34A",  # Verde claro
+            3: "#FFC107",  # Amarillo
+            4: "#FF9800",  # Naranja
+            5: "#F44336",  # Rojo
+            6: "#B71C1C"   # Rojo oscuro
+        }
+    )
+
+def figura_irregularidades(df_analisis):
+    """
+    Gráfico de barras con la cantidad de CUITs por tipo de irregularidad
+    """
+    return px.bar(
+        df_analisis,
+        x='Categoría',
+        y='Cantidad',
+        title="Análisis de Situaciones Irregulares",
+        color='Categoría',
+        color_discrete_map={
+            "Sin irregularidades": "#4CAF50",
+            "Con irregularidades solo actuales": "#FFC107",
+            "Con irregularidades solo históricas": "#FF9800",
+            "Con irregularidades actuales e históricas": "#F44336"
+        }
+    )
+
+def figura_cheques(df_cheques_analisis):
+    """
+    Gráfico de torta con la distribución de CUITs por cheques rechazados
+    """
+    return px.pie(
+        df_cheques_analisis,
+        values='Cantidad',
+        names='Categoría',
+        title="Distribución de CUITs por Cheques Rechazados",
+        color='Categoría',
+        color_discrete_map={
+            "Sin cheques rechazados": "#4CAF50",
+            "Con cheques rechazados": "#F44336"
+        }
+    )
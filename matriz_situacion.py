@@ -0,0 +1,478 @@
+"""
+Matriz densa CUIT × período con la historia de situación de toda la cartera.
+
+MatrizSituacion guarda, para cada CUIT (fila) y cada mes (columna), la peor situación informada
+por cualquier entidad en un arreglo int8 (0 = sin datos) y el monto total en un arreglo float64.
+Las columnas son meses consecutivos, así que "los últimos 6 meses" es una rebanada, y las preguntas
+sobre toda la cartera ("irregular en alguno de los últimos 6 meses", "primer mes de deterioro", la
+matriz de migración entre situaciones) son una sola reducción vectorizada sobre las filas.
+
+La matriz se arma de a un CUIT a partir de las respuestas de Deudas/Historicas (utils entrega cada
+tabla histórica a MATRIZ_SITUACION.agregar) o de una vez desde el almacén local, y se puede guardar
+en disco y abrir con memoria mapeada:
+
+    python matriz_situacion.py construir
+    python matriz_situacion.py irregulares --meses 6 --salida irregulares.csv
+    python matriz_situacion.py deterioro --situacion-minima 3
+    python matriz_situacion.py migracion --desde 202501 --hasta 202512 --ponderar
+"""
+import argparse
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+import utils
+
+DIRECTORIO_MATRIZ = os.path.join(utils.DIRECTORIO_DATOS, "matriz_situacion")
+
+# Filas reservadas al crear la matriz; la capacidad se duplica al llenarse
+FILAS_INICIALES = 1024
+
+# Situación a partir de la cual se considera irregular (igual que "Tiene Situación Irregular")
+SITUACION_IRREGULAR = 2
+
+# Situaciones informadas por el BCRA (filas y columnas de la matriz de transiciones)
+SITUACIONES = list(range(1, 7))
+
+
+def meses_de_periodos(periodos):
+    """
+    Convierte períodos AAAAMM (texto o enteros) en meses absolutos (año * 12 + mes - 1)
+    """
+    # Hay pocos períodos distintos: se convierten solo esos y se expanden con los códigos
+    codigos, unicos = pd.factorize(np.asarray(periodos).ravel())
+    valores = np.asarray(unicos).astype(np.int64)
+    return ((valores // 100) * 12 + valores % 100 - 1)[codigos]
+
+
+def periodo_de_mes(mes):
+    """
+    Período AAAAMM de un mes absoluto
+    """
+    return f"{mes // 12:04d}{mes % 12 + 1:02d}"
+
+
+class MatrizSituacion:
+    """
+    Peor situación y monto total por CUIT × mes, con los mapas de CUIT a fila y de período a columna.
+    Cada respuesta histórica de un CUIT reemplaza los meses que informa y conserva los demás.
+    """
+
+    def __init__(self):
+        self.mes_inicial = None
+        self.cuits = np.empty(0, dtype=np.int64)
+        self._filas = {}
+        self._cantidad = 0
+        self._situacion = np.zeros((0, 0), dtype=np.int8)
+        self._monto = np.zeros((0, 0), dtype=np.float64)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._cantidad
+
+    @property
+    def situacion(self):
+        """
+        Matriz int8 de peor situación (filas = CUITs, columnas = períodos; 0 = sin datos)
+        """
+        return self._situacion[:self._cantidad]
+
+    @property
+    def monto(self):
+        """
+        Matriz float64 con el monto total informado por CUIT y período
+        """
+        return self._monto[:self._cantidad]
+
+    @property
+    def periodos(self):
+        """
+        Períodos AAAAMM de las columnas, del más antiguo al más reciente
+        """
+        if self.mes_inicial is None:
+            return []
+        return [periodo_de_mes(self.mes_inicial + columna) for columna in range(self._situacion.shape[1])]
+
+    def columna(self, periodo):
+        """
+        Columna de un período AAAAMM, o None si está fuera de la matriz
+        """
+        if self.mes_inicial is None:
+            return None
+        columna = int(meses_de_periodos([periodo])[0]) - self.mes_inicial
+        return columna if 0 <= columna < self._situacion.shape[1] else None
+
+    def filas_de(self, cuits):
+        """
+        Fila de cada CUIT (-1 si no está en la matriz)
+        """
+        return np.fromiter((self._filas.get(int(cuit), -1) for cuit in cuits), dtype=np.int64)
+
+    def _escribible(self):
+        """
+        Copia a memoria las matrices abiertas con memoria mapeada antes de modificarlas
+        """
+        if isinstance(self._situacion, np.memmap) or not self._situacion.flags.writeable:
+            self._situacion = np.array(self._situacion)
+            self._monto = np.array(self._monto)
+            self.cuits = np.array(self.cuits)
+
+    def _cubrir(self, mes_minimo, mes_maximo):
+        """
+        Amplía las columnas para que la matriz cubra los meses indicados
+        """
+        if self.mes_inicial is None:
+            inicio, fin = mes_minimo, mes_maximo
+        else:
+            inicio = min(mes_minimo, self.mes_inicial)
+            fin = max(mes_maximo, self.mes_inicial + self._situacion.shape[1] - 1)
+            if inicio == self.mes_inicial and fin - inicio + 1 == self._situacion.shape[1]:
+                return
+        filas = self._situacion.shape[0]
+        situacion = np.zeros((filas, fin - inicio + 1), dtype=np.int8)
+        monto = np.zeros((filas, fin - inicio + 1), dtype=np.float64)
+        if self.mes_inicial is not None:
+            desplazamiento = self.mes_inicial - inicio
+            ancho = self._situacion.shape[1]
+            situacion[:, desplazamiento:desplazamiento + ancho] = self._situacion
+            monto[:, desplazamiento:desplazamiento + ancho] = self._monto
+        self.mes_inicial = inicio
+        self._situacion, self._monto = situacion, monto
+
+    def _asignar_filas(self, cuits):
+        """
+        Fila de cada CUIT, agregando al final los que no estaban (y ampliando la capacidad)
+        """
+        inversa, unicos = pd.factorize(cuits)
+        filas_unicos = self.filas_de(unicos)
+        nuevos = unicos[filas_unicos < 0]
+        if len(nuevos):
+            cantidad = self._cantidad + len(nuevos)
+            if cantidad > self._situacion.shape[0]:
+                capacidad = max(FILAS_INICIALES, self._situacion.shape[0])
+                while capacidad < cantidad:
+                    capacidad *= 2
+                ancho = self._situacion.shape[1]
+                self._situacion = np.concatenate(
+                    [self._situacion, np.zeros((capacidad - self._situacion.shape[0], ancho), dtype=np.int8)]
+                )
+                self._monto = np.concatenate(
+                    [self._monto, np.zeros((capacidad - self._monto.shape[0], ancho), dtype=np.float64)]
+                )
+            self.cuits = np.concatenate([self.cuits[:self._cantidad], nuevos])
+            for desplazamiento, cuit in enumerate(nuevos.tolist()):
+                self._filas[cuit] = self._cantidad + desplazamiento
+            filas_unicos[filas_unicos < 0] = np.arange(self._cantidad, cantidad)
+            self._cantidad = cantidad
+        return filas_unicos[inversa]
+
+    def agregar_lote(self, cuits, periodos, situaciones, montos):
+        """
+        Incorpora filas de deudas históricas (un elemento por CUIT, período y entidad): cada celda
+        CUIT × período informada toma la peor situación y la suma de los montos de sus entidades
+        """
+        cuits = np.asarray(cuits, dtype=np.int64)
+        if not len(cuits):
+            return
+        meses = meses_de_periodos(periodos)
+        situaciones = np.asarray(situaciones, dtype=np.int8)
+        montos = np.asarray(montos, dtype=np.float64)
+
+        with self._lock:
+            self._escribible()
+            self._cubrir(int(meses.min()), int(meses.max()))
+            filas = self._asignar_filas(cuits)
+            celdas = filas * self._situacion.shape[1] + (meses - self.mes_inicial)
+
+            # Ordenadas por celda y situación (0 a 6, entra en 3 bits): la última de cada celda es la peor
+            orden = np.argsort(celdas * 8 + situaciones)
+            celdas, situaciones, montos = celdas[orden], situaciones[orden], montos[orden]
+            ultima = np.empty(len(celdas), dtype=bool)
+            ultima[:-1] = celdas[1:] != celdas[:-1]
+            ultima[-1] = True
+            grupo = np.cumsum(np.concatenate([[True], ultima[:-1]])) - 1
+
+            self._situacion.reshape(-1)[celdas[ultima]] = situaciones[ultima]
+            self._monto.reshape(-1)[celdas[ultima]] = np.bincount(grupo, weights=montos)
+
+    def agregar(self, cuit, periodos, situaciones, montos):
+        """
+        Incorpora la historia de un CUIT (arreglos de período, situación y monto por entidad)
+        """
+        self.agregar_lote(np.full(len(periodos), int(cuit), dtype=np.int64), periodos, situaciones, montos)
+
+    def agregar_historicas(self, datos_historicos):
+        """
+        Incorpora una respuesta de Deudas/Historicas tal como la devuelve la API
+        """
+        if not datos_historicos or 'results' not in datos_historicos:
+            return
+        resultados = datos_historicos['results']
+        filas = [
+            (periodo['periodo'], entidad['situacion'], entidad['monto'])
+            for periodo in resultados.get('periodos') or []
+            for entidad in periodo.get('entidades') or []
+        ]
+        if filas:
+            periodos, situaciones, montos = zip(*filas)
+            self.agregar(resultados['identificacion'], periodos, situaciones, montos)
+
+    def submatriz(self, cuits):
+        """
+        Nueva matriz con las filas de los CUITs indicados, en ese orden (filas vacías para los que
+        no están)
+        """
+        cuits = np.asarray(cuits, dtype=np.int64)
+        filas = self.filas_de(cuits)
+        presentes = filas >= 0
+        ancho = self._situacion.shape[1]
+
+        sub = MatrizSituacion()
+        sub.mes_inicial = self.mes_inicial
+        sub._situacion = np.zeros((len(cuits), ancho), dtype=np.int8)
+        sub._monto = np.zeros((len(cuits), ancho), dtype=np.float64)
+        sub._situacion[presentes] = self._situacion[filas[presentes]]
+        sub._monto[presentes] = self._monto[filas[presentes]]
+        sub.cuits = cuits.copy()
+        sub._filas = {cuit: fila for fila, cuit in enumerate(cuits.tolist())}
+        sub._cantidad = len(cuits)
+        return sub
+
+    def _rango(self, meses=None, hasta=None):
+        """
+        Rebanada de columnas de los últimos meses (hasta el período indicado, o el último)
+        """
+        fin = self._situacion.shape[1]
+        if hasta is not None:
+            columna = self.columna(hasta)
+            if columna is None:
+                raise ValueError(f"El período {hasta} no está en la matriz")
+            fin = columna + 1
+        inicio = 0 if meses is None else max(fin - meses, 0)
+        return slice(inicio, fin)
+
+    def peor_situacion(self, meses=None, hasta=None):
+        """
+        Peor situación de cada CUIT en los últimos meses (0 si no tiene datos)
+        """
+        if self._situacion.shape[1] == 0:
+            return np.zeros(self._cantidad, dtype=np.int8)
+        return self.situacion[:, self._rango(meses, hasta)].max(axis=1)
+
+    def irregulares_en_ultimos(self, meses=6, situacion_minima=SITUACION_IRREGULAR, hasta=None):
+        """
+        Si cada CUIT estuvo en situación situacion_minima o peor en alguno de los últimos meses
+        """
+        return self.peor_situacion(meses, hasta) >= situacion_minima
+
+    def meses_irregular(self, meses=None, situacion_minima=SITUACION_IRREGULAR, hasta=None):
+        """
+        Cantidad de meses en situación situacion_minima o peor de cada CUIT
+        """
+        return (self.situacion[:, self._rango(meses, hasta)] >= situacion_minima).sum(axis=1)
+
+    def primer_deterioro(self, situacion_minima=SITUACION_IRREGULAR):
+        """
+        Columna del primer mes en que cada CUIT pasó a situación situacion_minima o peor desde un
+        mes mejor o sin datos (-1 si nunca). Si ya lo estaba en el primer mes, se toma ese mes.
+        """
+        irregular = self.situacion >= situacion_minima
+        if irregular.shape[1] == 0:
+            return np.full(self._cantidad, -1, dtype=np.int64)
+        inicio = irregular.copy()
+        inicio[:, 1:] &= ~irregular[:, :-1]
+        columnas = inicio.argmax(axis=1)
+        return np.where(inicio.any(axis=1), columnas, -1)
+
+    def transiciones(self, desde=None, hasta=None, ponderar=False):
+        """
+        Matriz 6 × 6 de migraciones entre meses consecutivos del rango de períodos: cantidad de
+        pasos de la situación de la fila a la de la columna (o, con ponderar=True, monto del mes de
+        origen que migró). Solo cuentan los pares de meses con datos en ambos.
+        """
+        inicio = 0 if desde is None else self.columna(desde)
+        fin = self._situacion.shape[1] - 1 if hasta is None else self.columna(hasta)
+        if inicio is None or fin is None:
+            raise ValueError(f"El rango {desde}-{hasta} no está en la matriz")
+
+        bloque = self.situacion[:, inicio:fin + 1]
+        origen, destino = bloque[:, :-1], bloque[:, 1:]
+        validos = (origen > 0) & (destino > 0) & (origen <= 6) & (destino <= 6)
+        # Cada par (origen, destino) es una celda de una tabla de 7 × 7 (la fila y columna 0 quedan vacías)
+        celdas = origen[validos].astype(np.intp) * 7 + destino[validos]
+        pesos = self.monto[:, inicio:fin][validos] if ponderar else None
+        conteos = np.bincount(celdas, weights=pesos, minlength=49).reshape(7, 7)[1:, 1:]
+        return pd.DataFrame(
+            conteos, index=pd.Index(SITUACIONES, name='Desde'), columns=pd.Index(SITUACIONES, name='Hacia')
+        )
+
+    def periodos_de_columnas(self, columnas):
+        """
+        Período AAAAMM de cada columna (vacío para -1)
+        """
+        periodos = np.array([''] + self.periodos, dtype=object)
+        return periodos[np.asarray(columnas) + 1]
+
+    def a_dataframe(self, valores='situacion'):
+        """
+        Matriz como DataFrame con los CUITs en el índice y los períodos como columnas
+        """
+        datos = self.situacion if valores == 'situacion' else self.monto
+        return pd.DataFrame(datos, index=pd.Index(self.cuits[:self._cantidad].astype(str), name='CUIT'),
+                            columns=self.periodos)
+
+    def guardar(self, directorio=None):
+        """
+        Guarda la matriz en un directorio (.npy por arreglo, para abrirlos con memoria mapeada)
+        """
+        directorio = directorio or DIRECTORIO_MATRIZ
+        os.makedirs(directorio, exist_ok=True)
+        with self._lock:
+            arreglos = {
+                'situacion': self.situacion, 'monto': self.monto, 'cuits': self.cuits[:self._cantidad]
+            }
+            mes_inicial = self.mes_inicial
+            for nombre, arreglo in arreglos.items():
+                temporal = os.path.join(directorio, f"{nombre}.npy.tmp")
+                with open(temporal, "wb") as archivo:
+                    np.save(archivo, np.ascontiguousarray(arreglo))
+                os.replace(temporal, os.path.join(directorio, f"{nombre}.npy"))
+            temporal = os.path.join(directorio, "indice.json.tmp")
+            with open(temporal, "w") as archivo:
+                json.dump({'mes_inicial': mes_inicial}, archivo)
+            os.replace(temporal, os.path.join(directorio, "indice.json"))
+        return directorio
+
+    @classmethod
+    def cargar(cls, directorio=None, mapear=True):
+        """
+        Abre una matriz guardada. Con mapear=True las matrices quedan en disco (memoria mapeada,
+        solo lectura) y se copian a memoria recién si se les agregan datos.
+        """
+        directorio = directorio or DIRECTORIO_MATRIZ
+        modo = 'r' if mapear else None
+        with open(os.path.join(directorio, "indice.json")) as archivo:
+            indice = json.load(archivo)
+
+        matriz = cls()
+        matriz.cuits = np.load(os.path.join(directorio, "cuits.npy"))
+        matriz._situacion = np.load(os.path.join(directorio, "situacion.npy"), mmap_mode=modo)
+        matriz._monto = np.load(os.path.join(directorio, "monto.npy"), mmap_mode=modo)
+        matriz.mes_inicial = indice['mes_inicial']
+        matriz._cantidad = len(matriz.cuits)
+        matriz._filas = {cuit: fila for fila, cuit in enumerate(matriz.cuits.tolist())}
+        return matriz
+
+
+# Matriz del proceso, alimentada por utils.resumir_cuit con cada tabla histórica
+MATRIZ_SITUACION = MatrizSituacion()
+
+# Lotes de resultados cuyas filas ya se releyeron del almacén en este proceso (ver matriz_cartera)
+_lotes_recargados = set()
+
+
+def desde_almacen(cuits=None, matriz=None, ruta=None):
+    """
+    Carga en la matriz (por defecto una nueva) las deudas históricas guardadas en el almacén local,
+    opcionalmente solo las de una cartera
+    """
+    # Import diferido: almacen solo se necesita para reconstruir la matriz
+    import almacen
+    filtro, parametros = almacen._filtro_cuits(cuits)
+    df = almacen.consultar(
+        f"SELECT cuit, periodo, situacion, monto FROM historicas WHERE 1 = 1{filtro}", parametros, ruta
+    )
+    matriz = matriz if matriz is not None else MatrizSituacion()
+    matriz.agregar_lote(df['cuit'].to_numpy(), df['periodo'].to_numpy(),
+                        df['situacion'].to_numpy(), df['monto'].to_numpy())
+    return matriz
+
+
+def matriz_cartera(cuits, ruta=None, recargar=False, lote=None):
+    """
+    Matriz con las filas de una cartera en su orden. Los CUITs que esta instancia todavía no vio
+    se completan desde el almacén local; con recargar=True se vuelven a leer todas las filas de la
+    cartera, porque si el lote se resumió en otros procesos las que ya estaban pueden ser viejas.
+    Con lote (la clave del lote de resultados), la relectura se hace una sola vez por lote.
+    """
+    cuits = np.asarray(cuits, dtype=np.int64)
+    if recargar and lote is not None:
+        recargar = lote not in _lotes_recargados
+        _lotes_recargados.add(lote)
+    pendientes = cuits if recargar else cuits[MATRIZ_SITUACION.filas_de(cuits) < 0]
+    if len(pendientes) and utils.GUARDAR_ALMACEN:
+        desde_almacen(pendientes.astype(str).tolist(), MATRIZ_SITUACION, ruta)
+    return MATRIZ_SITUACION.submatriz(cuits)
+
+
+def tasas_migracion(transiciones):
+    """
+    Tasas de migración: cada fila de la matriz de transiciones dividida por su total
+    """
+    totales = transiciones.sum(axis=1)
+    return transiciones.div(totales.where(totales > 0), axis=0).fillna(0.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--directorio', default=DIRECTORIO_MATRIZ, help="Directorio de la matriz guardada")
+    subcomandos = parser.add_subparsers(dest='comando', required=True)
+
+    subcomandos.add_parser('construir', help="Arma la matriz desde el almacén local y la guarda")
+
+    irregulares = subcomandos.add_parser('irregulares', help="CUITs irregulares en los últimos meses")
+    irregulares.add_argument('--meses', type=int, default=6)
+    irregulares.add_argument('--situacion-minima', type=int, default=SITUACION_IRREGULAR)
+    irregulares.add_argument('--salida', help="Archivo CSV")
+
+    deterioro = subcomandos.add_parser('deterioro', help="Primer mes de deterioro de cada CUIT")
+    deterioro.add_argument('--situacion-minima', type=int, default=SITUACION_IRREGULAR)
+    deterioro.add_argument('--salida', help="Archivo CSV")
+
+    migracion = subcomandos.add_parser('migracion', help="Tasas de migración entre situaciones")
+    migracion.add_argument('--desde', help="Período AAAAMM inicial")
+    migracion.add_argument('--hasta', help="Período AAAAMM final")
+    migracion.add_argument('--ponderar', action='store_true', help="Ponderar por monto")
+    args = parser.parse_args()
+
+    if args.comando == 'construir':
+        matriz = desde_almacen()
+        matriz.guardar(args.directorio)
+        print(f"{len(matriz)} CUITs × {len(matriz.periodos)} períodos en {args.directorio}")
+        return
+
+    matriz = MatrizSituacion.cargar(args.directorio)
+    if args.comando == 'migracion':
+        transiciones = matriz.transiciones(args.desde, args.hasta, args.ponderar)
+        print(transiciones.to_string())
+        print()
+        print(tasas_migracion(transiciones).round(4).to_string())
+        return
+
+    cuits = matriz.cuits.astype(str)
+    if args.comando == 'irregulares':
+        seleccion = matriz.irregulares_en_ultimos(args.meses, args.situacion_minima)
+        df = pd.DataFrame({
+            'CUIT': cuits[seleccion],
+            'Peor Situación': matriz.peor_situacion(args.meses)[seleccion],
+            'Meses Irregular': matriz.meses_irregular(args.meses, args.situacion_minima)[seleccion]
+        })
+    else:
+        columnas = matriz.primer_deterioro(args.situacion_minima)
+        seleccion = columnas >= 0
+        df = pd.DataFrame({
+            'CUIT': cuits[seleccion],
+            'Primer Deterioro': matriz.periodos_de_columnas(columnas[seleccion])
+        })
+
+    if args.salida:
+        df.to_csv(args.salida, index=False)
+    else:
+        print(df.to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+"""
+Instrumentación de las consultas a la API del BCRA.
+
+Registra por cada llamada el endpoint, el código de estado, los bytes recibidos, la duración,
+los reintentos y los aciertos/fallos de caché. Agrega todo en contadores e histogramas con
+formato de texto de Prometheus, que se puede exponer por HTTP (BCRA_METRICAS_PUERTO) o
+volcar a un archivo (BCRA_METRICAS_ARCHIVO).
+"""
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# Límites superiores (en segundos) de los baldes del histograma de duración
+BALDES_DURACION = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Límites superiores (en bytes) de los baldes del histograma de tamaño de respuesta
+BALDES_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+# Cantidad de duraciones recientes por endpoint para calcular percentiles exactos en el panel
+MUESTRAS_RECIENTES = 2048
+
+# Intervalo mínimo entre volcados al archivo de métricas, en segundos
+INTERVALO_VOLCADO = 5.0
+
+
+class Histograma:
+    """
+    Histograma acumulativo con baldes fijos, al estilo Prometheus
+    """
+
+    def __init__(self, baldes):
+        self.baldes = baldes
+        self.cuentas = [0] * (len(baldes) + 1)
+        self.suma = 0.0
+        self.cuenta = 0
+
+    def observar(self, valor):
+        posicion = len(self.baldes)
+        for i, limite in enumerate(self.baldes):
+            if valor <= limite:
+                posicion = i
+                break
+        self.cuentas[posicion] += 1
+        self.suma += valor
+        self.cuenta += 1
+
+    def lineas_prometheus(self, nombre, etiquetas):
+        acumulado = 0
+        lineas = []
+        for limite, cuenta in zip(list(self.baldes) + ['+Inf'], self.cuentas):
+            acumulado += cuenta
+            lineas.append(f'{nombre}_bucket{{{etiquetas},le="{limite}"}} {acumulado}')
+        lineas.append(f'{nombre}_sum{{{etiquetas}}} {self.suma}')
+        lineas.append(f'{nombre}_count{{{etiquetas}}} {self.cuenta}')
+        return lineas
+
+
+class RegistroMetricas:
+    """
+    Registro de métricas de la API, seguro para usar desde varios hilos
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        with self._lock:
+            self.solicitudes = defaultdict(int)          # (endpoint, estado) -> cantidad
+            self.bytes_totales = defaultdict(int)        # endpoint -> bytes
+            self.reintentos = defaultdict(int)           # endpoint -> cantidad
+            self.cache = defaultdict(int)                # (endpoint, 'acierto'|'fallo') -> cantidad
+            self.duraciones = {}                         # endpoint -> Histograma
+            self.tamanos = {}                            # endpoint -> Histograma
+            self.recientes = defaultdict(lambda: deque(maxlen=MUESTRAS_RECIENTES))
+            self._ultimo_volcado = 0.0
+
+    def registrar_llamada(self, endpoint, estado, bytes_respuesta, duracion, reintentos=0):
+        """
+        Registra una llamada a la API. estado es el código HTTP o 'timeout'/'error' si no hubo respuesta;
+        reintentos es 1 si la llamada repite una que recibió 429.
+        """
+        with self._lock:
+            self.solicitudes[(endpoint, str(estado))] += 1
+            self.bytes_totales[endpoint] += bytes_respuesta
+            self.reintentos[endpoint] += reintentos
+            self.duraciones.setdefault(endpoint, Histograma(BALDES_DURACION)).observar(duracion)
+            self.tamanos.setdefault(endpoint, Histograma(BALDES_BYTES)).observar(bytes_respuesta)
+            self.recientes[endpoint].append(duracion)
+
+        self._volcar_si_corresponde()
+
+    def registrar_cache(self, endpoint, acierto):
+        """
+        Registra un acierto o fallo de caché para un endpoint
+        """
+        with self._lock:
+            self.cache[(endpoint, 'acierto' if acierto else 'fallo')] += 1
+
+    def exportar_prometheus(self):
+        """
+        Devuelve las métricas en formato de texto de Prometheus
+        """
+        with self._lock:
+            lineas = [
+                "# HELP bcra_api_solicitudes_total Solicitudes a la API del BCRA por endpoint y estado.",
+                "# TYPE bcra_api_solicitudes_total counter"
+            ]
+            for (endpoint, estado), cantidad in sorted(self.solicitudes.items()):
+                lineas.append(f'bcra_api_solicitudes_total{{endpoint="{endpoint}",estado="{estado}"}} {cantidad}')
+
+            lineas += [
+                "# HELP bcra_api_bytes_total Bytes recibidos de la API del BCRA por endpoint.",
+                "# TYPE bcra_api_bytes_total counter"
+            ]
+            for endpoint, cantidad in sorted(self.bytes_totales.items()):
+                lineas.append(f'bcra_api_bytes_total{{endpoint="{endpoint}"}} {cantidad}')
+
+            lineas += [
+                "# HELP bcra_api_reintentos_total Reintentos de consultas a la API del BCRA por endpoint.",
+                "# TYPE bcra_api_reintentos_total counter"
+            ]
+            for endpoint, cantidad in sorted(self.reintentos.items()):
+                lineas.append(f'bcra_api_reintentos_total{{endpoint="{endpoint}"}} {cantidad}')
+
+            lineas += [
+                "# HELP bcra_cache_consultas_total Consultas a la caché por endpoint y resultado.",
+                "# TYPE bcra_cache_consultas_total counter"
+            ]
+            for (endpoint, resultado), cantidad in sorted(self.cache.items()):
+                lineas.append(f'bcra_cache_consultas_total{{endpoint="{endpoint}",resultado="{resultado}"}} {cantidad}')
+
+            lineas += [
+                "# HELP bcra_api_duracion_segundos Duración de las consultas a la API del BCRA.",
+                "# TYPE bcra_api_duracion_segundos histogram"
+            ]
+            for endpoint, histograma in sorted(self.duraciones.items()):
+                lineas += histograma.lineas_prometheus('bcra_api_duracion_segundos', f'endpoint="{endpoint}"')
+
+            lineas += [
+                "# HELP bcra_api_respuesta_bytes Tamaño de las respuestas de la API del BCRA.",
+                "# TYPE bcra_api_respuesta_bytes histogram"
+            ]
+            for endpoint, histograma in sorted(self.tamanos.items()):
+                lineas += histograma.lineas_prometheus('bcra_api_respuesta_bytes', f'endpoint="{endpoint}"')
+
+        return "\n".join(lineas) + "\n"
+
+    def resumen_por_endpoint(self):
+        """
+        Devuelve una fila por endpoint con llamadas, errores, bytes, percentiles recientes,
+        reintentos y aciertos de caché, para mostrar en el panel de diagnóstico
+        """
+        with self._lock:
+            endpoints = sorted(
+                {endpoint for endpoint, _ in self.solicitudes} | {endpoint for endpoint, _ in self.cache}
+            )
+            filas = []
+            for endpoint in endpoints:
+                por_estado = {estado: cantidad for (ep, estado), cantidad in self.solicitudes.items() if ep == endpoint}
+                llamadas = sum(por_estado.values())
+                recientes = np.array(self.recientes[endpoint]) if self.recientes[endpoint] else np.zeros(0)
+                aciertos = self.cache[(endpoint, 'acierto')]
+                fallos = self.cache[(endpoint, 'fallo')]
+                filas.append({
+                    'Endpoint': endpoint,
+                    'Llamadas': llamadas,
+                    'OK (200)': por_estado.get('200', 0),
+                    'Sin datos (404)': por_estado.get('404', 0),
+                    'Limitadas (429)': por_estado.get('429', 0),
+                    'Otros errores': llamadas - sum(por_estado.get(e, 0) for e in ('200', '404', '429')),
+                    'KB recibidos': round(self.bytes_totales[endpoint] / 1024, 1),
+                    'p50 (ms)': round(float(np.percentile(recientes, 50)) * 1000, 1) if len(recientes) else None,
+                    'p95 (ms)': round(float(np.percentile(recientes, 95)) * 1000, 1) if len(recientes) else None,
+                    'Reintentos': self.reintentos[endpoint],
+                    'Aciertos caché': aciertos,
+                    'Tasa de aciertos': round(aciertos / (aciertos + fallos), 3) if aciertos + fallos else None
+                })
+        return filas
+
+    def escribir_archivo(self, ruta):
+        """
+        Escribe las métricas en formato Prometheus a un archivo (reemplazo atómico)
+        """
+        temporal = f"{ruta}.tmp"
+        with open(temporal, 'w', encoding='utf-8') as archivo:
+            archivo.write(self.exportar_prometheus())
+        os.replace(temporal, ruta)
+
+    def _volcar_si_corresponde(self):
+        ruta = os.environ.get("BCRA_METRICAS_ARCHIVO")
+        if not ruta:
+            return
+        ahora = time.monotonic()
+        with self._lock:
+            if ahora - self._ultimo_volcado < INTERVALO_VOLCADO:
+                return
+            self._ultimo_volcado = ahora
+        self.escribir_archivo(ruta)
+
+
+# Registro global del proceso
+REGISTRO = RegistroMetricas()
+
+_servidor_metricas = None
+_servidor_lock = threading.Lock()
+
+
+class _ManejadorMetricas(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip('/') not in ('', '/metrics'):
+            self.send_error(404)
+            return
+        datos = REGISTRO.exportar_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+
+def iniciar_servidor_metricas(puerto=None, host="0.0.0.0"):
+    """
+    Expone /metrics por HTTP en un hilo en segundo plano (una sola vez por proceso).
+    Sin puerto explícito usa BCRA_METRICAS_PUERTO; si no está definido no hace nada.
+    """
+    global _servidor_metricas
+
+    puerto = puerto if puerto is not None else os.environ.get("BCRA_METRICAS_PUERTO")
+    if puerto in (None, ""):
+        return None
+
+    with _servidor_lock:
+        if _servidor_metricas is None:
+            try:
+                _servidor_metricas = ThreadingHTTPServer((host, int(puerto)), _ManejadorMetricas)
+            except OSError:
+                # Otro proceso ya expone las métricas en ese puerto
+                return None
+            _servidor_metricas.daemon_threads = True
+            threading.Thread(target=_servidor_metricas.serve_forever, daemon=True).start()
+    return _servidor_metricas
@@ -1,7 +1,6 @@
 import streamlit as st
 import re
 import time
-import plotly.graph_objects as go
 import plotly.express as px
 from datetime import datetime
 import pandas as pd
@@ -13,7 +12,12 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from utils import (
     obtener_deudas, obtener_deudas_historicas, obtener_cheques_rechazados,
     procesar_deudas, procesar_deudas_historicas, procesar_cheques_rechazados,
-    SITUACION_COLORS, SITUACION_MAP
+    mostrar_panel_diagnostico, SITUACION_COLORS, SITUACION_MAP
+)
+from graficos import (
+    figura_cacheada, figura_evolucion_situacion, figura_evolucion_entidad,
+    figura_deuda_por_situacion, figura_deuda_por_entidad,
+    reducir_serie_temporal, FRECUENCIAS_PERIODO
 )
 
 st.title("Consulta Individual de Deudores BCRA")
@@ -25,8 +29,28 @@ visualizando información sobre deudas actuales, históricas y cheques rechazado
 # Consulta individual
 with st.form(key='consulta_form'):
     cuit_input = st.text_input("Ingrese CUIT/CUIL/CDI (sin guiones)", "")
+
+    # Opciones para limitar la cantidad de puntos enviados al navegador. Van
+    # dentro del formulario porque los resultados solo se dibujan al enviarlo.
+    with st.expander("Opciones de visualización"):
+        col_frecuencia, col_top = st.columns(2)
+        with col_frecuencia:
+            agrupacion = st.selectbox(
+                "Agrupación de períodos",
+                options=list(FRECUENCIAS_PERIODO.keys())
+            )
+        with col_top:
+            max_entidades = st.number_input(
+                "Máximo de entidades por gráfico (el resto se agrupa en 'Otros')",
+                min_value=1,
+                max_value=50,
+                value=10
+            )
+
     consultar_submit = st.form_submit_button("Consultar")
 
+frecuencia = FRECUENCIAS_PERIODO[agrupacion]
+
 if cuit_input and not re.match(r'^\d{11}$', cuit_input):
     st.error("El CUIT/CUIL/CDI debe contener exactamente 11 dígitos numéricos, sin guiones.")
     cuit_input = ""
@@ -54,27 +78,8 @@ if consultar_submit and cuit_input:
                     lambda x: f"{int(x)}: {SITUACION_MAP.get(int(x), 'Desconocida')}"
                 )
 
-                fig = px.line(
-                    df_evolucion,
-                    x='FechaPeriodo',
-                    y='Monto',
-                    color='SituaciónTexto',
-                    markers=True,
-                    title="Evolución de Deudas por Situación Crediticia",
-                    labels={
-                        'FechaPeriodo': 'Período',
-                        'Monto': 'Monto Total (miles de $)',
-                        'SituaciónTexto': 'Situación'
-                    },
-                    height=500
-                )
-                fig.update_layout(
-                    xaxis_title="Período",
-                    yaxis_title="Monto Total (miles de $)",
-                    legend_title="Situación Crediticia",
-                    hovermode="x unified"
-                )
-                fig.update_traces(hovertemplate='%{y:,.2f} miles de $<extra></extra>')
+                df_evolucion = reducir_serie_temporal(df_evolucion, 'SituaciónTexto', frecuencia=frecuencia)
+                fig = figura_cacheada(figura_evolucion_situacion, df_evolucion)
                 st.plotly_chart(fig, use_container_width=True)
 
                 # Gráfico por entidad debajo, con selector
@@ -89,28 +94,14 @@ if consultar_submit and cuit_input:
                 if entidades_seleccionadas:
                     df_evolucion_entidad = df_historico[df_historico['Entidad'].isin(entidades_seleccionadas)]
                     df_evolucion_entidad = df_evolucion_entidad.groupby(['FechaPeriodo', 'Entidad']).agg({'Monto': 'sum'}).reset_index()
-
-                    fig_entidad = px.line(
+                    df_evolucion_entidad = reducir_serie_temporal(
                         df_evolucion_entidad,
-                        x='FechaPeriodo',
-                        y='Monto',
-                        color='Entidad',
-                        markers=True,
-                        title="Evolución de Deudas por Entidad",
-                        labels={
-                            'FechaPeriodo': 'Período',
-                            'Monto': 'Monto Total (miles de $)',
-                            'Entidad': 'Entidad Financiera'
-                        },
-                        height=500
-                    )
-                    fig_entidad.update_layout(
-                        xaxis_title="Período",
-                        yaxis_title="Monto Total (miles de $)",
-                        legend_title="Entidad Financiera",
-                        hovermode="x unified"
+                        'Entidad',
+                        top_n=int(max_entidades),
+                        frecuencia=frecuencia
                     )
-                    fig_entidad.update_traces(hovertemplate='%{y:,.2f} miles de $<extra></extra>')
+
+                    fig_entidad = figura_cacheada(figura_evolucion_entidad, df_evolucion_entidad)
                     st.plotly_chart(fig_entidad, use_container_width=True)
 
                 # Tabla de datos históricos colapsada para no interrumpir el flujo visual
@@ -146,45 +137,12 @@ if consultar_submit and cuit_input:
                     df_situacion['Color'] = df_situacion['Situación'].map(SITUACION_COLORS)
                     df_situacion = df_situacion.sort_values('Situación')
 
-                    fig = go.Figure()
-                    for idx, row in df_situacion.iterrows():
-                        fig.add_trace(go.Bar(
-                            x=[row['Descripción']],
-                            y=[row['Monto']],
-                            name=f"Situación {int(row['Situación'])}",
-                            marker_color=SITUACION_COLORS[int(row['Situación'])]
-                        ))
-                    fig.update_layout(
-                        title="Deuda por Situación Crediticia",
-                        xaxis_title="Situación",
-                        yaxis_title="Monto Total (miles de $)",
-                        xaxis_tickangle=-45,
-                        height=500,
-                        barmode='group'
-                    )
+                    fig = figura_cacheada(figura_deuda_por_situacion, df_situacion)
                     st.plotly_chart(fig, use_container_width=True)
 
                 with tab3:
-                    df_entidad = df_deudas.groupby(['Entidad', 'Situación']).agg({'Monto': 'sum'}).reset_index()
-
-                    fig = go.Figure()
-                    for situacion in sorted(df_entidad['Situación'].unique()):
-                        df_filtrado = df_entidad[df_entidad['Situación'] == situacion]
-                        fig.add_trace(go.Bar(
-                            x=df_filtrado['Entidad'],
-                            y=df_filtrado['Monto'],
-                            name=f"Situación {int(situacion)}: {SITUACION_MAP[int(situacion)]}",
-                            marker_color=SITUACION_COLORS[int(situacion)]
-                        ))
-                    fig.update_layout(
-                        title="Deuda por Entidad y Situación Crediticia",
-                        xaxis_title="Entidad Financiera",
-                        yaxis_title="Monto Total (miles de $)",
-                        xaxis_tickangle=-45,
-                        height=500,
-                        barmode='stack',
-                        legend_title="Situación Crediticia"
-                    )
+                    # La figura agrega por situación y entidad en una sola pasada
+                    fig = figura_cacheada(figura_deuda_por_entidad, df_deudas[['Entidad', 'Situación', 'Monto']])
                     st.plotly_chart(fig, use_container_width=True)
 
                 st.subheader("Filtros para Deudas Actuales")
@@ -332,6 +290,9 @@ if consultar_submit and cuit_input:
             else:
                 st.info("No se encontraron cheques rechazados.")
 
+# Panel de diagnóstico de las consultas a la API
+mostrar_panel_diagnostico()
+
 hide_streamlit_style = """
             <style>
             #MainMenu {visibility: hidden;}
@@ -1,9 +1,10 @@
 import streamlit as st
 import re
+import sqlite3
 import time
+import uuid
 import pandas as pd
 from datetime import datetime
-import plotly.express as px
 # Imports de ReportLab
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter, landscape
@@ -29,8 +30,26 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from utils import (
     obtener_deudas, obtener_deudas_historicas, obtener_cheques_rechazados,
     procesar_deudas, procesar_deudas_historicas, procesar_cheques_rechazados,
-    procesar_lista_cuits, SITUACION_COLORS, SITUACION_MAP
+    procesar_lista_cuits, mostrar_tabla_paginada, formatear_resultados, mostrar_panel_diagnostico,
+    guardar_cubo_exposicion, informar_incidencias, SITUACION_COLORS, SITUACION_MAP, MODO_CONSULTA, MODOS_CONSULTA,
+    GUARDAR_SNAPSHOTS, GUARDAR_ALMACEN
 )
+from perfilado import perfilar_lote, perfiladores_disponibles
+from cache_global import CACHE_LOTES
+from snapshots import (
+    guardar_snapshot, cargar_snapshot, snapshots_anteriores, comparar_snapshots, a_arreglos,
+    descripcion_snapshot
+)
+from cola_trabajos import (
+    encolar_trabajo, estado_trabajo, resultados_trabajo, incidencias_trabajo, cancelar_trabajo,
+    hay_trabajadores_activos, ESTADOS_FINALES
+)
+from graficos import (
+    figura_cacheada, figura_distribucion_situacion, figura_irregularidades, figura_cheques, figura_migracion
+)
+from matriz_situacion import matriz_cartera, tasas_migracion
+from riesgo import agregar_puntaje, PESOS_RIESGO, SENALES_RIESGO, COLUMNA_PUNTAJE
+from cubo_exposicion import cubo_cartera, DIMENSIONES as DIMENSIONES_CUBO, MEDIDAS as MEDIDAS_CUBO
 
 
 def crear_pie_pagina(fuente_regular, linkedin_url):
@@ -100,21 +119,15 @@ def registrar_fuentes_personalizadas():
 
 
 
-def obtener_color_fila(fila):
+def obtener_color_fila(situacion_irregular):
     """
-    Determina el color de fondo para una fila basado en su estado
+    Determina el color de fondo para una fila según si presenta alguna irregularidad
+    (situación irregular actual o histórica, o cheques rechazados)
     
     Colores suaves:
     - Verde claro: Sin irregularidades
     - Rojo claro: Con irregularidades o cheques rechazados
     """
-    # Verificar situaciones que indican irregularidad
-    situacion_irregular = (
-        fila['Tiene Situación Irregular'] == 'Sí' or 
-        fila['Tuvo Situación Irregular'] == 'Sí' or 
-        fila['Tiene Cheques Rechazados'] == 'Sí'
-    )
-    
     # Usar colores de ReportLab
     if situacion_irregular:
         return colors.HexColor('#FFB6C1')  # Light Pink suave
@@ -241,8 +254,8 @@ def generar_informe_pdf(df_resultados):
         encabezados.append(parrafo)
     datos_tabla.append(encabezados)
     
-    # Luego agregamos las filas
-    for index, fila in df_resultados[columnas_resumen].iterrows():
+    # Luego agregamos las filas, con las etiquetas en español aplicadas solo para la exportación
+    for index, fila in formatear_resultados(df_resultados[columnas_resumen]).iterrows():
         fila_parrafos = []
         for i, valor in enumerate(fila):
             # Adaptamos el estilo según la columna
@@ -296,10 +309,13 @@ def generar_informe_pdf(df_resultados):
         ('RIGHTPADDING', (0,0), (-1,-1), 3),
     ])
     
+    # Calcular de una vez qué filas presentan alguna irregularidad (las columnas Sí/No del informe)
+    filas_irregulares = df_resultados[columnas_resumen[3:]].to_numpy().any(axis=1)
+    
     # Agregar color de fondo condicional para cada fila
     for i in range(1, len(datos_tabla)):
         # Obtener color para la fila actual
-        color_fila = obtener_color_fila(df_resultados.iloc[i-1])
+        color_fila = obtener_color_fila(filas_irregulares[i-1])
         
         # Aplicar color de fondo a toda la fila
         estilo_tabla.add('BACKGROUND', (0,i), (-1,i), color_fila)
@@ -310,7 +326,7 @@ def generar_informe_pdf(df_resultados):
     elementos.append(Spacer(1, 10))  # Aumentado el espacio
     
     # Sección de CUITs con Cheques Rechazados
-    cuits_con_cheques = df_resultados[df_resultados['Tiene Cheques Rechazados'] == 'Sí']
+    cuits_con_cheques = df_resultados[df_resultados['Tiene Cheques Rechazados']]
     if not cuits_con_cheques.empty:
         elementos.append(Paragraph("Clientes con Cheques Rechazados:", estilo_normal))
         # Crear una lista en vez de párrafo largo
@@ -326,7 +342,7 @@ def generar_informe_pdf(df_resultados):
         elementos.append(Spacer(1, 10))
     
     # Sección de CUITs con Situación Irregular
-    cuits_con_situacion_irregular = df_resultados[df_resultados['Tiene Situación Irregular'] == 'Sí']
+    cuits_con_situacion_irregular = df_resultados[df_resultados['Tiene Situación Irregular']]
     if not cuits_con_situacion_irregular.empty:
         elementos.append(Paragraph("Clientes con Situación Irregular:", estilo_normal))
         # Crear una lista en vez de párrafo largo
@@ -389,6 +405,13 @@ def mostrar_resultados_multiple_cuits(df_resultados):
         st.warning("No se obtuvieron resultados para analizar")
         return
     
+    # Incidencias de un trabajo de la cola (en la sesión ya se mostraron al procesar)
+    informar_incidencias(df_resultados.attrs.get('incidencias', []))
+    if df_resultados.attrs.get('error_snapshot'):
+        st.warning(f"No se pudo guardar el snapshot de la consulta: {df_resultados.attrs['error_snapshot']}")
+    if df_resultados.attrs.get('error_cubo'):
+        st.warning(f"No se pudo guardar la exposición por entidad de la cartera: {df_resultados.attrs['error_cubo']}")
+    
     # Crear pestañas para diferentes vistas
     tab1, tab2 = st.tabs(["Resumen", "Análisis Detallado"])
     
@@ -396,12 +419,6 @@ def mostrar_resultados_multiple_cuits(df_resultados):
         # Aplicar formato condicional
         st.subheader("Informe Resumido de CUITs/CUILs/CDIs")
         
-        # Convertir columnas de estado a valores booleanos para filtrado
-        df_filtro = df_resultados.copy()
-        df_filtro['Tiene Situación Irregular Bool'] = df_filtro['Tiene Situación Irregular'] == 'Sí'
-        df_filtro['Tuvo Situación Irregular Bool'] = df_filtro['Tuvo Situación Irregular'] == 'Sí'
-        df_filtro['Tiene Cheques Rechazados Bool'] = df_filtro['Tiene Cheques Rechazados'] == 'Sí'
-        
         # Opciones de filtro - usar session_state para mantener los valores entre rerenders
         if 'mostrar_con_irregularidades' not in st.session_state:
             st.session_state.mostrar_con_irregularidades = False
@@ -410,8 +427,18 @@ def mostrar_resultados_multiple_cuits(df_resultados):
         if 'mostrar_con_cheques' not in st.session_state:
             st.session_state.mostrar_con_cheques = False
         
+        # Puntaje de riesgo de toda la cartera con los pesos elegidos; la tabla queda ordenada por puntaje
+        with st.expander("Configurar puntaje de riesgo"):
+            st.caption("Peso de cada señal en el puntaje (0 a 100). Un peso 0 excluye la señal.")
+            columnas_pesos = st.columns(3)
+            pesos = {
+                senal: columnas_pesos[i % 3].slider(nombre, 0, 100, int(PESOS_RIESGO[senal]), key=f"peso_riesgo_{senal}")
+                for i, (senal, nombre) in enumerate(SENALES_RIESGO.items())
+            }
+        df_resultados = agregar_puntaje(df_resultados, pesos)
+        
         st.markdown("### Filtros")
-        col1, col2, col3 = st.columns(3)
+        col1, col2, col3, col4 = st.columns(4)
         
         with col1:
             mostrar_con_irregularidades = st.checkbox(
@@ -437,43 +464,28 @@ def mostrar_resultados_multiple_cuits(df_resultados):
                 on_change=lambda: setattr(st.session_state, 'mostrar_con_cheques', st.session_state.cb_cheques)
             )
         
-        # Aplicar filtros
-        df_mostrar = df_filtro.copy()
+        with col4:
+            puntaje_minimo = st.slider("Puntaje de riesgo mínimo", 0, 100, 0, step=5, key="puntaje_minimo")
+        
+        # Aplicar filtros directamente sobre las columnas booleanas y el puntaje
+        filtro = df_resultados[COLUMNA_PUNTAJE].to_numpy() >= puntaje_minimo
         
         if mostrar_con_irregularidades:
-            df_mostrar = df_mostrar[df_mostrar['Tiene Situación Irregular Bool']]
+            filtro &= df_resultados['Tiene Situación Irregular'].to_numpy()
         
         if mostrar_con_historico_irregular:
-            df_mostrar = df_mostrar[df_mostrar['Tuvo Situación Irregular Bool']]
+            filtro &= df_resultados['Tuvo Situación Irregular'].to_numpy()
         
         if mostrar_con_cheques:
-            df_mostrar = df_mostrar[df_mostrar['Tiene Cheques Rechazados Bool']]
-        
-        # Eliminar columnas auxiliares de filtro
-        df_mostrar = df_mostrar.drop(columns=[
-            'Tiene Situación Irregular Bool', 
-            'Tuvo Situación Irregular Bool', 
-            'Tiene Cheques Rechazados Bool'
-        ])
-        
-        # Aplicar colores condicionales a la tabla
-        def highlight_si_no(val):
-            if val == 'Sí':
-                return 'background-color: rgba(255, 99, 71, 0.2);'  # Rojo claro
-            elif val == 'No':
-                return 'background-color: rgba(144, 238, 144, 0.2);'  # Verde claro
-            return ''
-            
-        # Mostrar tabla con formateo condicional
-        st.dataframe(
-            df_mostrar.style.applymap(
-                highlight_si_no, 
-                subset=['Tiene Situación Irregular', 'Tuvo Situación Irregular', 'Tiene Cheques Rechazados']
-            )
-        )
+            filtro &= df_resultados['Tiene Cheques Rechazados'].to_numpy()
+        
+        df_mostrar = df_resultados[filtro]
+        
+        # Mostrar tabla paginada con formateo condicional solo en la página visible
+        mostrar_tabla_paginada(df_mostrar)
         
         # Botón para descargar resultados
-        csv = df_mostrar.to_csv(index=False).encode('utf-8')
+        csv = formatear_resultados(df_mostrar).to_csv(index=False).encode('utf-8')
         st.download_button(
             "Descargar informe como CSV",
             csv,
@@ -504,9 +516,9 @@ def mostrar_resultados_multiple_cuits(df_resultados):
         total_cuits = len(df_resultados)
         
         # Calcular métricas generales
-        cuits_con_irregularidades = sum(df_resultados['Tiene Situación Irregular'] == 'Sí')
-        cuits_con_historico = sum(df_resultados['Tuvo Situación Irregular'] == 'Sí')
-        cuits_con_cheques = sum(df_resultados['Tiene Cheques Rechazados'] == 'Sí')
+        cuits_con_irregularidades = int(df_resultados['Tiene Situación Irregular'].sum())
+        cuits_con_historico = int(df_resultados['Tuvo Situación Irregular'].sum())
+        cuits_con_cheques = int(df_resultados['Tiene Cheques Rechazados'].sum())
         
         # Mostrar métricas en columnas
         col1, col2, col3, col4 = st.columns(4)
@@ -544,13 +556,8 @@ def mostrar_resultados_multiple_cuits(df_resultados):
         # Gráfico de distribución por situación
         st.markdown("### Distribución por Situación Crediticia")
         
-        # Extraer la categoría de situación (solo el número)
-        df_resultados['Categoría Situación'] = df_resultados['Situación Actual'].apply(
-            lambda x: int(x.split(':')[0]) if x != 'Sin datos' else 0
-        )
-        
-        # Contar CUITs por categoría
-        categoria_counts = df_resultados['Categoría Situación'].value_counts().reset_index()
+        # Contar CUITs por situación (0 indica sin datos)
+        categoria_counts = df_resultados['Situación Actual'].value_counts().reset_index()
         categoria_counts.columns = ['Situación', 'Cantidad']
         
         # Crear diccionario para mapear cada situación con su descripción
@@ -568,22 +575,7 @@ def mostrar_resultados_multiple_cuits(df_resultados):
         categoria_counts['Descripción'] = categoria_counts['Situación'].map(situacion_map_completo)
         
         # Crear gráfico
-        fig = px.pie(
-            categoria_counts,
-            values='Cantidad',
-            names='Descripción',
-            title="Distribución de CUITs por Situación Crediticia",
-            color='Situación',
-            color_discrete_map={
-                0: "#CCCCCC",  # Gris para sin datos
-                1: "#4CAF50",  # Verde
-                2: "#8BC34A",  # Verde claro
-                3: "#FFC107",  # Amarillo
-                4: "#FF9800",  # Naranja
-                5: "#F44336",  # Rojo
-                6: "#B71C1C"   # Rojo oscuro
-            }
-        )
+        fig = figura_cacheada(figura_distribucion_situacion, categoria_counts)
         st.plotly_chart(fig, use_container_width=True)
         
         # Gráfico de situaciones irregulares por período
@@ -597,18 +589,14 @@ def mostrar_resultados_multiple_cuits(df_resultados):
             "Con irregularidades actuales e históricas"
         ]
         
-        # Calcular conteos
-        sin_irreg = sum((df_resultados['Tiene Situación Irregular'] == 'No') & 
-                         (df_resultados['Tuvo Situación Irregular'] == 'No'))
-        
-        solo_actual = sum((df_resultados['Tiene Situación Irregular'] == 'Sí') & 
-                           (df_resultados['Tuvo Situación Irregular'] == 'No'))
-        
-        solo_historica = sum((df_resultados['Tiene Situación Irregular'] == 'No') & 
-                              (df_resultados['Tuvo Situación Irregular'] == 'Sí'))
+        # Calcular conteos con reducciones vectorizadas sobre las columnas booleanas
+        actual = df_resultados['Tiene Situación Irregular'].to_numpy()
+        historica = df_resultados['Tuvo Situación Irregular'].to_numpy()
         
-        ambas = sum((df_resultados['Tiene Situación Irregular'] == 'Sí') & 
-                     (df_resultados['Tuvo Situación Irregular'] == 'Sí'))
+        sin_irreg = int((~actual & ~historica).sum())
+        solo_actual = int((actual & ~historica).sum())
+        solo_historica = int((~actual & historica).sum())
+        ambas = int((actual & historica).sum())
         
         # Crear datos para gráfico
         df_analisis = pd.DataFrame({
@@ -617,19 +605,7 @@ def mostrar_resultados_multiple_cuits(df_resultados):
         })
         
         # Crear gráfico de barras
-        fig = px.bar(
-            df_analisis,
-            x='Categoría',
-            y='Cantidad',
-            title="Análisis de Situaciones Irregulares",
-            color='Categoría',
-            color_discrete_map={
-                "Sin irregularidades": "#4CAF50",
-                "Con irregularidades solo actuales": "#FFC107",
-                "Con irregularidades solo históricas": "#FF9800",
-                "Con irregularidades actuales e históricas": "#F44336"
-            }
-        )
+        fig = figura_cacheada(figura_irregularidades, df_analisis)
         st.plotly_chart(fig, use_container_width=True)
         
         # Análisis de cheques rechazados
@@ -638,26 +614,277 @@ def mostrar_resultados_multiple_cuits(df_resultados):
         # Crear categorías de análisis
         df_cheques_analisis = pd.DataFrame({
             'Categoría': ["Sin cheques rechazados", "Con cheques rechazados"],
-            'Cantidad': [
-                sum(df_resultados['Tiene Cheques Rechazados'] == 'No'),
-                sum(df_resultados['Tiene Cheques Rechazados'] == 'Sí')
-            ]
+            'Cantidad': [total_cuits - cuits_con_cheques, cuits_con_cheques]
         })
         
         # Crear gráfico
-        fig = px.pie(
-            df_cheques_analisis,
-            values='Cantidad',
-            names='Categoría',
-            title="Distribución de CUITs por Cheques Rechazados",
-            color='Categoría',
-            color_discrete_map={
-                "Sin cheques rechazados": "#4CAF50",
-                "Con cheques rechazados": "#F44336"
-            }
-        )
+        fig = figura_cacheada(figura_cheques, df_cheques_analisis)
         st.plotly_chart(fig, use_container_width=True)
 
+def consultar_cuits(cuits_texto):
+    """
+    Procesa la lista de CUITs, perfilando la ejecución por etapas si está activada la opción
+    """
+    etiqueta_modo = st.session_state.get('modo_consulta')
+    modo = next((clave for clave, etiqueta in MODOS_CONSULTA.items() if etiqueta == etiqueta_modo), None)
+
+    if st.session_state.get('usar_cola'):
+        if st.session_state.trabajo_en_cola is not None:
+            st.info(f"El trabajo {st.session_state.trabajo_en_cola} todavía está en curso.")
+            return None
+        trabajo_id, cuits_invalidos = encolar_trabajo(
+            cuits_texto, st.session_state.usuario_cola, modo if modo != "secuencial" else "async"
+        )
+        for cuit in cuits_invalidos:
+            st.warning(f"CUIT/CUIL/CDI inválido ignorado: {cuit}")
+        if trabajo_id is None:
+            st.error("No se encontraron CUITs/CUILs/CDIs válidos para procesar")
+        else:
+            st.session_state.trabajo_en_cola = trabajo_id
+        return None
+
+    if not st.session_state.get('perfilar_ejecucion'):
+        st.session_state.perfil_lote = None
+        return procesar_lista_cuits(cuits_texto, modo=modo)
+
+    perfilador = st.session_state.get('perfilador_completo')
+    with perfilar_lote(None if perfilador == "Ninguno" else perfilador) as perfil:
+        df_resultados = procesar_lista_cuits(cuits_texto, modo=modo)
+    st.session_state.perfil_lote = perfil
+    return df_resultados
+
+def guardar_resultados_sesion(df_resultados, cuits_texto):
+    """
+    Guarda los resultados en la caché compartida de lotes; la sesión y la URL conservan solo la
+    clave, así que recargar la página no obliga a repetir la consulta
+    """
+    clave = CACHE_LOTES.guardar(df_resultados) if df_resultados is not None else None
+    st.session_state.clave_resultados = clave
+    st.session_state.cuits_texto_cache = cuits_texto
+    if clave:
+        st.query_params["lote"] = clave
+    elif "lote" in st.query_params:
+        del st.query_params["lote"]
+    return df_resultados
+
+def seguir_trabajo_en_cola(trabajo_id):
+    """
+    Muestra el avance de un trabajo de la cola y, al terminar, carga sus resultados como si
+    la consulta se hubiera hecho en esta sesión
+    """
+    trabajo = estado_trabajo(trabajo_id)
+    if trabajo is None:
+        st.session_state.trabajo_en_cola = None
+        return
+
+    if trabajo['estado'] == 'terminado':
+        df_resultados = resultados_trabajo(trabajo_id)
+        # Las incidencias acompañan a los resultados y se muestran junto con ellos
+        df_resultados.attrs['incidencias'] = list(
+            incidencias_trabajo(trabajo_id)[['cuit', 'endpoint', 'estado']].itertuples(index=False, name=None)
+        )
+        # Como en procesar_lista_cuits, un snapshot o un cubo que no se pueden escribir no impiden
+        # ver los resultados; los avisos se guardan con ellos porque st.rerun() descartaría un st.warning
+        if GUARDAR_SNAPSHOTS:
+            try:
+                df_resultados.attrs['snapshot'] = guardar_snapshot(df_resultados)
+            except OSError as e:
+                df_resultados.attrs['error_snapshot'] = str(e)
+        if GUARDAR_ALMACEN:
+            df_resultados.attrs['error_cubo'] = guardar_cubo_exposicion(df_resultados)
+        guardar_resultados_sesion(df_resultados, ", ".join(df_resultados['CUIT']))
+        st.session_state.consulta_realizada = True
+        st.session_state.trabajo_en_cola = None
+        st.success(f"Trabajo {trabajo_id} terminado: {trabajo['total']} CUITs procesados.")
+        st.rerun()
+
+    if trabajo['estado'] in ESTADOS_FINALES:
+        st.error(f"El trabajo {trabajo_id} terminó con estado '{trabajo['estado']}'. {trabajo['error'] or ''}")
+        st.session_state.trabajo_en_cola = None
+        return
+
+    st.subheader(f"Trabajo {trabajo_id} en la cola")
+    st.progress(int(trabajo['procesados'] / trabajo['total'] * 100))
+    st.text(f"Estado: {trabajo['estado']} ({trabajo['procesados']}/{trabajo['total']} CUITs)")
+    if trabajo['sin_datos'] or trabajo['fallidos']:
+        st.caption(f"Hasta ahora: {trabajo['sin_datos']} CUITs sin información y {trabajo['fallidos']} con consultas fallidas.")
+    if not hay_trabajadores_activos():
+        st.warning("No hay trabajadores activos. Inicie uno con: python cola_trabajos.py trabajador")
+    if st.button("Cancelar trabajo"):
+        cancelar_trabajo(trabajo_id)
+        st.session_state.trabajo_en_cola = None
+        st.rerun()
+
+    # Volver a consultar el estado en unos segundos
+    time.sleep(INTERVALO_SEGUIMIENTO)
+    st.rerun()
+
+def mostrar_cambios_desde_ultima_consulta(df_resultados):
+    """
+    Compara los resultados con una consulta anterior de la misma cartera: cambios de situación,
+    nuevos irregulares, cheques rechazados nuevos y variación de deuda
+    """
+    anteriores = snapshots_anteriores(df_resultados)[:MAXIMO_SNAPSHOTS_A_COMPARAR]
+    with st.expander("Cambios desde la última consulta", expanded=bool(anteriores)):
+        if not anteriores:
+            st.caption("No hay consultas anteriores de esta cartera para comparar.")
+            return
+
+        descripciones = [descripcion_snapshot(ruta) for ruta in anteriores]
+        elegida = st.selectbox("Comparar con la consulta del", descripciones, key="snapshot_base")
+        anterior = cargar_snapshot(anteriores[descripciones.index(elegida)])
+        cambios, resumen = comparar_snapshots(anterior, a_arreglos(df_resultados))
+
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Empeoraron", resumen['empeoraron'])
+        col2.metric("Nuevos irregulares", resumen['nuevos_irregulares'])
+        col3.metric("Con cheques nuevos", resumen['con_cheques_nuevos'])
+        col4.metric("Variación deuda (miles $)", f"{resumen['variacion_deuda']:,.0f}")
+        st.caption(
+            f"{resumen['comunes']} CUITs en ambas consultas, {resumen['mejoraron']} mejoraron de situación, "
+            f"{resumen['aparecieron']} pasaron a tener datos en el BCRA y {resumen['desaparecieron']} dejaron de "
+            f"tenerlos; {resumen['altas']} nuevos y {resumen['bajas']} que ya no están en la cartera."
+        )
+
+        if st.checkbox("Mostrar también los cambios solo de deuda", key="cambios_solo_deuda"):
+            df_cambios = cambios
+        else:
+            df_cambios = cambios[
+                (cambios['Variación Situación'] != 0) | (cambios['Cambio Datos'] != "") | cambios['Nuevo Irregular']
+                | (cambios['Cheques Nuevos'] > 0)
+            ]
+        if df_cambios.empty:
+            st.success("No hay cambios para mostrar.")
+            return
+
+        df_cambios = df_cambios.sort_values(
+            ['Variación Situación', 'Variación Deuda (miles $)'], ascending=False
+        )
+        st.dataframe(df_cambios, hide_index=True, use_container_width=True)
+        st.download_button(
+            label="Descargar cambios (CSV)",
+            data=df_cambios.to_csv(index=False).encode('utf-8'),
+            file_name="cambios_cartera.csv",
+            mime="text/csv"
+        )
+
+def mostrar_exposicion_cartera(df_resultados):
+    """
+    Exposición de la cartera por entidad, situación y período. Se calcula sobre el cubo agregado al
+    terminar la consulta (cubo_exposicion.py), sin consultar la API ni recorrer el almacén
+    """
+    with st.expander("Exposición de la cartera por entidad"):
+        if not GUARDAR_ALMACEN:
+            st.caption("La exposición se calcula sobre el almacén local, que está desactivado (BCRA_ALMACEN=0).")
+            return
+        try:
+            cubo = cubo_cartera(df_resultados['CUIT'].tolist())
+        except (OSError, sqlite3.Error) as e:
+            st.warning(f"No se pudo armar la exposición por entidad de la cartera: {str(e)}")
+            return
+        if cubo.vacio:
+            st.caption("El almacén local todavía no tiene deudas de esta cartera.")
+            return
+
+        col1, col2 = st.columns(2)
+        periodo = col1.selectbox("Período", cubo.periodos[::-1], key="periodo_exposicion")
+        situacion_minima = col2.slider("Situación mínima", 1, 6, 3, key="situacion_minima_exposicion")
+
+        del_periodo = cubo.rebanar(desde=periodo, hasta=periodo)
+        corte = del_periodo.rebanar(situaciones=range(situacion_minima, 7))
+        concentracion = corte.concentracion()
+        if concentracion['entidades'] == 0:
+            st.info(f"Ningún CUIT de la cartera tiene deudas en situación {situacion_minima} o peor en {periodo}.")
+        else:
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("Entidades", concentracion['entidades'])
+            col2.metric("Mayor entidad", f"{concentracion['mayor']:.1%}")
+            col3.metric("Cinco mayores", f"{concentracion['cinco_mayores']:.1%}")
+            col4.metric("Índice HHI", f"{concentracion['hhi']:,.0f}")
+            st.dataframe(corte.tabla('entidad'), hide_index=True, use_container_width=True)
+        st.dataframe(del_periodo.tabla('situacion'), hide_index=True, use_container_width=True)
+
+        st.markdown("**Tabla dinámica**")
+        dimensiones = list(DIMENSIONES_CUBO)
+        col1, col2, col3 = st.columns(3)
+        filas = col1.selectbox("Filas", dimensiones, format_func=DIMENSIONES_CUBO.get, key="filas_cubo")
+        columnas = col2.selectbox(
+            "Columnas", [None] + [dimension for dimension in dimensiones if dimension != filas],
+            format_func=lambda dimension: DIMENSIONES_CUBO.get(dimension, "(ninguna)"), key="columnas_cubo"
+        )
+        medida = col3.selectbox("Medida", list(MEDIDAS_CUBO), format_func=MEDIDAS_CUBO.get, key="medida_cubo")
+        if len(cubo.periodos) > 1:
+            desde, hasta = st.select_slider(
+                "Períodos", options=cubo.periodos, value=(cubo.periodos[0], cubo.periodos[-1]), key="rango_cubo"
+            )
+        else:
+            desde = hasta = cubo.periodos[0]
+
+        tabla = cubo.rebanar(situaciones=range(situacion_minima, 7), desde=desde, hasta=hasta).pivotear(
+            filas, columnas, medida
+        )
+        if filas == 'entidad':
+            # Entidades con más exposición primero
+            orden = tabla.sum(axis=1) if columnas else tabla
+            tabla = tabla.loc[orden.sort_values(ascending=False).index]
+        st.dataframe(tabla, use_container_width=True)
+        st.caption(
+            f"Deudas en situación {situacion_minima} o peor. Al sumar varias entidades, un deudor con "
+            "deudas en más de una entidad se cuenta una vez por entidad."
+        )
+
+def mostrar_migracion_cartera(df_resultados):
+    """
+    Tasas de migración mes a mes entre situaciones de la cartera, calculadas sobre la matriz
+    CUIT × período de las deudas históricas (sin consultar la API)
+    """
+    with st.expander("Migración entre situaciones"):
+        # Si el lote se resumió fuera de este proceso (modo procesos o cola de trabajos), las
+        # filas de la cartera se releen del almacén una vez por lote; después ya quedan al día
+        matriz = matriz_cartera(
+            df_resultados['CUIT'].tolist(), recargar=not df_resultados.attrs.get('resumido_en_proceso', False),
+            lote=st.session_state.get('clave_resultados')
+        )
+        periodos = matriz.periodos
+        if len(periodos) < 2:
+            st.caption("No hay deudas históricas de la cartera para calcular migraciones.")
+            return
+
+        col1, col2 = st.columns([3, 1])
+        desde, hasta = col1.select_slider(
+            "Períodos", options=periodos, value=(periodos[0], periodos[-1]), key="rango_migracion"
+        )
+        ponderar = col2.checkbox("Ponderar por monto", key="ponderar_migracion")
+        if desde == hasta:
+            st.info("Elija al menos dos períodos para ver las migraciones.")
+            return
+
+        transiciones = matriz.transiciones(desde, hasta, ponderar)
+        if transiciones.to_numpy().sum() == 0:
+            st.info("No hay meses consecutivos con datos en el rango elegido.")
+            return
+
+        st.plotly_chart(figura_cacheada(figura_migracion, tasas_migracion(transiciones)), use_container_width=True)
+        unidad = "monto del mes de origen (miles $)" if ponderar else "cantidad de pasos CUIT-mes"
+        st.caption(f"Cada fila suma 100%. Base de cálculo por situación de origen: {unidad}.")
+        st.dataframe(transiciones.round(2), use_container_width=True)
+
+def mostrar_perfil_lote(perfil):
+    """
+    Muestra dónde se fue el tiempo de la última consulta perfilada
+    """
+    with st.expander("Perfil de la última consulta", expanded=True):
+        st.caption(f"Duración total: {perfil.duracion:.2f} s. El tiempo propio de cada etapa no incluye sus etapas anidadas.")
+        st.dataframe(perfil.reporte(), hide_index=True, use_container_width=True)
+        if perfil.detalle:
+            st.text(perfil.detalle)
+
+# Segundos entre consultas al estado de un trabajo encolado
+INTERVALO_SEGUIMIENTO = 2
+
+# Consultas anteriores que se ofrecen para comparar
+MAXIMO_SNAPSHOTS_A_COMPARAR = 20
+
 st.title("Consulta Múltiple de Deudores BCRA")
 st.markdown("""
 Esta página permite consultar información de múltiples CUITs/CUILs/CDIs a la vez y 
@@ -669,15 +896,47 @@ Puede ingresar los CUITs/CUILs/CDIs de dos formas:
 """)
 
 # Inicializar variables de estado si no existen
-if 'df_resultados_cache' not in st.session_state:
-    st.session_state.df_resultados_cache = None
-
 if 'cuits_texto_cache' not in st.session_state:
     st.session_state.cuits_texto_cache = ""
 
 if 'consulta_realizada' not in st.session_state:
     st.session_state.consulta_realizada = False
 
+if 'clave_resultados' not in st.session_state:
+    # Al recargar la página, retomar los resultados del lote indicado en la URL si siguen en caché
+    st.session_state.clave_resultados = None
+    df_recuperado = CACHE_LOTES.obtener(st.query_params.get("lote"))
+    if df_recuperado is not None:
+        st.session_state.clave_resultados = st.query_params.get("lote")
+        st.session_state.cuits_texto_cache = ", ".join(df_recuperado['CUIT'])
+        st.session_state.consulta_realizada = True
+
+if 'perfil_lote' not in st.session_state:
+    st.session_state.perfil_lote = None
+
+if 'trabajo_en_cola' not in st.session_state:
+    st.session_state.trabajo_en_cola = None
+
+if 'usuario_cola' not in st.session_state:
+    st.session_state.usuario_cola = f"sesion-{uuid.uuid4().hex[:8]}"
+
+with st.expander("Opciones avanzadas"):
+    st.selectbox("Modo de consulta", list(MODOS_CONSULTA.values()), key="modo_consulta",
+                 index=list(MODOS_CONSULTA).index(MODO_CONSULTA) if MODO_CONSULTA in MODOS_CONSULTA else 0,
+                 help="El modo asíncrono consulta varios CUITs a la vez sobre conexiones persistentes")
+    st.checkbox("Perfilar ejecución", key="perfilar_ejecucion",
+                help="Mide el tiempo de cada etapa (red, JSON, procesamiento, resumen, progreso) durante la consulta")
+    st.selectbox("Perfil completo", ["Ninguno"] + perfiladores_disponibles(), key="perfilador_completo",
+                 disabled=not st.session_state.get('perfilar_ejecucion'))
+    st.checkbox("Ejecutar en la cola de trabajos", key="usar_cola",
+                help="El lote lo procesan trabajadores separados (python cola_trabajos.py trabajador); "
+                     "se puede cerrar la página y retomar el seguimiento")
+    st.text_input("Usuario", key="usuario_cola", disabled=not st.session_state.get('usar_cola'),
+                  help="Los trabajos de distintos usuarios se atienden por turnos")
+
+# Resultados de la última consulta de esta sesión (None si no hay o si ya salieron de la caché)
+df_resultados_cache = CACHE_LOTES.obtener(st.session_state.clave_resultados)
+
 # Opciones de consulta múltiple
 opcion_multiple = st.radio("Seleccione método de entrada", ["Archivo CSV/Excel", "Lista de CUIT/CUIL/CDI"])
 
@@ -703,35 +962,37 @@ if opcion_multiple == "Archivo CSV/Excel":
                 cuits_texto = ','.join(df_cuits['CUIT'].astype(str).tolist())
                 
                 # Solo procesar si ha cambiado la lista de CUITs o no hay resultados en caché
-                if cuits_texto != st.session_state.cuits_texto_cache or st.session_state.df_resultados_cache is None:
+                if cuits_texto != st.session_state.cuits_texto_cache or df_resultados_cache is None:
                     # Procesar la lista de CUITs
-                    df_resultados = procesar_lista_cuits(cuits_texto)
+                    df_resultados = consultar_cuits(cuits_texto)
                     
                     # Guardar en caché
-                    st.session_state.df_resultados_cache = df_resultados
-                    st.session_state.cuits_texto_cache = cuits_texto
+                    df_resultados_cache = guardar_resultados_sesion(df_resultados, cuits_texto)
                     st.session_state.consulta_realizada = True
                 
                 # Usar resultados de caché
-                if st.session_state.df_resultados_cache is not None and not st.session_state.df_resultados_cache.empty:
+                if df_resultados_cache is not None and not df_resultados_cache.empty:
                     # Mostrar resultados en formato visual
-                    mostrar_resultados_multiple_cuits(st.session_state.df_resultados_cache)
+                    mostrar_resultados_multiple_cuits(df_resultados_cache)
+                    mostrar_cambios_desde_ultima_consulta(df_resultados_cache)
+                    mostrar_exposicion_cartera(df_resultados_cache)
+                    mostrar_migracion_cartera(df_resultados_cache)
                     
                     # Permitir consulta detallada de un CUIT específico
                     st.markdown("---")
                     st.subheader("Consulta Detallada de un CUIT específico")
                     
-                    cuits_disponibles = st.session_state.df_resultados_cache['CUIT'].tolist()
+                    cuits_disponibles = df_resultados_cache['CUIT'].tolist()
                     cuit_seleccionado = st.selectbox(
                         "Seleccione un CUIT para ver detalles completos",
                         options=cuits_disponibles,
-                        format_func=lambda x: f"{x} - {st.session_state.df_resultados_cache[st.session_state.df_resultados_cache['CUIT']==x]['Denominación'].values[0]}"
+                        format_func=lambda x: f"{x} - {df_resultados_cache[df_resultados_cache['CUIT']==x]['Denominación'].values[0]}"
                     )
                     
                     if st.button("Ver Detalles Completos", key="btn_detalles_archivo"):
                         if cuit_seleccionado:
                             st.markdown(f"### Detalles completos para {cuit_seleccionado}")
-                            st.markdown(f"**Denominación:** {st.session_state.df_resultados_cache[st.session_state.df_resultados_cache['CUIT']==cuit_seleccionado]['Denominación'].values[0]}")
+                            st.markdown(f"**Denominación:** {df_resultados_cache[df_resultados_cache['CUIT']==cuit_seleccionado]['Denominación'].values[0]}")
                             
                             # Mostrar información detallada
                             with st.spinner(f"Consultando información detallada para {cuit_seleccionado}..."):
@@ -768,35 +1029,37 @@ else:  # Opción Lista de CUIT/CUIL/CDI
     
     if consultar_lista and cuits_lista:
         # Solo procesar si ha cambiado la lista de CUITs o no hay resultados en caché
-        if cuits_lista != st.session_state.cuits_texto_cache or st.session_state.df_resultados_cache is None:
+        if cuits_lista != st.session_state.cuits_texto_cache or df_resultados_cache is None:
             # Procesar la lista de CUITs
-            df_resultados = procesar_lista_cuits(cuits_lista)
+            df_resultados = consultar_cuits(cuits_lista)
             
             # Guardar en caché
-            st.session_state.df_resultados_cache = df_resultados
-            st.session_state.cuits_texto_cache = cuits_lista
+            df_resultados_cache = guardar_resultados_sesion(df_resultados, cuits_lista)
             st.session_state.consulta_realizada = True
     
     # Si ya se realizó una consulta previamente, mostrar los resultados
-    if st.session_state.consulta_realizada and st.session_state.df_resultados_cache is not None:
+    if st.session_state.consulta_realizada and df_resultados_cache is not None:
         # Mostrar resultados en formato visual
-        mostrar_resultados_multiple_cuits(st.session_state.df_resultados_cache)
+        mostrar_resultados_multiple_cuits(df_resultados_cache)
+        mostrar_cambios_desde_ultima_consulta(df_resultados_cache)
+        mostrar_exposicion_cartera(df_resultados_cache)
+        mostrar_migracion_cartera(df_resultados_cache)
         
         # Permitir consulta detallada de un CUIT específico
         st.markdown("---")
         st.subheader("Consulta Detallada de un CUIT específico")
         
-        cuits_disponibles = st.session_state.df_resultados_cache['CUIT'].tolist()
+        cuits_disponibles = df_resultados_cache['CUIT'].tolist()
         cuit_seleccionado = st.selectbox(
             "Seleccione un CUIT para ver detalles completos",
             options=cuits_disponibles,
-            format_func=lambda x: f"{x} - {st.session_state.df_resultados_cache[st.session_state.df_resultados_cache['CUIT']==x]['Denominación'].values[0] if st.session_state.df_resultados_cache[st.session_state.df_resultados_cache['CUIT']==x]['Denominación'].values[0] else x}"
+            format_func=lambda x: f"{x} - {df_resultados_cache[df_resultados_cache['CUIT']==x]['Denominación'].values[0] if df_resultados_cache[df_resultados_cache['CUIT']==x]['Denominación'].values[0] else x}"
         )
         
         if st.button("Ver Detalles Completos", key="btn_detalles_lista"):
             if cuit_seleccionado:
                 st.markdown(f"### Detalles completos para {cuit_seleccionado}")
-                denominacion = st.session_state.df_resultados_cache[st.session_state.df_resultados_cache['CUIT']==cuit_seleccionado]['Denominación'].values[0]
+                denominacion = df_resultados_cache[df_resultados_cache['CUIT']==cuit_seleccionado]['Denominación'].values[0]
                 if denominacion:
                     st.markdown(f"**Denominación:** {denominacion}")
                 
@@ -826,6 +1089,17 @@ else:  # Opción Lista de CUIT/CUIL/CDI
                             st.subheader("Cheques Rechazados")
                             st.dataframe(df_cheques)
 
+# Seguimiento del trabajo encolado desde esta sesión
+if st.session_state.trabajo_en_cola is not None:
+    seguir_trabajo_en_cola(st.session_state.trabajo_en_cola)
+
+# Perfil por etapas de la última consulta, si se pidió
+if st.session_state.perfil_lote is not None:
+    mostrar_perfil_lote(st.session_state.perfil_lote)
+
+# Panel de diagnóstico de las consultas a la API
+mostrar_panel_diagnostico()
+
 hide_streamlit_style = """
             <style>
             #MainMenu {visibility: hidden;}
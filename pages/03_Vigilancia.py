@@ -0,0 +1,127 @@
+import streamlit as st
+import time
+import pandas as pd
+
+# Importar utilidades comunes
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from vigilancia import (
+    agregar_cuits, quitar_cuits, listar_vigilados, listar_cambios, resumen_vigilancia, vigilante_activo,
+    TIPOS_CAMBIO
+)
+
+st.title("Vigilancia de CUITs")
+st.markdown("""
+Esta página administra una lista permanente de CUITs/CUILs/CDIs que se revisan periódicamente,
+sin tener que volver a cargarlos en cada consulta. Los de mayor riesgo (situación 3 o peor, o con
+cheques rechazados) se revisan con más frecuencia, y cada cambio detectado queda registrado.
+
+Las revisiones las hace un proceso separado: `python vigilancia.py vigilante`. Esta página solo lee
+los resultados guardados y no consulta la API.
+""")
+
+resumen = resumen_vigilancia()
+col1, col2, col3, col4 = st.columns(4)
+col1.metric("CUITs vigilados", resumen['vigilados'])
+col2.metric("Revisiones pendientes", resumen['pendientes'])
+col3.metric("Mayor riesgo", resumen['alto_riesgo'])
+col4.metric("Cambios (7 días)", resumen['cambios_semana'])
+
+if resumen['vigilados'] and not vigilante_activo():
+    st.warning("El vigilante no está en ejecución. Inícielo con: python vigilancia.py vigilante")
+
+with st.expander("Agregar o quitar CUITs", expanded=not resumen['vigilados']):
+    uploaded_file = st.file_uploader("Cargar archivo CSV o Excel con una columna 'CUIT'", type=["csv", "xlsx"])
+    cuits_texto = st.text_area("O ingrese CUIT/CUIL/CDI separados por comas", key="cuits_vigilancia")
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("Agregar a la vigilancia"):
+            textos = [cuits_texto]
+            archivo_valido = True
+            if uploaded_file is not None:
+                df_cuits = pd.read_csv(uploaded_file) if uploaded_file.name.endswith('.csv') else pd.read_excel(uploaded_file)
+                if 'CUIT' not in df_cuits.columns:
+                    st.error("El archivo debe contener una columna llamada 'CUIT'")
+                    archivo_valido = False
+                else:
+                    textos.append(','.join(df_cuits['CUIT'].astype(str).tolist()))
+            if archivo_valido:
+                agregados, invalidos = agregar_cuits(','.join(texto for texto in textos if texto))
+                for cuit in invalidos:
+                    st.warning(f"CUIT/CUIL/CDI inválido ignorado: {cuit}")
+                st.success(f"Se agregaron {agregados} CUITs a la vigilancia.")
+    with col2:
+        if st.button("Quitar de la vigilancia") and cuits_texto:
+            st.success(f"Se quitaron {quitar_cuits(cuits_texto)} CUITs de la vigilancia.")
+
+st.subheader("Cambios detectados")
+dias = st.selectbox("Período", ["Últimos 7 días", "Últimos 30 días", "Todos"], key="dias_cambios")
+desde = {"Últimos 7 días": 7, "Últimos 30 días": 30}.get(dias)
+df_cambios = listar_cambios(desde=time.time() - desde * 86400 if desde else None)
+tipos = st.multiselect("Tipos de cambio", list(TIPOS_CAMBIO.values()), default=list(TIPOS_CAMBIO.values()))
+df_cambios = df_cambios[df_cambios['Tipo'].isin(tipos)]
+if df_cambios.empty:
+    st.info("No hay cambios registrados en el período.")
+else:
+    st.dataframe(df_cambios, hide_index=True, use_container_width=True)
+    st.download_button(
+        label="Descargar cambios (CSV)",
+        data=df_cambios.to_csv(index=False).encode('utf-8'),
+        file_name="cambios_vigilancia.csv",
+        mime="text/csv"
+    )
+
+st.subheader("CUITs vigilados")
+df_vigilados = listar_vigilados()
+if df_vigilados.empty:
+    st.info("Todavía no hay CUITs en vigilancia.")
+else:
+    st.dataframe(df_vigilados, hide_index=True, use_container_width=True)
+
+hide_streamlit_style = """
+            <style>
+            #MainMenu {visibility: hidden;}
+            footer {visibility: hidden;}
+            </style>
+            """
+
+custom_footer = """
+            <style>
+            .footer {
+                position: fixed;
+                left: 0;
+                bottom: 0;
+                width: 100%;
+                text-align: center;
+                padding: 10px;
+                color: #7a7a7a;
+                display: flex;
+                justify-content: center;
+                align-items: center;
+            }
+            .footer a {
+                display: flex;
+                align-items: center;
+                color: #0A66C2;
+                text-decoration: none;
+                margin-left: 8px;  /* Añadido espacio a la izquierda del enlace */
+            }
+            .linkedin-logo {
+                height: 16px;
+                margin-right: 5px;
+            }
+            </style>
+            <div class="footer">
+                Desarrollado por
+                <a href="https://www.linkedin.com/in/martinepenas/" target="_blank">
+                    <svg class="linkedin-logo" xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24" fill="#0A66C2">
+                        <path d="M20.5 2h-17A1.5 1.5 0 002 3.5v17A1.5 1.5 0 003.5 22h17a1.5 1.5 0 001.5-1.5v-17A1.5 1.5 0 0020.5 2zM8 19H5v-9h3zM6.5 8.25A1.75 1.75 0 118.3 6.5a1.78 1.78 0 01-1.8 1.75zM19 19h-3v-4.74c0-1.42-.6-1.93-1.38-1.93A1.74 1.74 0 0013 14.19a.66.66 0 000 .14V19h-3v-9h2.9v1.3a3.11 3.11 0 012.7-1.4c1.55 0 3.36.86 3.36 3.66z"></path>
+                    </svg>
+                </a>
+            </div>
+            """
+
+# Aplicar los estilos
+st.markdown(hide_streamlit_style, unsafe_allow_html=True)
+st.markdown(custom_footer, unsafe_allow_html=True)
\ No newline at end of file
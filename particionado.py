@@ -0,0 +1,344 @@
+"""
+Particionado de carteras muy grandes entre varios procesos o equipos.
+
+Un lote se divide en particiones por hash del CUIT y se guarda en un directorio compartido
+(un disco local o un sistema de archivos de red). Cada trabajador, en cualquier equipo que vea
+ese directorio, reclama una partición libre con un archivo de bloqueo, la procesa y escribe su
+resultado de forma atómica. La fusión arma el resultado con el esquema de procesar_lista_cuits
+en el orden de entrada; es determinística e idempotente, así que volver a procesar una partición
+y volver a fusionar da el mismo resultado.
+
+    python particionado.py crear --archivo cartera.csv --particiones 16
+    python particionado.py trabajador datos/lotes/<lote> --procesos 4     (en cada equipo)
+    python particionado.py fusionar datos/lotes/<lote> --salida resultados.csv
+
+    python particionado.py local --archivo cartera.csv --particiones 8 --procesos 4
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import socket
+import time
+
+import numpy as np
+import pandas as pd
+
+import utils
+from cola_trabajos import filas_serializables, incidencias_por_posicion, procesar_tramo
+
+DIRECTORIO_LOTES = os.path.join(utils.DIRECTORIO_DATOS, "lotes")
+
+# Segundos tras los cuales un reclamo sin resultado se considera abandonado
+RECLAMO_MAXIMO = int(os.environ.get("BCRA_RECLAMO_MAXIMO", "900"))
+
+# CUITs por tramo dentro de una partición (el reclamo se renueva después de cada tramo)
+TAMANO_TRAMO = 200
+
+
+def particion_de_cuit(cuit, cantidad_particiones):
+    """
+    Partición de un CUIT. Usa blake2b y no hash(), que cambia entre procesos.
+    """
+    resumen = hashlib.blake2b(cuit.encode('ascii'), digest_size=8).digest()
+    return int.from_bytes(resumen, 'big') % cantidad_particiones
+
+
+def _escribir_json_atomico(ruta, datos):
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    with open(temporal, 'w', encoding='utf-8') as archivo:
+        json.dump(datos, archivo, ensure_ascii=False)
+        archivo.flush()
+        os.fsync(archivo.fileno())
+    os.replace(temporal, ruta)
+
+
+def _leer_json(ruta):
+    with open(ruta, encoding='utf-8') as archivo:
+        return json.load(archivo)
+
+
+def crear_lote(cuits_texto, cantidad_particiones, directorio=None, modo="async"):
+    """
+    Crea (o reutiliza) un lote particionado y devuelve su directorio.
+    El identificador del lote depende de los CUITs, la cantidad de particiones y el período vigente
+    del BCRA (o la fecha de creación si no se pudo determinar), así que crear dos veces el mismo lote
+    dentro de un período no duplica trabajo, pero al publicarse un período nuevo se crea otro lote.
+    """
+    cuits_validos, _ = utils.separar_cuits(cuits_texto)
+    if not cuits_validos:
+        raise ValueError("No se encontraron CUITs/CUILs/CDIs válidos para procesar")
+
+    periodo, _ = utils.verificar_periodo(cuits_validos)
+    vigencia = periodo or time.strftime("%Y%m%d")
+    huella = hashlib.blake2b(
+        (",".join(cuits_validos) + f"|{cantidad_particiones}|{vigencia}").encode('ascii'), digest_size=10
+    ).hexdigest()
+    directorio_lote = os.path.join(directorio or DIRECTORIO_LOTES, huella)
+    if os.path.exists(os.path.join(directorio_lote, "lote.json")):
+        return directorio_lote
+
+    for subdirectorio in ("particiones", "reclamos", "resultados"):
+        os.makedirs(os.path.join(directorio_lote, subdirectorio), exist_ok=True)
+
+    particiones = [[] for _ in range(cantidad_particiones)]
+    for posicion, cuit in enumerate(cuits_validos):
+        particiones[particion_de_cuit(cuit, cantidad_particiones)].append([posicion, cuit])
+    for numero, contenido in enumerate(particiones):
+        _escribir_json_atomico(os.path.join(directorio_lote, "particiones", f"{numero:04d}.json"), contenido)
+
+    # lote.json se escribe al final: su presencia indica que el lote está completo
+    _escribir_json_atomico(os.path.join(directorio_lote, "lote.json"), {
+        'particiones': cantidad_particiones,
+        'total': len(cuits_validos),
+        'modo': modo,
+        'periodo': periodo,
+        'creado': time.time()
+    })
+    return directorio_lote
+
+
+def _ruta(directorio_lote, tipo, numero, extension):
+    return os.path.join(directorio_lote, tipo, f"{numero:04d}.{extension}")
+
+
+def reclamar_particion(directorio_lote, numero, trabajador):
+    """
+    Intenta reclamar una partición creando su archivo de bloqueo en forma exclusiva.
+    Un reclamo vencido (el trabajador dejó de renovarlo) se puede tomar.
+    """
+    ruta_reclamo = _ruta(directorio_lote, "reclamos", numero, "lock")
+    try:
+        descriptor = os.open(ruta_reclamo, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        try:
+            with open(ruta_reclamo) as archivo:
+                dueno = archivo.read()
+            vencido = time.time() - os.path.getmtime(ruta_reclamo) > RECLAMO_MAXIMO
+        except FileNotFoundError:
+            vencido = False
+        if not vencido:
+            return False
+        ruta_vencido = f"{ruta_reclamo}.{trabajador.replace(os.sep, '_')}.vencido"
+        try:
+            os.rename(ruta_reclamo, ruta_vencido)
+        except FileNotFoundError:
+            return False
+        # Entre la lectura y el rename otro trabajador pudo haber tomado el reclamo vencido y creado
+        # uno nuevo: si lo renombrado no es el reclamo vencido que se leyó, se restituye (sin pisar
+        # un reclamo todavía más nuevo) y no se toma la partición
+        with open(ruta_vencido) as archivo:
+            renombrado = archivo.read()
+        if renombrado != dueno or time.time() - os.path.getmtime(ruta_vencido) <= RECLAMO_MAXIMO:
+            try:
+                os.link(ruta_vencido, ruta_reclamo)
+            except FileExistsError:
+                pass
+            os.remove(ruta_vencido)
+            return False
+        return reclamar_particion(directorio_lote, numero, trabajador)
+
+    with os.fdopen(descriptor, 'w') as archivo:
+        archivo.write(f"{trabajador} {time.time()}\n")
+    return True
+
+
+def procesar_particion(directorio_lote, numero, trabajador, modo="async"):
+    """
+    Procesa una partición reclamada y escribe su resultado en forma atómica
+    """
+    contenido = _leer_json(_ruta(directorio_lote, "particiones", numero, "json"))
+    ruta_reclamo = _ruta(directorio_lote, "reclamos", numero, "lock")
+
+    filas = []
+    incidencias = []
+    for inicio in range(0, len(contenido), TAMANO_TRAMO):
+        tramo = contenido[inicio:inicio + TAMANO_TRAMO]
+        resultados, incidencias_tramo = procesar_tramo([cuit for _, cuit in tramo], modo)
+        filas.extend(filas_serializables(resultados))
+        incidencias.extend(incidencias_por_posicion(
+            [{'posicion': posicion, 'cuit': cuit} for posicion, cuit in tramo], incidencias_tramo
+        ))
+        # Renovar el reclamo para que no se considere abandonado
+        os.utime(ruta_reclamo)
+
+    columnas = {
+        columna: [fila[columna] for fila in filas] for columna in utils.TIPOS_RESULTADOS
+    }
+    _escribir_json_atomico(_ruta(directorio_lote, "resultados", numero, "json"), {
+        'posiciones': [posicion for posicion, _ in contenido],
+        'columnas': columnas,
+        'incidencias': incidencias,
+        'trabajador': trabajador,
+        'terminado': time.time()
+    })
+
+
+def estado_lote(directorio_lote):
+    """
+    Devuelve un diccionario con el total de particiones y cuáles están terminadas o reclamadas
+    """
+    lote = _leer_json(os.path.join(directorio_lote, "lote.json"))
+    terminadas = [
+        numero for numero in range(lote['particiones'])
+        if os.path.exists(_ruta(directorio_lote, "resultados", numero, "json"))
+    ]
+    reclamadas = [
+        numero for numero in range(lote['particiones'])
+        if numero not in terminadas and os.path.exists(_ruta(directorio_lote, "reclamos", numero, "lock"))
+    ]
+    return {**lote, 'terminadas': terminadas, 'reclamadas': reclamadas}
+
+
+def ciclo_trabajador(directorio_lote, nombre=None):
+    """
+    Reclama y procesa particiones pendientes del lote hasta que no quede ninguna libre.
+    Devuelve la cantidad de particiones procesadas.
+    """
+    nombre = nombre or f"{socket.gethostname()}:{os.getpid()}"
+    lote = _leer_json(os.path.join(directorio_lote, "lote.json"))
+
+    procesadas = 0
+    # Cada trabajador recorre las particiones desde un punto distinto para reclamar menos veces lo mismo
+    desplazamiento = int(hashlib.blake2b(nombre.encode(), digest_size=4).hexdigest(), 16)
+    for i in range(lote['particiones']):
+        numero = (desplazamiento + i) % lote['particiones']
+        if os.path.exists(_ruta(directorio_lote, "resultados", numero, "json")):
+            continue
+        if not reclamar_particion(directorio_lote, numero, nombre):
+            continue
+        procesar_particion(directorio_lote, numero, nombre, lote.get('modo', 'async'))
+        procesadas += 1
+    return procesadas
+
+
+def fusionar_lote(directorio_lote):
+    """
+    Fusiona los resultados de todas las particiones en un DataFrame con el esquema de
+    procesar_lista_cuits, en el orden de entrada. Falla si falta alguna partición.
+    """
+    lote = _leer_json(os.path.join(directorio_lote, "lote.json"))
+    faltantes = [
+        numero for numero in range(lote['particiones'])
+        if not os.path.exists(_ruta(directorio_lote, "resultados", numero, "json"))
+    ]
+    if faltantes:
+        raise RuntimeError(f"Faltan {len(faltantes)} particiones: {faltantes[:10]}")
+
+    columnas = {
+        columna: np.empty(lote['total'], dtype=tipo) for columna, tipo in utils.TIPOS_RESULTADOS.items()
+    }
+    cubiertas = np.zeros(lote['total'], dtype=bool)
+    for numero in range(lote['particiones']):
+        resultado = _leer_json(_ruta(directorio_lote, "resultados", numero, "json"))
+        posiciones = np.asarray(resultado['posiciones'], dtype=np.int64)
+        if cubiertas[posiciones].any():
+            raise RuntimeError(f"La partición {numero} repite posiciones de otra partición")
+        cubiertas[posiciones] = True
+        for columna, tipo in utils.TIPOS_RESULTADOS.items():
+            columnas[columna][posiciones] = np.asarray(resultado['columnas'][columna], dtype=tipo)
+
+    if not cubiertas.all():
+        raise RuntimeError("Los resultados de las particiones no cubren todo el lote")
+
+    return pd.DataFrame(columnas)
+
+
+def incidencias_lote(directorio_lote):
+    """
+    Incidencias de las particiones terminadas (posición, cuit, endpoint, estado), en orden de entrada
+    """
+    lote = _leer_json(os.path.join(directorio_lote, "lote.json"))
+    filas = []
+    for numero in range(lote['particiones']):
+        ruta = _ruta(directorio_lote, "resultados", numero, "json")
+        if not os.path.exists(ruta):
+            continue
+        cuits = dict(map(tuple, _leer_json(_ruta(directorio_lote, "particiones", numero, "json"))))
+        filas.extend(
+            (posicion, cuits[posicion], endpoint, estado)
+            for posicion, endpoint, estado in _leer_json(ruta).get('incidencias', [])
+        )
+    return pd.DataFrame(sorted(filas), columns=['posicion', 'cuit', 'endpoint', 'estado'])
+
+
+def ejecutar_localmente(directorio_lote, procesos):
+    """
+    Procesa un lote con varios procesos trabajadores en este equipo
+    """
+    trabajadores = [
+        multiprocessing.Process(target=ciclo_trabajador, args=(directorio_lote,)) for _ in range(procesos)
+    ]
+    for trabajador in trabajadores:
+        trabajador.start()
+    for trabajador in trabajadores:
+        trabajador.join()
+
+
+def _leer_cuits(args):
+    if args.archivo:
+        df_cuits = pd.read_csv(args.archivo) if args.archivo.endswith('.csv') else pd.read_excel(args.archivo)
+        return ','.join(df_cuits['CUIT'].astype(str).tolist())
+    return args.cuits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subcomandos = parser.add_subparsers(dest='comando', required=True)
+
+    for nombre in ('crear', 'local'):
+        subcomando = subcomandos.add_parser(nombre)
+        entrada = subcomando.add_mutually_exclusive_group(required=True)
+        entrada.add_argument('--cuits', help="CUITs separados por comas")
+        entrada.add_argument('--archivo', help="Archivo CSV o Excel con una columna 'CUIT'")
+        subcomando.add_argument('--particiones', type=int, default=8)
+        subcomando.add_argument('--modo', choices=list(utils.MODOS_CONSULTA), default="async")
+        subcomando.add_argument('--directorio', help="Directorio compartido de lotes")
+        if nombre == 'local':
+            subcomando.add_argument('--procesos', type=int, default=os.cpu_count() or 1)
+            subcomando.add_argument('--salida', help="Archivo CSV de salida")
+
+    trabajador = subcomandos.add_parser('trabajador')
+    trabajador.add_argument('lote', help="Directorio del lote")
+    trabajador.add_argument('--procesos', type=int, default=1)
+
+    fusionar = subcomandos.add_parser('fusionar')
+    fusionar.add_argument('lote', help="Directorio del lote")
+    fusionar.add_argument('--salida', help="Archivo CSV de salida")
+
+    estado = subcomandos.add_parser('estado')
+    estado.add_argument('lote', help="Directorio del lote")
+
+    args = parser.parse_args()
+
+    if args.comando in ('crear', 'local'):
+        directorio_lote = crear_lote(_leer_cuits(args), args.particiones, args.directorio, args.modo)
+        print(directorio_lote)
+        if args.comando == 'crear':
+            return
+        ejecutar_localmente(directorio_lote, args.procesos)
+        args.lote = directorio_lote
+        args.comando = 'fusionar'
+
+    if args.comando == 'trabajador':
+        ejecutar_localmente(args.lote, args.procesos)
+    elif args.comando == 'estado':
+        estado_actual = estado_lote(args.lote)
+        print(f"{len(estado_actual['terminadas'])}/{estado_actual['particiones']} particiones terminadas, "
+              f"{len(estado_actual['reclamadas'])} en curso")
+    elif args.comando == 'fusionar':
+        df_resultados = fusionar_lote(args.lote)
+        incidencias = incidencias_lote(args.lote)
+        if not incidencias.empty:
+            print(f"Incidencias en {incidencias['posicion'].nunique()} CUITs: "
+                  + ", ".join(f"{estado}: {cantidad}" for estado, cantidad in incidencias['estado'].value_counts().items()))
+        if args.salida:
+            utils.formatear_resultados(df_resultados).to_csv(args.salida, index=False)
+            print(f"Resultados guardados en {args.salida}")
+        else:
+            print(df_resultados.head(20).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""
+Perfilado opcional del procesamiento de CUITs por etapas.
+
+El pipeline marca sus etapas con `etapa(nombre)`; fuera de `perfilar_lote()` esas marcas no
+hacen nada. Dentro de `perfilar_lote()` se acumula el tiempo propio de cada etapa (sin contar
+las etapas anidadas) y, opcionalmente, un perfil completo con cProfile o pyinstrument:
+
+    with perfilar_lote("cprofile") as perfil:
+        procesar_lista_cuits(cuits)
+    print(perfil.reporte())
+"""
+import contextvars
+import cProfile
+import io
+import pstats
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import pandas as pd
+
+try:
+    from pyinstrument import Profiler as ProfilerPyinstrument
+except ImportError:
+    ProfilerPyinstrument = None
+
+# Etapas del pipeline, en el orden en que se muestran en el reporte
+ETAPAS_PIPELINE = ['red', 'json', 'procesar', 'resumen', 'progreso', 'pausa']
+
+_perfil_activo = contextvars.ContextVar('perfil_activo', default=None)
+
+# Pila de etapas abiertas. Al ser una variable de contexto, cada hilo y cada tarea de asyncio
+# tiene la suya y las etapas de corrutinas concurrentes no se mezclan
+_pila_etapas = contextvars.ContextVar('pila_etapas', default=())
+
+
+def perfiladores_disponibles():
+    """
+    Devuelve los perfiladores completos que se pueden usar en este entorno
+    """
+    disponibles = ['cprofile']
+    if ProfilerPyinstrument is not None:
+        disponibles.append('pyinstrument')
+    return disponibles
+
+
+class PerfilLote:
+    """
+    Tiempos acumulados por etapa de un lote. El tiempo de una etapa anidada se descuenta
+    de la etapa que la contiene.
+    """
+
+    def __init__(self, perfilador=None):
+        self.perfilador = perfilador
+        self.tiempo_propio = defaultdict(float)
+        self.tiempo_total = defaultdict(float)
+        self.llamadas = defaultdict(int)
+        self.duracion = 0.0
+        self.detalle = ""
+        self._lock = threading.Lock()
+
+    def registrar(self, nombre, transcurrido, hijas):
+        with self._lock:
+            self.tiempo_total[nombre] += transcurrido
+            self.tiempo_propio[nombre] += transcurrido - hijas
+            self.llamadas[nombre] += 1
+
+    def reporte(self):
+        """
+        Devuelve un DataFrame con llamadas, tiempo propio, tiempo total y porcentaje del lote por etapa.
+        La fila 'sin medir' es el tiempo del lote que no cae en ninguna etapa marcada.
+        """
+        nombres = [e for e in ETAPAS_PIPELINE if e in self.llamadas]
+        nombres += sorted(e for e in self.llamadas if e not in ETAPAS_PIPELINE)
+
+        filas = []
+        for nombre in nombres:
+            filas.append({
+                'Etapa': nombre,
+                'Llamadas': self.llamadas[nombre],
+                'Tiempo propio (s)': round(self.tiempo_propio[nombre], 4),
+                'Tiempo total (s)': round(self.tiempo_total[nombre], 4),
+                'Promedio (ms)': round(self.tiempo_total[nombre] / self.llamadas[nombre] * 1000, 3),
+                '% del lote': round(self.tiempo_propio[nombre] / self.duracion * 100, 1) if self.duracion else 0.0
+            })
+
+        # Con etapas concurrentes (hilos o corrutinas) la suma de tiempos propios puede superar la duración del lote
+        sin_medir = max(self.duracion - sum(self.tiempo_propio.values()), 0.0)
+        filas.append({
+            'Etapa': 'sin medir',
+            'Llamadas': 0,
+            'Tiempo propio (s)': round(sin_medir, 4),
+            'Tiempo total (s)': round(sin_medir, 4),
+            'Promedio (ms)': None,
+            '% del lote': round(sin_medir / self.duracion * 100, 1) if self.duracion else 0.0
+        })
+        return pd.DataFrame(filas)
+
+    def etapas_s(self):
+        """
+        Devuelve el tiempo propio de cada etapa en segundos, como diccionario
+        """
+        return {nombre: self.tiempo_propio[nombre] for nombre in self.llamadas}
+
+
+@contextmanager
+def etapa(nombre):
+    """
+    Marca una etapa del pipeline. Solo mide si hay un perfilado de lote activo.
+    """
+    perfil = _perfil_activo.get()
+    if perfil is None:
+        yield
+        return
+
+    # Cada marco guarda [nombre, inicio, tiempo de etapas hijas]
+    marco = [nombre, time.perf_counter(), 0.0]
+    pila = _pila_etapas.get()
+    token = _pila_etapas.set(pila + (marco,))
+    try:
+        yield
+    finally:
+        _pila_etapas.reset(token)
+        transcurrido = time.perf_counter() - marco[1]
+        if pila:
+            pila[-1][2] += transcurrido
+        perfil.registrar(nombre, transcurrido, marco[2])
+
+
+def perfil_activo():
+    """
+    Devuelve el perfil del lote en curso o None si no se está perfilando
+    """
+    return _perfil_activo.get()
+
+
+@contextmanager
+def perfilar_lote(perfilador=None):
+    """
+    Activa la medición por etapas para el bloque. perfilador puede ser None, 'cprofile' o
+    'pyinstrument'; en los dos últimos casos el reporte completo queda en perfil.detalle.
+    Los hilos que se creen dentro del bloque deben copiar el contexto (contextvars.copy_context)
+    para que sus etapas se registren.
+    """
+    if perfilador == 'pyinstrument' and ProfilerPyinstrument is None:
+        raise ValueError("pyinstrument no está instalado")
+    if perfilador not in (None, 'cprofile', 'pyinstrument'):
+        raise ValueError(f"Perfilador desconocido: {perfilador}")
+
+    perfil = PerfilLote(perfilador)
+    token = _perfil_activo.set(perfil)
+
+    perfilador_cprofile = None
+    perfilador_pyinstrument = None
+    if perfilador == 'cprofile':
+        perfilador_cprofile = cProfile.Profile()
+        perfilador_cprofile.enable()
+    elif perfilador == 'pyinstrument':
+        perfilador_pyinstrument = ProfilerPyinstrument()
+        perfilador_pyinstrument.start()
+
+    inicio = time.perf_counter()
+    try:
+        yield perfil
+    finally:
+        perfil.duracion = time.perf_counter() - inicio
+
+        if perfilador_cprofile is not None:
+            perfilador_cprofile.disable()
+            salida = io.StringIO()
+            pstats.Stats(perfilador_cprofile, stream=salida).sort_stats('cumulative').print_stats(40)
+            perfil.detalle = salida.getvalue()
+        elif perfilador_pyinstrument is not None:
+            perfilador_pyinstrument.stop()
+            perfil.detalle = perfilador_pyinstrument.output_text(unicode=True, color=False)
+
+        _perfil_activo.reset(token)
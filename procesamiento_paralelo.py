@@ -0,0 +1,142 @@
+"""
+Procesamiento de carteras con un grupo de procesos.
+
+Con la red concurrente (cliente_async.py), interpretar las respuestas históricas y calcular el
+resumen de cada CUIT pasa a ser el cuello de botella, y en un solo proceso queda limitado a un núcleo
+por el GIL. En este modo el event loop solo descarga los cuerpos crudos de las respuestas y los
+envía en lotes a procesos de trabajo, que interpretan el JSON, calculan el resumen y devuelven
+columnas compactas (arreglos de numpy por columna) en lugar de DataFrames serializados.
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import utils
+from cliente_async import CONCURRENCIA_POR_DEFECTO, crear_sesion, descargar_cuit_async
+
+# Procesos de trabajo por defecto (BCRA_PROCESOS o la cantidad de núcleos)
+PROCESOS_POR_DEFECTO = int(os.environ.get("BCRA_PROCESOS", "0")) or os.cpu_count() or 1
+
+# CUITs que se envían juntos a un proceso de trabajo
+TAMANO_LOTE = 64
+
+_pool = None
+_pool_procesos = None
+_pool_lock = threading.Lock()
+
+
+def iniciar_proceso_trabajo():
+    """
+    Inicializa cada proceso de trabajo: la matriz de situación de un proceso de trabajo no la lee
+    nadie (el proceso principal la completa desde el almacén), así que no se alimenta
+    """
+    utils.RECEPTORES_TABLAS = [receptor for receptor in utils.RECEPTORES_TABLAS if receptor is not utils.guardar_en_matriz]
+
+
+def obtener_pool(procesos):
+    """
+    Devuelve un grupo de procesos compartido, creado con 'spawn' para no heredar el estado
+    de Streamlit ni los hilos del proceso principal. Se recrea si cambia la cantidad de procesos.
+    """
+    global _pool, _pool_procesos
+
+    with _pool_lock:
+        if _pool is None or _pool_procesos != procesos:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(
+                max_workers=procesos, mp_context=multiprocessing.get_context('spawn'),
+                initializer=iniciar_proceso_trabajo
+            )
+            _pool_procesos = procesos
+    return _pool
+
+
+def filas_a_columnas(filas):
+    """
+    Convierte filas del informe resumido en un diccionario de columnas con los tipos de
+    TIPOS_RESULTADOS. Las columnas numéricas y booleanas viajan como arreglos de numpy.
+    """
+    return {
+        columna: np.array([fila[columna] for fila in filas], dtype=tipo)
+        for columna, tipo in utils.TIPOS_RESULTADOS.items()
+    }
+
+
+def resumir_lote(lote):
+    """
+    Se ejecuta en un proceso de trabajo: interpreta los cuerpos crudos de cada CUIT del lote
+    y devuelve el resumen en columnas. lote es una lista de (cuit, deudas, históricas, cheques).
+    """
+    filas = []
+    for cuit, cuerpo_deudas, cuerpo_historicos, cuerpo_cheques in lote:
+        filas.append(utils.resumir_respuestas(cuit, cuerpo_deudas, cuerpo_historicos, cuerpo_cheques))
+    utils.volcar_datos_locales()
+    return filas_a_columnas(filas)
+
+
+async def procesar_cuits_en_procesos(cuits, procesos=None, concurrencia=None, limite_conexiones=None,
+                                     al_avanzar=None, tamano_lote=TAMANO_LOTE):
+    """
+    Descarga los CUITs con el cliente asíncrono y resume los lotes en un grupo de procesos.
+    Devuelve (columnas, incidencias), con las columnas en el orden de entrada de los CUITs.
+    al_avanzar(completados, total) se llama cada vez que termina un lote.
+    """
+    procesos = procesos or PROCESOS_POR_DEFECTO
+    concurrencia = concurrencia or CONCURRENCIA_POR_DEFECTO
+    pool = obtener_pool(procesos)
+    loop = asyncio.get_running_loop()
+
+    semaforo = asyncio.Semaphore(concurrencia)
+    # Como máximo dos lotes por proceso esperando: acota los cuerpos crudos en memoria
+    lotes_en_curso = asyncio.Semaphore(2 * procesos)
+    incidencias = []
+    pendientes = iter(enumerate(cuits))
+    lote_actual = []
+    tareas_lotes = []
+    completados = 0
+
+    columnas = {
+        columna: np.empty(len(cuits), dtype=tipo)
+        for columna, tipo in utils.TIPOS_RESULTADOS.items()
+    }
+
+    async def resumir_en_proceso(lote):
+        nonlocal completados
+        try:
+            resultado = await loop.run_in_executor(pool, resumir_lote, [elemento[1:] for elemento in lote])
+        finally:
+            lotes_en_curso.release()
+        posiciones = np.fromiter((elemento[0] for elemento in lote), dtype=np.int64, count=len(lote))
+        for columna, valores in resultado.items():
+            columnas[columna][posiciones] = valores
+        completados += len(lote)
+        if al_avanzar is not None:
+            al_avanzar(completados, len(cuits))
+
+    async def enviar_lote():
+        nonlocal lote_actual
+        lote, lote_actual = lote_actual, []
+        await lotes_en_curso.acquire()
+        tareas_lotes.append(asyncio.ensure_future(resumir_en_proceso(lote)))
+
+    async def trabajador():
+        for posicion, cuit in pendientes:
+            cuerpos = await descargar_cuit_async(sesion, cuit, semaforo, incidencias)
+            lote_actual.append((posicion, cuit, *cuerpos))
+            if len(lote_actual) >= tamano_lote:
+                await enviar_lote()
+
+    async with crear_sesion(limite_conexiones) as sesion:
+        cantidad_trabajadores = max(1, min(len(cuits), -(-concurrencia // 3)))
+        await asyncio.gather(*(trabajador() for _ in range(cantidad_trabajadores)))
+
+    if lote_actual:
+        await enviar_lote()
+    await asyncio.gather(*tareas_lotes)
+
+    return columnas, incidencias
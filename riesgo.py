@@ -0,0 +1,149 @@
+"""
+Puntaje de riesgo de los CUITs de una cartera.
+
+El puntaje (0 a 100) combina, con pesos configurables, la peor situación actual, qué tan reciente
+fue la última irregularidad, los días de atraso, las refinanciaciones, los procesos judiciales y la
+cantidad y el monto de cheques rechazados. Cada señal se lleva a una escala de 0 a 1 y el puntaje es
+su promedio ponderado, calculado en una sola pasada vectorizada sobre el informe resumido completo.
+
+Los pesos por defecto se pueden cambiar con BCRA_PESOS_RIESGO (JSON, por ejemplo
+'{"situacion": 50, "cheques": 20}') o desde la página de consulta múltiple.
+
+    python riesgo.py resultados.csv --top 50
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import utils
+
+# Peso de cada señal en el puntaje
+PESOS_RIESGO = {
+    'situacion': 40,
+    'recencia': 20,
+    'atraso': 15,
+    'refinanciaciones': 5,
+    'proceso_judicial': 10,
+    'cheques': 10
+}
+PESOS_RIESGO.update(json.loads(os.environ.get("BCRA_PESOS_RIESGO", "{}")))
+
+# Nombre de cada señal para mostrar
+SENALES_RIESGO = {
+    'situacion': "Peor situación actual",
+    'recencia': "Irregularidad reciente",
+    'atraso': "Días de atraso",
+    'refinanciaciones': "Refinanciaciones",
+    'proceso_judicial': "Proceso judicial",
+    'cheques': "Cheques rechazados"
+}
+
+# Meses a partir de los cuales una irregularidad pasada deja de sumar
+MESES_MEMORIA_IRREGULARIDAD = 24
+
+# Valores a partir de los cuales la señal queda en su máximo
+DIAS_ATRASO_MAXIMO = 365
+CHEQUES_MAXIMO = 5
+MONTO_CHEQUES_MAXIMO = 1_000_000
+
+COLUMNA_PUNTAJE = 'Puntaje Riesgo'
+
+
+def _columna(df, columna, tipo, relleno=0):
+    """
+    Columna del informe como arreglo (relleno si el informe es anterior a esa columna)
+    """
+    if columna not in df.columns:
+        return np.full(len(df), relleno, dtype=tipo)
+    return df[columna].to_numpy(dtype=tipo)
+
+
+def senales_riesgo(df_resultados):
+    """
+    Señales del puntaje en escala de 0 a 1, una columna por señal
+    """
+    situacion = _columna(df_resultados, 'Situación Actual', np.float64)
+    meses = _columna(df_resultados, 'Meses Desde Última Irregularidad', np.float64, utils.SIN_IRREGULARIDAD)
+    dias = _columna(df_resultados, 'Máximo Días Atraso', np.float64)
+    cantidad_cheques = _columna(df_resultados, 'Cantidad Cheques Rechazados', np.float64)
+    monto_cheques = _columna(df_resultados, 'Monto Cheques Rechazados', np.float64)
+
+    # Situación 1 (o sin datos) no suma; 6 es el máximo
+    senal_situacion = np.clip((situacion - 1) / 5, 0, 1)
+    # Una irregularidad en el período actual vale 1 y decae linealmente hasta MESES_MEMORIA_IRREGULARIDAD
+    senal_recencia = np.where(
+        meses == utils.SIN_IRREGULARIDAD, 0.0, np.clip(1 - meses / MESES_MEMORIA_IRREGULARIDAD, 0, 1)
+    )
+    senal_cheques = (
+        np.minimum(cantidad_cheques / CHEQUES_MAXIMO, 1)
+        + np.minimum(np.log1p(monto_cheques) / np.log1p(MONTO_CHEQUES_MAXIMO), 1)
+    ) / 2
+
+    return pd.DataFrame({
+        'situacion': senal_situacion,
+        'recencia': senal_recencia,
+        'atraso': np.clip(dias / DIAS_ATRASO_MAXIMO, 0, 1),
+        'refinanciaciones': _columna(df_resultados, 'Con Refinanciaciones', np.float64),
+        'proceso_judicial': _columna(df_resultados, 'Con Proceso Judicial', np.float64),
+        'cheques': senal_cheques
+    }, index=df_resultados.index)
+
+
+def puntaje_riesgo(df_resultados, pesos=None):
+    """
+    Puntaje de 0 a 100 de cada CUIT: promedio de las señales ponderado por pesos
+    """
+    pesos = {**PESOS_RIESGO, **(pesos or {})}
+    senales = senales_riesgo(df_resultados)
+    vector = np.array([max(float(pesos.get(senal, 0)), 0.0) for senal in senales.columns])
+    if vector.sum() == 0:
+        return pd.Series(0.0, index=df_resultados.index, name=COLUMNA_PUNTAJE)
+    puntaje = senales.to_numpy() @ vector / vector.sum() * 100
+    return pd.Series(np.round(puntaje, 1), index=df_resultados.index, name=COLUMNA_PUNTAJE)
+
+
+def agregar_puntaje(df_resultados, pesos=None):
+    """
+    Informe resumido con la columna del puntaje, ordenado de mayor a menor riesgo
+    """
+    df = df_resultados.assign(**{COLUMNA_PUNTAJE: puntaje_riesgo(df_resultados, pesos)})
+    return df.sort_values(COLUMNA_PUNTAJE, ascending=False, kind='stable')
+
+
+def leer_informe(ruta):
+    """
+    Lee un informe resumido exportado con utils.formatear_resultados y vuelve a los tipos nativos
+    """
+    df = pd.read_csv(ruta, dtype={'CUIT': str})
+    for columna in utils.COLUMNAS_SI_NO:
+        if columna in df.columns and df[columna].dtype == object:
+            df[columna] = df[columna].eq('Sí')
+    if df['Situación Actual'].dtype == object:
+        df['Situación Actual'] = pd.to_numeric(
+            df['Situación Actual'].str.extract(r'^(\d+)', expand=False), errors='coerce'
+        ).fillna(0).astype('int8')
+    if 'Meses Desde Última Irregularidad' in df.columns and df['Meses Desde Última Irregularidad'].dtype == object:
+        df['Meses Desde Última Irregularidad'] = pd.to_numeric(
+            df['Meses Desde Última Irregularidad'], errors='coerce'
+        ).fillna(utils.SIN_IRREGULARIDAD).astype('int16')
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('archivo', help="Informe resumido en CSV (por ejemplo, la salida de cliente_async.py)")
+    parser.add_argument('--top', type=int, default=20, help="Cantidad de CUITs a mostrar")
+    parser.add_argument('--salida', help="Archivo CSV con el informe y el puntaje")
+    args = parser.parse_args()
+
+    df = agregar_puntaje(leer_informe(args.archivo))
+    if args.salida:
+        utils.formatear_resultados(df).to_csv(args.salida, index=False)
+    print(df[['CUIT', 'Denominación', COLUMNA_PUNTAJE]].head(args.top).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
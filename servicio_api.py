@@ -0,0 +1,320 @@
+"""
+Servicio HTTP/JSON sobre el pipeline de consulta, para usarlo desde otros sistemas sin pasar
+por las páginas de Streamlit.
+
+    GET    /salud                        estado del servicio
+    GET    /cuits/<cuit>                 resumen de un CUIT (con ?detalle=1, también las tablas); 404 si el
+                                         BCRA no tiene información y 502/504 si falló la consulta a la API
+    POST   /lotes                        encola un lote: {"cuits": [...], "usuario": "...", "modo": "async"}
+    GET    /lotes/<id>                   estado y avance del lote
+    GET    /lotes/<id>/incidencias       CUITs sin información (404) o con consultas fallidas
+    GET    /lotes/<id>/resultados        resultados en NDJSON, una fila por línea y en orden de entrada;
+                                         por defecto sigue el lote hasta que termina (?esperar=0 para
+                                         devolver solo lo disponible)
+    DELETE /lotes/<id>                   cancela el lote
+
+Los lotes usan la cola de cola_trabajos.py, y todas las consultas a la API pasan por el
+limitador de tasa de utils, así que el servicio comparte con la aplicación el mismo límite.
+
+    python servicio_api.py --puerto 8000 --trabajadores 2
+"""
+import argparse
+import json
+import multiprocessing
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+import utils
+import cola_trabajos
+from cliente_async import RUTAS_ENDPOINTS
+
+RUTA_CUIT = re.compile(r'^/cuits/([^/]+)$')
+RUTA_LOTE = re.compile(r'^/lotes/(\d+)(/resultados|/incidencias)?$')
+
+# Segundos entre consultas a la cola al seguir un lote en curso
+INTERVALO_SEGUIMIENTO = 0.5
+
+# Tamaño máximo del cuerpo de un POST, en bytes
+TAMANO_MAXIMO_CUERPO = 64 * 1024 * 1024
+
+
+def tabla_a_registros(df):
+    """
+    Convierte una tabla de procesar_* en registros JSON (fechas en formato ISO)
+    """
+    if df is None or df.empty:
+        return []
+    return json.loads(df.to_json(orient='records', date_format='iso', force_ascii=False))
+
+
+def mensaje_de_error(cuerpo, por_defecto):
+    """
+    Primer mensaje de errorMessages de una respuesta de error del BCRA, o por_defecto
+    """
+    try:
+        return json.loads(cuerpo)['errorMessages'][0]
+    except (ValueError, TypeError, KeyError, IndexError):
+        return por_defecto
+
+
+def consultar_cuit(cuit, detalle=False):
+    """
+    Consulta los tres endpoints de un CUIT y devuelve (estado HTTP, cuerpo): 200 con su resumen y,
+    opcionalmente, las tablas de procesar_*; 404 si el BCRA no tiene información del CUIT; 502 o
+    504 si alguna consulta a la API falló, para no informar como limpio un CUIT que no se pudo consultar
+    """
+    # Si el BCRA publicó un período nuevo, las respuestas en caché se descartan antes de consultar
+    utils.verificar_periodo([cuit])
+
+    respuestas = {}
+    for endpoint, ruta in RUTAS_ENDPOINTS.items():
+        try:
+            respuestas[endpoint] = utils.descargar_respuesta(f"{utils.BCRA_API_URL}/{ruta}/{cuit}", cuit, endpoint)
+        except requests.exceptions.RequestException as e:
+            respuestas[endpoint] = (utils.estado_de_error(e), None)
+
+    fallidas = {endpoint: estado for endpoint, (estado, _) in respuestas.items() if estado not in (200, 404)}
+    if fallidas:
+        estado = 504 if "timeout" in fallidas.values() else 502
+        if set(fallidas.values()) == {400}:
+            estado = 400
+        return estado, {
+            'status': estado,
+            'errorMessages': [
+                mensaje_de_error(respuestas[endpoint][1], f"La consulta de {endpoint} a la API del BCRA falló ({fallo}).")
+                for endpoint, fallo in fallidas.items()
+            ],
+            'fallidas': fallidas
+        }
+    if all(estado == 404 for estado, _ in respuestas.values()):
+        mensaje = mensaje_de_error(respuestas['deudas'][1], f"No se encontró información para el CUIT/CUIL/CDI: {cuit}")
+        return 404, {'status': 404, 'errorMessages': [mensaje]}
+
+    cuerpos = {endpoint: utils.cuerpo_para_resumir(estado, cuerpo) for endpoint, (estado, cuerpo) in respuestas.items()}
+    respuesta = {
+        'resumen': cola_trabajos.filas_serializables(
+            [utils.resumir_respuestas(cuit, cuerpos['deudas'], cuerpos['historicas'], cuerpos['cheques'])]
+        )[0]
+    }
+    utils.volcar_datos_locales()
+    if detalle:
+        for endpoint, cuerpo in cuerpos.items():
+            hash_respuesta = utils.hash_cuerpo(cuerpo) if cuerpo is not None else None
+            respuesta[endpoint] = tabla_a_registros(utils.tabla_de_respuesta(endpoint, cuerpo, hash_respuesta))
+    return 200, respuesta
+
+
+class ManejadorServicio(BaseHTTPRequestHandler):
+    """
+    Atiende las solicitudes del servicio
+    """
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _responder(self, estado, cuerpo, encabezados=None):
+        datos = json.dumps(cuerpo, ensure_ascii=False).encode('utf-8')
+        self.send_response(estado)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(datos)))
+        for nombre, valor in (encabezados or {}).items():
+            self.send_header(nombre, valor)
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def _error(self, estado, mensaje):
+        self._responder(estado, {'status': estado, 'errorMessages': [mensaje]})
+
+    def _estado_lote(self, trabajo):
+        return {
+            'id': trabajo['id'],
+            'usuario': trabajo['usuario'],
+            'estado': trabajo['estado'],
+            'modo': trabajo['modo'],
+            'total': trabajo['total'],
+            'procesados': trabajo['procesados'],
+            'sin_datos': trabajo['sin_datos'],
+            'fallidos': trabajo['fallidos'],
+            'error': trabajo['error'],
+            'resultados_url': f"/lotes/{trabajo['id']}/resultados",
+            'incidencias_url': f"/lotes/{trabajo['id']}/incidencias"
+        }
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parametros = parse_qs(url.query)
+
+        if url.path == '/salud':
+            self._responder(200, {
+                'estado': 'ok',
+                'trabajadores_activos': cola_trabajos.hay_trabajadores_activos(),
+                'cache': utils.CACHE_RESPUESTAS.estadisticas()
+            })
+            return
+
+        coincidencia = RUTA_CUIT.match(url.path)
+        if coincidencia:
+            cuit = coincidencia.group(1)
+            if not re.match(r'^\d{11}$', cuit):
+                self._error(400, "Parámetro erróneo: el CUIT/CUIL/CDI debe tener 11 dígitos.")
+                return
+            detalle = parametros.get('detalle', ['0'])[0] in ('1', 'true', 'si')
+            self._responder(*consultar_cuit(cuit, detalle))
+            return
+
+        coincidencia = RUTA_LOTE.match(url.path)
+        if not coincidencia:
+            self._error(404, "Recurso inexistente.")
+            return
+
+        trabajo = cola_trabajos.estado_trabajo(int(coincidencia.group(1)))
+        if trabajo is None:
+            self._error(404, "Lote inexistente.")
+            return
+
+        if coincidencia.group(2) == '/incidencias':
+            self._responder(200, cola_trabajos.incidencias_trabajo(trabajo['id']).to_dict('records'))
+        elif coincidencia.group(2):
+            esperar = parametros.get('esperar', ['1'])[0] not in ('0', 'false', 'no')
+            self._transmitir_resultados(trabajo['id'], esperar)
+        else:
+            self._responder(200, self._estado_lote(trabajo))
+
+    def _transmitir_resultados(self, trabajo_id, esperar):
+        """
+        Envía los resultados en NDJSON con codificación chunked, a medida que se guardan
+        """
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        siguiente = 0
+        while True:
+            # El estado se lee antes que los resultados: si ya era final, no van a aparecer filas nuevas
+            estado = cola_trabajos.estado_trabajo(trabajo_id)['estado']
+            lineas = []
+            for posicion, fila in cola_trabajos.iterar_resultados(trabajo_id, desde=siguiente):
+                lineas.append(json.dumps(fila, ensure_ascii=False))
+                siguiente = posicion + 1
+            if lineas:
+                datos = ("\n".join(lineas) + "\n").encode('utf-8')
+                self.wfile.write(f"{len(datos):X}\r\n".encode('ascii') + datos + b"\r\n")
+                self.wfile.flush()
+            if not esperar or estado in cola_trabajos.ESTADOS_FINALES:
+                break
+            time.sleep(INTERVALO_SEGUIMIENTO)
+
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_POST(self):
+        if urlparse(self.path).path != '/lotes':
+            self._error(404, "Recurso inexistente.")
+            return
+
+        longitud = int(self.headers.get('Content-Length') or 0)
+        if longitud > TAMANO_MAXIMO_CUERPO:
+            self._error(413, "El lote es demasiado grande.")
+            return
+        try:
+            cuerpo = json.loads(self.rfile.read(longitud) or b"{}")
+        except ValueError:
+            self._error(400, "El cuerpo debe ser JSON.")
+            return
+
+        cuits = cuerpo.get('cuits')
+        if isinstance(cuits, list):
+            cuits = ",".join(str(cuit) for cuit in cuits)
+        if not cuits:
+            self._error(400, "Falta la lista de CUITs ('cuits').")
+            return
+        modo = cuerpo.get('modo', 'async')
+        if modo not in utils.MODOS_CONSULTA:
+            self._error(400, f"Modo desconocido: {modo}")
+            return
+
+        trabajo_id, invalidos = cola_trabajos.encolar_trabajo(cuits, cuerpo.get('usuario', 'servicio'), modo)
+        if trabajo_id is None:
+            self._error(400, "No se encontraron CUITs/CUILs/CDIs válidos para procesar.")
+            return
+
+        respuesta = self._estado_lote(cola_trabajos.estado_trabajo(trabajo_id))
+        respuesta['invalidos'] = invalidos
+        self._responder(202, respuesta, {"Location": f"/lotes/{trabajo_id}"})
+
+    def do_DELETE(self):
+        coincidencia = RUTA_LOTE.match(urlparse(self.path).path)
+        if not coincidencia or coincidencia.group(2):
+            self._error(404, "Recurso inexistente.")
+            return
+        trabajo_id = int(coincidencia.group(1))
+        if cola_trabajos.estado_trabajo(trabajo_id) is None:
+            self._error(404, "Lote inexistente.")
+            return
+        cola_trabajos.cancelar_trabajo(trabajo_id)
+        self._responder(200, self._estado_lote(cola_trabajos.estado_trabajo(trabajo_id)))
+
+
+class ServidorServicio(ThreadingHTTPServer):
+    """
+    Servidor HTTP multihilo del servicio
+    """
+    daemon_threads = True
+
+    def __init__(self, direccion, verbose=False):
+        super().__init__(direccion, ManejadorServicio)
+        self.verbose = verbose
+
+    @property
+    def url_base(self):
+        host, puerto = self.server_address[:2]
+        return f"http://{host}:{puerto}"
+
+
+def iniciar_servicio(host="127.0.0.1", puerto=0, verbose=False):
+    """
+    Inicia el servicio en un hilo en segundo plano y devuelve el servidor (servidor.url_base).
+    Para detenerlo: servidor.shutdown()
+    """
+    servidor = ServidorServicio((host, puerto), verbose)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--puerto', type=int, default=8000)
+    parser.add_argument('--trabajadores', type=int, default=0,
+                        help="Procesos trabajadores de la cola a iniciar junto con el servicio")
+    parser.add_argument('--verbose', action='store_true', help="Registrar cada solicitud")
+    args = parser.parse_args()
+
+    # No son daemon: en modo "procesos" los trabajadores crean sus propios procesos
+    trabajadores = [
+        multiprocessing.Process(target=cola_trabajos.ciclo_trabajador) for _ in range(args.trabajadores)
+    ]
+    for trabajador in trabajadores:
+        trabajador.start()
+
+    servidor = ServidorServicio((args.host, args.puerto), args.verbose)
+    print(f"Servicio de consultas escuchando en {servidor.url_base}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        for trabajador in trabajadores:
+            trabajador.terminate()
+
+
+if __name__ == '__main__':
+    main()
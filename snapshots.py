@@ -0,0 +1,234 @@
+"""
+Snapshots de los resultados de cada cartera y comparación entre corridas.
+
+Cada resultado de procesar_lista_cuits se guarda como un .npz comprimido con una columna tipada
+por campo del informe resumido (CUIT como entero de 64 bits, situación en int8, etc.), en
+datos/snapshots/<cartera>/, donde <cartera> identifica el conjunto de CUITs. comparar_snapshots
+alinea dos snapshots por CUIT y calcula los cambios sobre los arreglos, sin recorrer filas.
+
+    python snapshots.py listar
+    python snapshots.py comparar anterior.npz actual.npz --salida cambios.csv
+"""
+import argparse
+import hashlib
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import utils
+
+DIRECTORIO_SNAPSHOTS = os.path.join(utils.DIRECTORIO_DATOS, "snapshots")
+
+# Columna del informe resumido -> (campo del snapshot, tipo)
+CAMPOS_SNAPSHOT = {
+    'CUIT': ('cuit', np.int64),
+    'Denominación': ('denominacion', np.str_),
+    'Situación Actual': ('situacion', np.int8),
+    'Tiene Situación Irregular': ('irregular', np.bool_),
+    'Tuvo Situación Irregular': ('tuvo_irregular', np.bool_),
+    'Tiene Cheques Rechazados': ('cheques', np.bool_),
+    'Deuda Total (miles $)': ('deuda', np.float64),
+    'Cantidad Entidades': ('entidades', np.int32),
+    'Cantidad Cheques Rechazados': ('cantidad_cheques', np.int32)
+}
+
+
+def identificar_cartera(cuits):
+    """
+    Identificador estable del conjunto de CUITs de una cartera, sin importar el orden
+    """
+    unicos = np.unique(np.asarray(cuits, dtype=np.int64))
+    return hashlib.blake2b(unicos.tobytes(), digest_size=8).hexdigest()
+
+
+def a_arreglos(df_resultados):
+    """
+    Convierte un informe resumido en un diccionario de arreglos tipados (el contenido del snapshot)
+    """
+    return {
+        campo: df_resultados[columna].to_numpy(dtype=tipo)
+        for columna, (campo, tipo) in CAMPOS_SNAPSHOT.items()
+    }
+
+
+def guardar_snapshot(df_resultados, directorio=None):
+    """
+    Guarda el informe resumido como snapshot de su cartera y devuelve la ruta del archivo
+    """
+    arreglos = a_arreglos(df_resultados)
+    directorio_cartera = os.path.join(directorio or DIRECTORIO_SNAPSHOTS, identificar_cartera(arreglos['cuit']))
+    os.makedirs(directorio_cartera, exist_ok=True)
+
+    creado = time.time()
+    ruta = os.path.join(directorio_cartera, datetime.fromtimestamp(creado).strftime("%Y%m%d-%H%M%S-%f") + ".npz")
+    temporal = ruta + ".tmp"
+    with open(temporal, "wb") as archivo:
+        np.savez_compressed(
+            archivo, creado=np.float64(creado),
+            periodo=np.str_(utils.CACHE_RESPUESTAS.periodo or ""), **arreglos
+        )
+    os.replace(temporal, ruta)
+    return ruta
+
+
+def cargar_snapshot(ruta):
+    """
+    Carga un snapshot: devuelve el diccionario de arreglos, con 'creado' y 'periodo'
+    """
+    with np.load(ruta, allow_pickle=False) as datos:
+        snapshot = {campo: datos[campo] for campo in datos.files}
+    snapshot['creado'] = float(snapshot['creado'])
+    snapshot['periodo'] = str(snapshot['periodo'])
+    return snapshot
+
+
+def listar_snapshots(cartera=None, directorio=None):
+    """
+    Lista los snapshots (de una cartera o de todas), del más reciente al más antiguo
+    """
+    directorio = directorio or DIRECTORIO_SNAPSHOTS
+    if not os.path.isdir(directorio):
+        return []
+    carteras = [cartera] if cartera else sorted(os.listdir(directorio))
+    rutas = []
+    for nombre in carteras:
+        directorio_cartera = os.path.join(directorio, nombre)
+        if os.path.isdir(directorio_cartera):
+            rutas.extend(
+                os.path.join(directorio_cartera, archivo)
+                for archivo in os.listdir(directorio_cartera) if archivo.endswith(".npz")
+            )
+    # El nombre del archivo es la fecha de creación
+    return sorted(rutas, key=os.path.basename, reverse=True)
+
+
+def snapshots_anteriores(df_resultados, directorio=None):
+    """
+    Snapshots de la misma cartera anteriores al resultado (al snapshot de df.attrs['snapshot'],
+    si lo tiene), del más reciente al más antiguo
+    """
+    cartera = identificar_cartera(df_resultados['CUIT'].to_numpy(dtype=np.int64))
+    propio = df_resultados.attrs.get('snapshot')
+    rutas = listar_snapshots(cartera, directorio)
+    if propio in rutas:
+        return rutas[rutas.index(propio) + 1:]
+    return rutas
+
+
+def _sin_duplicados(snapshot):
+    """
+    Ordena el snapshot por CUIT y descarta los CUITs repetidos (queda la primera aparición)
+    """
+    cuits, posiciones = np.unique(snapshot['cuit'], return_index=True)
+    return cuits, posiciones
+
+
+def comparar_snapshots(anterior, actual):
+    """
+    Compara dos snapshots alineados por CUIT. Devuelve (cambios, resumen): cambios es un DataFrame
+    con los CUITs presentes en ambos que cambiaron de situación, pasaron a irregular, tienen cheques
+    rechazados nuevos o cambiaron de deuda; resumen cuenta cada tipo de cambio, altas y bajas.
+    La situación 0 es "Sin datos": pasar de o a 0 no cuenta como empeorar ni mejorar, sino como
+    CUITs que aparecieron o desaparecieron del BCRA.
+    """
+    cuits_anterior, posiciones_anterior = _sin_duplicados(anterior)
+    cuits_actual, posiciones_actual = _sin_duplicados(actual)
+    comunes, en_anterior, en_actual = np.intersect1d(
+        cuits_anterior, cuits_actual, assume_unique=True, return_indices=True
+    )
+    indice_anterior = posiciones_anterior[en_anterior]
+    indice_actual = posiciones_actual[en_actual]
+
+    def alinear(campo):
+        return anterior[campo][indice_anterior], actual[campo][indice_actual]
+
+    situacion_anterior, situacion_actual = alinear('situacion')
+    irregular_anterior, irregular_actual = alinear('irregular')
+    cheques_anterior, cheques_actual = alinear('cantidad_cheques')
+    deuda_anterior, deuda_actual = alinear('deuda')
+
+    con_datos = (situacion_anterior != 0) & (situacion_actual != 0)
+    variacion_situacion = np.where(
+        con_datos, situacion_actual.astype(np.int16) - situacion_anterior.astype(np.int16), 0
+    ).astype(np.int8)
+    aparecieron = (situacion_anterior == 0) & (situacion_actual != 0)
+    desaparecieron = (situacion_anterior != 0) & (situacion_actual == 0)
+    nuevo_irregular = irregular_actual & ~irregular_anterior
+    cheques_nuevos = np.maximum(cheques_actual - cheques_anterior, 0)
+    variacion_deuda = deuda_actual - deuda_anterior
+    cambio = ((variacion_situacion != 0) | aparecieron | desaparecieron | nuevo_irregular
+              | (cheques_nuevos > 0) | (variacion_deuda != 0))
+
+    seleccion = np.flatnonzero(cambio)
+    cambios = pd.DataFrame({
+        'CUIT': comunes[seleccion].astype(str),
+        'Denominación': actual['denominacion'][indice_actual[seleccion]],
+        'Situación Anterior': situacion_anterior[seleccion],
+        'Situación Actual': situacion_actual[seleccion],
+        'Variación Situación': variacion_situacion[seleccion],
+        'Cambio Datos': np.where(aparecieron[seleccion], "Aparece", np.where(desaparecieron[seleccion], "Desaparece", "")),
+        'Nuevo Irregular': nuevo_irregular[seleccion],
+        'Cheques Nuevos': cheques_nuevos[seleccion],
+        'Deuda Anterior (miles $)': deuda_anterior[seleccion],
+        'Deuda Actual (miles $)': deuda_actual[seleccion],
+        'Variación Deuda (miles $)': variacion_deuda[seleccion]
+    })
+
+    resumen = {
+        'comunes': len(comunes),
+        'altas': len(cuits_actual) - len(comunes),
+        'bajas': len(cuits_anterior) - len(comunes),
+        'empeoraron': int((variacion_situacion > 0).sum()),
+        'mejoraron': int((variacion_situacion < 0).sum()),
+        'aparecieron': int(aparecieron.sum()),
+        'desaparecieron': int(desaparecieron.sum()),
+        'nuevos_irregulares': int(nuevo_irregular.sum()),
+        'con_cheques_nuevos': int((cheques_nuevos > 0).sum()),
+        'variacion_deuda': float(variacion_deuda.sum())
+    }
+    return cambios, resumen
+
+
+def descripcion_snapshot(ruta):
+    """
+    Texto para elegir un snapshot: fecha de creación y cantidad de CUITs
+    """
+    # Solo se leen los campos necesarios del .npz
+    with np.load(ruta, allow_pickle=False) as datos:
+        fecha = datetime.fromtimestamp(float(datos['creado'])).strftime("%d/%m/%Y %H:%M:%S")
+        periodo = f", período {datos['periodo']}" if str(datos['periodo']) else ""
+        return f"{fecha} ({len(datos['cuit'])} CUITs{periodo})"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subcomandos = parser.add_subparsers(dest='comando', required=True)
+
+    listar = subcomandos.add_parser('listar', help="Lista los snapshots guardados")
+    listar.add_argument('--cartera', help="Identificador de la cartera")
+
+    comparar = subcomandos.add_parser('comparar', help="Compara dos snapshots")
+    comparar.add_argument('anterior')
+    comparar.add_argument('actual')
+    comparar.add_argument('--salida', help="Archivo CSV con los cambios")
+    args = parser.parse_args()
+
+    if args.comando == 'listar':
+        for ruta in listar_snapshots(args.cartera):
+            print(f"{ruta}  {descripcion_snapshot(ruta)}")
+        return
+
+    cambios, resumen = comparar_snapshots(cargar_snapshot(args.anterior), cargar_snapshot(args.actual))
+    for clave, valor in resumen.items():
+        print(f"{clave}: {valor}")
+    if args.salida:
+        cambios.to_csv(args.salida, index=False)
+    else:
+        print(cambios.to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -3,17 +3,79 @@ import requests
 import pandas as pd
 import numpy as np
 import json
-from datetime import datetime
+import hashlib
+import os
+import sys
+import sqlite3
 import time
 import re
+import math
+import concurrent.futures
+import threading
 import urllib3
-import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
+from metricas import REGISTRO as REGISTRO_METRICAS, iniciar_servidor_metricas
+from perfilado import etapa
+from cache_global import CACHE_PROCESADO, CACHE_RESPUESTAS, ENDPOINTS_CACHEABLES, ESTADOS_CACHEABLES
+
 # Suprimir advertencias SSL
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+# URL base de la API de Central de Deudores. Se puede apuntar a un servidor local
+# (por ejemplo bcra_simulado.py) con la variable de entorno BCRA_API_URL
+BCRA_API_URL = os.environ.get("BCRA_API_URL", "https://api.bcra.gob.ar/centraldedeudores/v1.0").rstrip('/')
+
+# Tiempo máximo de espera por consulta a la API, en segundos
+BCRA_API_TIMEOUT = float(os.environ.get("BCRA_API_TIMEOUT", "30"))
+
+# Pausa entre CUITs en el procesamiento secuencial, para no sobrecargar la API
+PAUSA_ENTRE_CUITS = float(os.environ.get("BCRA_PAUSA_ENTRE_CUITS", "0.5"))
+
+# Directorio de datos locales de la aplicación (cola de trabajos, particiones, cachés)
+DIRECTORIO_DATOS = os.environ.get(
+    "BCRA_DATOS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "datos")
+)
+
+# Modo de consulta de carteras: "secuencial" (requests, un CUIT por vez), "async" (cliente_async.py)
+# o "procesos" (descarga asíncrona y resumen en varios procesos, procesamiento_paralelo.py)
+MODO_CONSULTA = os.environ.get("BCRA_MODO_CONSULTA", "secuencial")
+MODOS_CONSULTA = {
+    "secuencial": "Secuencial",
+    "async": "Asíncrono (concurrente)",
+    "procesos": "Asíncrono con procesos en paralelo"
+}
+
+# Guardar un snapshot de cada consulta múltiple en DIRECTORIO_DATOS/snapshots (snapshots.py)
+GUARDAR_SNAPSHOTS = os.environ.get("BCRA_SNAPSHOTS", "1") != "0"
+
+# Guardar las tablas de cada CUIT resumido en el almacén analítico local (almacen.py)
+GUARDAR_ALMACEN = os.environ.get("BCRA_ALMACEN", "1") != "0"
+
+# Archivar las respuestas crudas de la API, comprimidas y por contenido (archivo_crudo.py)
+GUARDAR_CRUDO = os.environ.get("BCRA_ARCHIVO_CRUDO", "0") == "1"
+
+# Acumular la historia de situación de cada CUIT en la matriz CUIT × período (matriz_situacion.py)
+GUARDAR_MATRIZ = os.environ.get("BCRA_MATRIZ", "1") != "0"
+
+# Máximo de consultas por segundo a la API (sin límite si no está definido)
+BCRA_MAX_RPS = float(os.environ.get("BCRA_MAX_RPS", "0"))
+
+# Reintentos ante una respuesta 429 de la API, esperando lo que indique su Retry-After
+REINTENTOS_429 = int(os.environ.get("BCRA_REINTENTOS_429", "2"))
+
+# Segundos máximos de espera ante un Retry-After
+ESPERA_MAXIMA_429 = 30.0
+
+# CUITs con deudas informadas que se usan para detectar la publicación de un período nuevo
+# (si no se definen, se usan los primeros CUITs de cada cartera)
+CUITS_TESTIGO = [cuit.strip() for cuit in os.environ.get("BCRA_CUITS_TESTIGO", "").split(",") if cuit.strip()]
+CANTIDAD_TESTIGOS = 3
+
+# Exponer /metrics por HTTP si está definido BCRA_METRICAS_PUERTO
+iniciar_servidor_metricas()
+
 # Definir colores para las situaciones crediticias
 SITUACION_COLORS = {
     1: "#4CAF50",  # Verde (mejor situación)
@@ -34,29 +96,209 @@ SITUACION_MAP = {
     6: "Irrecuperable por disposición técnica"
 }
 
-def consultar_api(url, cuit, tipo_consulta="general"):
+# Etiquetas de la situación actual para presentación (0 indica que no hay datos)
+ETIQUETAS_SITUACION = {0: "Sin datos"}
+ETIQUETAS_SITUACION.update({
+    situacion: f"{situacion}: {descripcion}" for situacion, descripcion in SITUACION_MAP.items()
+})
+
+# Columnas del informe resumido que se guardan como booleanos y se presentan como Sí/No
+COLUMNAS_SI_NO = [
+    'Tiene Situación Irregular', 'Tuvo Situación Irregular', 'Tiene Cheques Rechazados',
+    'Con Refinanciaciones', 'Con Proceso Judicial'
+]
+
+# Tipos de las columnas del informe resumido
+TIPOS_RESULTADOS = {
+    'CUIT': 'object',
+    'Denominación': 'object',
+    'Situación Actual': 'int8',
+    'Tiene Situación Irregular': 'bool',
+    'Tuvo Situación Irregular': 'bool',
+    'Tiene Cheques Rechazados': 'bool',
+    'Deuda Total (miles $)': 'float64',
+    'Cantidad Entidades': 'int32',
+    'Detalle Situaciones': 'object',
+    'Cantidad Cheques Rechazados': 'int32',
+    'Máximo Días Atraso': 'int32',
+    'Con Refinanciaciones': 'bool',
+    'Con Proceso Judicial': 'bool',
+    'Meses Desde Última Irregularidad': 'int16',
+    'Monto Cheques Rechazados': 'float64'
+}
+
+# Valor de 'Meses Desde Última Irregularidad' para los CUITs sin irregularidades en la historia informada
+SIN_IRREGULARIDAD = -1
+
+# Estilos de resaltado para las columnas Sí/No
+ESTILO_SI = 'background-color: rgba(255, 99, 71, 0.2);'  # Rojo claro
+ESTILO_NO = 'background-color: rgba(144, 238, 144, 0.2);'  # Verde claro
+
+# Opciones de filas por página para la tabla de resultados
+OPCIONES_FILAS_POR_PAGINA = [25, 50, 100, 250]
+
+class LimitadorTasa:
     """
-    Consulta la API del BCRA con manejo de errores.
-    El parámetro tipo_consulta permite personalizar el comportamiento para diferentes tipos de consultas.
+    Cubeta de fichas compartida entre hilos y corrutinas. reservar() descuenta una ficha y
+    devuelve cuántos segundos hay que esperar antes de enviar la consulta; así el mismo
+    limitador sirve con time.sleep y con asyncio.sleep.
+    """
+
+    def __init__(self, consultas_por_segundo, rafaga=None):
+        self.tasa = consultas_por_segundo
+        self.capacidad = rafaga if rafaga is not None else max(consultas_por_segundo, 1)
+        self.fichas = self.capacidad
+        self.ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reservar(self):
+        if self.tasa <= 0:
+            return 0.0
+        with self._lock:
+            ahora = time.monotonic()
+            self.fichas = min(self.capacidad, self.fichas + (ahora - self.ultimo) * self.tasa)
+            self.ultimo = ahora
+            self.fichas -= 1
+            # Con fichas negativas la consulta queda en cola detrás de las ya reservadas
+            return 0.0 if self.fichas >= 0 else -self.fichas / self.tasa
+
+    def esperar(self):
+        espera = self.reservar()
+        if espera > 0:
+            time.sleep(espera)
+
+# Limitador global del proceso para todas las consultas a la API
+LIMITADOR_API = LimitadorTasa(BCRA_MAX_RPS)
+
+def espera_reintento(retry_after):
+    """
+    Segundos a esperar antes de reintentar una respuesta 429, según su encabezado Retry-After
+    (1 segundo si no lo informa o no es una cantidad de segundos)
+    """
+    try:
+        return min(max(float(retry_after), 0.0), ESPERA_MAXIMA_429)
+    except (TypeError, ValueError):
+        return 1.0
+
+def descargar_api(url, tipo_consulta="general"):
+    """
+    Descarga una respuesta de la API aplicando el límite de tasa y registra la llamada en las métricas.
+    Una respuesta 429 se reintenta hasta REINTENTOS_429 veces, esperando lo que indique Retry-After.
+    Devuelve (estado, cuerpo); los errores de red se registran y se propagan.
+    """
+    for reintento in range(REINTENTOS_429 + 1):
+        LIMITADOR_API.esperar()
+        inicio = time.perf_counter()
+        try:
+            # Desactivar la verificación SSL para evitar problemas de certificados
+            with etapa('red'):
+                response = requests.get(url, verify=False, timeout=BCRA_API_TIMEOUT)
+        except requests.exceptions.RequestException as e:
+            # Errores de red: se registran como llamadas sin respuesta
+            estado = "timeout" if isinstance(e, requests.exceptions.Timeout) else "error"
+            REGISTRO_METRICAS.registrar_llamada(
+                tipo_consulta, estado, 0, time.perf_counter() - inicio, reintentos=int(reintento > 0)
+            )
+            raise
+        REGISTRO_METRICAS.registrar_llamada(
+            tipo_consulta, response.status_code, len(response.content), time.perf_counter() - inicio,
+            reintentos=int(reintento > 0)
+        )
+        if response.status_code != 429 or reintento == REINTENTOS_429:
+            return response.status_code, response.content
+        with etapa('pausa'):
+            time.sleep(espera_reintento(response.headers.get('Retry-After')))
+
+def guardar_respuesta(tipo_consulta, cuit, estado, cuerpo):
+    """
+    Guarda una respuesta recién descargada en la caché compartida y, si está activado, en el
+    archivo de respuestas crudas
+    """
+    CACHE_RESPUESTAS.guardar(tipo_consulta, cuit, estado, cuerpo)
+    if GUARDAR_CRUDO and tipo_consulta in ENDPOINTS_CACHEABLES and estado in ESTADOS_CACHEABLES:
+        # Import diferido: archivo_crudo importa este módulo
+        from archivo_crudo import ARCHIVO_CRUDO
+        ARCHIVO_CRUDO.guardar(tipo_consulta, cuit, estado, cuerpo)
+
+def hash_cuerpo(cuerpo):
     """
+    Hash del contenido de una respuesta: dos cuerpos con el mismo hash son idénticos
+    """
+    return hashlib.blake2b(cuerpo, digest_size=16).hexdigest()
+
+# Cuerpo con el que se resume un endpoint que respondió 404 (sin datos): sus tablas llegan vacías a
+# los RECEPTORES_TABLAS, que así pueden borrar lo que ya no se informa. None queda para las
+# consultas que no se hicieron o fallaron, que no deben borrar nada.
+CUERPO_SIN_DATOS = b"{}"
+
+def cuerpo_para_resumir(estado, cuerpo):
+    """
+    Cuerpo de una respuesta tal como se entrega a resumir_respuestas: el cuerpo si fue 200,
+    CUERPO_SIN_DATOS si fue 404 y None si la consulta falló
+    """
+    if estado == 200:
+        return cuerpo
+    return CUERPO_SIN_DATOS if estado == 404 else None
+
+def interpretar_json(cuerpo):
+    """
+    Interpreta el cuerpo de una respuesta; None si no hubo respuesta o no es JSON válido
+    """
+    if cuerpo is None:
+        return None
     try:
-        # Desactivar la verificación SSL para evitar problemas de certificados
-        response = requests.get(url, verify=False)
+        with etapa('json'):
+            return json.loads(cuerpo)
+    except ValueError:
+        return None
+
+def descargar_respuesta(url, cuit, tipo_consulta="general"):
+    """
+    (estado, cuerpo) de la respuesta de la API, de la caché compartida o recién descargada.
+    No muestra mensajes; los errores de red se propagan como en descargar_api.
+    """
+    # Las respuestas 200 y 404 de los tres endpoints se comparten entre sesiones (cache_global.py)
+    respuesta = CACHE_RESPUESTAS.obtener(tipo_consulta, cuit)
+    if respuesta is None:
+        respuesta = descargar_api(url, tipo_consulta)
+        guardar_respuesta(tipo_consulta, cuit, *respuesta)
+    return respuesta
+
+def estado_de_error(error):
+    """
+    Estado con el que se registra una consulta que no obtuvo respuesta ('timeout' o 'error')
+    """
+    return "timeout" if isinstance(error, requests.exceptions.Timeout) else "error"
+
+def obtener_respuesta(url, cuit, tipo_consulta="general", incidencias=None):
+    """
+    Cuerpo crudo de la respuesta de la API (de la caché compartida o recién descargada),
+    CUERPO_SIN_DATOS si fue 404 o None si falló (ver cuerpo_para_resumir). Los errores se informan igual que en consultar_api; si se pasa la lista incidencias
+    (fuera de Streamlit), se agregan a ella como (cuit, endpoint, estado) sin mostrar mensajes.
+    """
+    try:
+        estado, cuerpo = descargar_respuesta(url, cuit, tipo_consulta)
         
         # Suprimir las advertencias de seguridad relacionadas con la verificación SSL
         requests.packages.urllib3.disable_warnings(requests.packages.urllib3.exceptions.InsecureRequestWarning)
         
-        if response.status_code == 200:
-            return response.json()
-        elif response.status_code == 404:
+        if incidencias is not None:
+            # La falta de cheques rechazados (404) es el caso normal y no se informa
+            if estado != 200 and not (tipo_consulta == "cheques" and estado == 404):
+                incidencias.append((cuit, tipo_consulta, estado))
+            return cuerpo_para_resumir(estado, cuerpo)
+        
+        if estado == 200:
+            return cuerpo
+        elif estado == 404:
             # Comportamiento personalizado según el tipo de consulta
             if tipo_consulta != "cheques" or tipo_consulta == "silencioso":
                 st.warning(f"No se encontró información para el CUIT/CUIL/CDI: {cuit}")
-            return None
-        elif response.status_code == 400:
+            return CUERPO_SIN_DATOS
+        elif estado == 400:
             error_msg = "Parámetro erróneo. Asegúrese de ingresar un CUIT/CUIL/CDI válido de 11 dígitos."
             try:
-                error_data = response.json()
+                error_data = json.loads(cuerpo)
                 if "errorMessages" in error_data and error_data["errorMessages"]:
                     error_msg = error_data["errorMessages"][0]
             except:
@@ -69,26 +311,79 @@ def consultar_api(url, cuit, tipo_consulta="general"):
         else:
             # Mostrar errores solo para consultas que no sean silenciosas
             if tipo_consulta != "silencioso":
-                st.error(f"Error al consultar la API: {response.status_code}")
+                st.error(f"Error al consultar la API: {estado}")
             return None
     except Exception as e:
+        if incidencias is not None:
+            incidencias.append((cuit, tipo_consulta, estado_de_error(e)))
+            return None
         # Mostrar errores solo para consultas que no sean silenciosas
         if tipo_consulta != "silencioso":
             st.error(f"Error en la consulta: {str(e)}")
         return None
 
+def consultar_api(url, cuit, tipo_consulta="general"):
+    """
+    Consulta la API del BCRA con manejo de errores.
+    El parámetro tipo_consulta permite personalizar el comportamiento para diferentes tipos de consultas.
+    """
+    cuerpo = obtener_respuesta(url, cuit, tipo_consulta)
+    if cuerpo is None:
+        return None
+    try:
+        with etapa('json'):
+            return json.loads(cuerpo)
+    except Exception as e:
+        if tipo_consulta != "silencioso":
+            st.error(f"Error en la consulta: {str(e)}")
+        return None
+
 def obtener_deudas(cuit):
-    url = f"https://api.bcra.gob.ar/centraldedeudores/v1.0/Deudas/{cuit}"
+    url = f"{BCRA_API_URL}/Deudas/{cuit}"
     return consultar_api(url, cuit, "deudas")
 
 def obtener_deudas_historicas(cuit):
-    url = f"https://api.bcra.gob.ar/centraldedeudores/v1.0/Deudas/Historicas/{cuit}"
+    url = f"{BCRA_API_URL}/Deudas/Historicas/{cuit}"
     return consultar_api(url, cuit, "historicas")
 
 def obtener_cheques_rechazados(cuit):
-    url = f"https://api.bcra.gob.ar/centraldedeudores/v1.0/Deudas/ChequesRechazados/{cuit}"
+    url = f"{BCRA_API_URL}/Deudas/ChequesRechazados/{cuit}"
     return consultar_api(url, cuit, "cheques")
 
+def verificar_periodo(cuits_cartera):
+    """
+    Detecta si el BCRA publicó un período nuevo consultando Deudas de unos pocos CUITs testigo
+    (CUITS_TESTIGO o los primeros de la cartera) sin pasar por la caché. Si el período no cambió,
+    las respuestas de Deudas e Históricas en caché siguen vigentes para toda la cartera; si cambió,
+    se descartan juntas. No vuelve a consultar si se verificó hace poco.
+    Devuelve (periodo, cambio); periodo es None si ningún testigo tiene datos.
+    """
+    periodo = CACHE_RESPUESTAS.periodo_vigente()
+    if periodo is not None:
+        return periodo, False
+
+    respuestas = []
+    for cuit in (CUITS_TESTIGO or cuits_cartera)[:CANTIDAD_TESTIGOS]:
+        try:
+            estado, cuerpo = descargar_api(f"{BCRA_API_URL}/Deudas/{cuit}", "deudas")
+        except requests.exceptions.RequestException:
+            continue
+        respuestas.append((cuit, estado, cuerpo))
+        if estado == 200:
+            try:
+                periodos = [p['periodo'] for p in json.loads(cuerpo)['results']['periodos']]
+            except (ValueError, KeyError, TypeError):
+                continue
+            if periodos:
+                periodo = max(str(p) for p in periodos)
+                break
+
+    cambio = periodo is not None and CACHE_RESPUESTAS.registrar_periodo(periodo)
+    # Las respuestas de los testigos ya corresponden al período vigente: se aprovechan
+    for cuit, estado, cuerpo in respuestas:
+        guardar_respuesta("deudas", cuit, estado, cuerpo)
+    return periodo, cambio
+
 def procesar_deudas(datos):
     if not datos or 'results' not in datos:
         return None
@@ -182,25 +477,321 @@ def procesar_cheques_rechazados(datos):
     else:
         return None
 
-def procesar_lista_cuits(cuits_texto):
+def separar_cuits(cuits_texto):
     """
-    Procesa una lista de CUITs separados por comas y genera un informe resumido
+    Separa una lista de CUITs separados por comas en válidos (11 dígitos) e inválidos
     """
     # Limpiar y extraer CUITs de la cadena de texto
     cuits_lista = [cuit.strip() for cuit in cuits_texto.split(',') if cuit.strip()]
     
-    # Validar formato de cada CUIT
     cuits_validos = []
+    cuits_invalidos = []
     for cuit in cuits_lista:
         if re.match(r'^\d{11}$', cuit):
             cuits_validos.append(cuit)
         else:
-            st.warning(f"CUIT/CUIL/CDI inválido ignorado: {cuit}")
+            cuits_invalidos.append(cuit)
+    
+    return cuits_validos, cuits_invalidos
+
+def guardar_en_almacen(cuit, df_deudas, df_historico, df_cheques):
+    """
+    Receptor que acumula las tablas de un CUIT en el almacén analítico local
+    """
+    # Import diferido: almacen importa este módulo
+    from almacen import ALMACEN
+    ALMACEN.recibir(cuit, df_deudas, df_historico, df_cheques)
+
+def volcar_datos_locales():
+    """
+    Escribe lo acumulado en el almacén y en el índice del archivo de respuestas crudas;
+    se llama al terminar cada lote
+    """
+    if GUARDAR_ALMACEN:
+        from almacen import ALMACEN
+        ALMACEN.volcar()
+    if GUARDAR_CRUDO:
+        from archivo_crudo import ARCHIVO_CRUDO
+        ARCHIVO_CRUDO.volcar()
+
+def guardar_en_matriz(cuit, df_deudas, df_historico, df_cheques):
+    """
+    Receptor que incorpora la historia del CUIT a la matriz CUIT × período del proceso
+    """
+    if df_historico is None or df_historico.empty:
+        return
+    # Import diferido: matriz_situacion importa este módulo
+    from matriz_situacion import MATRIZ_SITUACION
+    MATRIZ_SITUACION.agregar(
+        cuit, df_historico['Período'].to_numpy(), df_historico['Situación'].to_numpy(),
+        df_historico['Monto'].to_numpy()
+    )
+
+def guardar_cubo_exposicion(df_resultados):
+    """
+    Arma y guarda el cubo de exposición de la cartera (cubo_exposicion.py) con lo que quedó en el almacén.
+    Devuelve el error si no se pudo guardar (None si se guardó), para que quien llama decida cómo avisarlo.
+    """
+    from cubo_exposicion import guardar_cubo_cartera
+    try:
+        guardar_cubo_cartera(df_resultados['CUIT'].tolist())
+    except (OSError, sqlite3.Error) as e:
+        return str(e)
+    return None
+
+# Funciones que reciben las tablas de cada CUIT resumido: receptor(cuit, df_deudas, df_historico, df_cheques)
+RECEPTORES_TABLAS = ([guardar_en_almacen] if GUARDAR_ALMACEN else []) + \
+    ([guardar_en_matriz] if GUARDAR_MATRIZ else [])
+
+def meses_entre(periodo_desde, periodo_hasta):
+    """
+    Meses entre dos períodos AAAAMM (0 si son el mismo o el primero es posterior)
+    """
+    desde, hasta = int(periodo_desde), int(periodo_hasta)
+    return max((hasta // 100 - desde // 100) * 12 + hasta % 100 - desde % 100, 0)
+
+def resumir_cuit(cuit, datos_deudas, datos_historicos, datos_cheques):
+    """
+    Genera la fila del informe resumido de un CUIT a partir de las respuestas de la API
+    (deudas actuales, históricas y cheques rechazados). No realiza consultas.
+    Las tablas intermedias se entregan a los RECEPTORES_TABLAS.
+    """
+    with etapa('procesar'):
+        df_deudas = tabla_o_vacia(procesar_deudas(datos_deudas), datos_deudas)
+        df_historico = tabla_o_vacia(procesar_deudas_historicas(datos_historicos), datos_historicos)
+        df_cheques = tabla_o_vacia(procesar_cheques_rechazados(datos_cheques), datos_cheques)
+    return resumir_tablas(cuit, df_deudas, df_historico, df_cheques)
+
+def tabla_o_vacia(df, respuesta):
+    """
+    Tabla interpretada de un endpoint, o una tabla vacía si el endpoint respondió sin filas
+    (respuesta no None, por ejemplo un 404); None solo si no hubo respuesta
+    """
+    if df is None and respuesta is not None:
+        return pd.DataFrame()
+    return df
+
+def resumir_tablas(cuit, df_deudas, df_historico, df_cheques):
+    """
+    Genera la fila del informe resumido de un CUIT a partir de sus tablas ya interpretadas
+    (vacías si el endpoint respondió sin datos, None si no se consultó o falló) y se las entrega
+    a los RECEPTORES_TABLAS
+    """
+    # Preparar fila de resultados para este CUIT
+    resultado_cuit = {
+        'CUIT': cuit,
+        'Denominación': '',
+        'Situación Actual': 0,
+        'Tiene Situación Irregular': False,
+        'Tuvo Situación Irregular': False,
+        'Tiene Cheques Rechazados': False,
+        'Deuda Total (miles $)': 0,
+        'Cantidad Entidades': 0,
+        'Detalle Situaciones': '',
+        'Cantidad Cheques Rechazados': 0,
+        'Máximo Días Atraso': 0,
+        'Con Refinanciaciones': False,
+        'Con Proceso Judicial': False,
+        'Meses Desde Última Irregularidad': SIN_IRREGULARIDAD,
+        'Monto Cheques Rechazados': 0.0
+    }
+    
+    # Deudas actuales
+    periodo_actual = None
+    
+    if df_deudas is not None and not df_deudas.empty:
+        # Capturar el período actual para comparación posterior
+        if 'Período' in df_deudas.columns and not df_deudas.empty:
+            periodo_actual = df_deudas['Período'].iloc[0]
+        
+        # Actualizar denominación
+        resultado_cuit['Denominación'] = df_deudas['Denominación'].iloc[0]
+        
+        # Calcular resumen - situación irregular significa > 1, no simplemente ≠ 1
+        resultado_cuit['Tiene Situación Irregular'] = bool((df_deudas['Situación'] > 1).any())
+        
+        # Calcular la situación más alta (peor)
+        resultado_cuit['Situación Actual'] = int(df_deudas['Situación'].max())
+        
+        # Calcular deuda total
+        resultado_cuit['Deuda Total (miles $)'] = df_deudas['Monto'].sum()
+        
+        # Contar entidades
+        resultado_cuit['Cantidad Entidades'] = len(df_deudas['Entidad'].unique())
+        
+        # Señales para el puntaje de riesgo (riesgo.py)
+        resultado_cuit['Máximo Días Atraso'] = int(pd.to_numeric(df_deudas['Días Atraso Pago']).fillna(0).max())
+        resultado_cuit['Con Refinanciaciones'] = bool(df_deudas['Refinanciaciones'].fillna(False).astype(bool).any())
+        resultado_cuit['Con Proceso Judicial'] = bool(
+            df_deudas[['Proceso Judicial', 'Situación Jurídica']].fillna(False).astype(bool).to_numpy().any()
+        )
+        if resultado_cuit['Tiene Situación Irregular']:
+            resultado_cuit['Meses Desde Última Irregularidad'] = 0
+        
+        # Crear detalle de situaciones
+        situaciones = df_deudas.groupby('Situación').size().reset_index(name='Cantidad')
+        detalles = []
+        for _, row in situaciones.iterrows():
+            detalles.append(f"Sit.{int(row['Situación'])}: {row['Cantidad']}")
+        resultado_cuit['Detalle Situaciones'] = ", ".join(detalles)
+    
+    # Deudas históricas
+    if df_historico is not None and not df_historico.empty:
+        # Verificar si tuvo situación irregular (> 1) en el pasado, excluyendo el período actual,
+        # sobre los arreglos de la tabla sin copiarla
+        situaciones = df_historico['Situación'].to_numpy()
+        if periodo_actual:
+            situaciones = situaciones[df_historico['Período'].to_numpy() != periodo_actual]
+        resultado_cuit['Tuvo Situación Irregular'] = bool((situaciones > 1).any())
+        
+        # Meses entre la última irregularidad informada y el período más reciente
+        if resultado_cuit['Meses Desde Última Irregularidad'] == SIN_IRREGULARIDAD:
+            periodos = df_historico['Período'].astype(str).to_numpy()
+            irregulares = periodos[df_historico['Situación'].to_numpy() > 1]
+            if len(irregulares):
+                resultado_cuit['Meses Desde Última Irregularidad'] = meses_entre(
+                    irregulares.max(), periodo_actual or periodos.max()
+                )
+    
+    # Cheques rechazados
+    if df_cheques is not None and not df_cheques.empty:
+        resultado_cuit['Tiene Cheques Rechazados'] = True
+        resultado_cuit['Cantidad Cheques Rechazados'] = len(df_cheques)
+        resultado_cuit['Monto Cheques Rechazados'] = float(pd.to_numeric(df_cheques['Monto']).fillna(0).sum())
+    
+    for receptor in RECEPTORES_TABLAS:
+        receptor(cuit, df_deudas, df_historico, df_cheques)
+    
+    return resultado_cuit
+
+# Función que interpreta la respuesta de cada endpoint en una tabla
+PROCESADORES_RESPUESTAS = {
+    "deudas": procesar_deudas,
+    "historicas": procesar_deudas_historicas,
+    "cheques": procesar_cheques_rechazados
+}
+
+def tabla_de_respuesta(endpoint, cuerpo, hash_respuesta):
+    """
+    Tabla interpretada del cuerpo crudo de una respuesta, memorizada por su hash en CACHE_PROCESADO.
+    Las tablas memorizadas se comparten entre llamadas: no se deben modificar.
+    """
+    if cuerpo is None:
+        return None
+    clave = ('tabla', endpoint, hash_respuesta)
+    encontrada, df = CACHE_PROCESADO.obtener(clave)
+    if encontrada:
+        return df
+    datos = interpretar_json(cuerpo)
+    with etapa('procesar'):
+        df = tabla_o_vacia(PROCESADORES_RESPUESTAS[endpoint](datos), cuerpo)
+    CACHE_PROCESADO.guardar(clave, df, int(df.memory_usage(deep=True).sum()))
+    return df
+
+def resumir_respuestas(cuit, cuerpo_deudas, cuerpo_historicos, cuerpo_cheques):
+    """
+    Como resumir_cuit, pero a partir de los cuerpos crudos de las respuestas (CUERPO_SIN_DATOS si
+    fueron 404, None si fallaron; ver cuerpo_para_resumir).
+    El resumen del CUIT se memoriza por los hashes de los tres cuerpos y cada tabla por el de su
+    cuerpo: si las respuestas son idénticas a unas ya procesadas, no se vuelven a interpretar ni a
+    resumir. En ese caso tampoco se entregan de nuevo a los RECEPTORES_TABLAS, que ya recibieron
+    esas mismas tablas en este proceso.
+    """
+    cuerpos = {'deudas': cuerpo_deudas, 'historicas': cuerpo_historicos, 'cheques': cuerpo_cheques}
+    hashes = {endpoint: hash_cuerpo(cuerpo) for endpoint, cuerpo in cuerpos.items() if cuerpo is not None}
+    clave = ('resumen', str(cuit)) + tuple(hashes.get(endpoint) for endpoint in cuerpos)
+    encontrado, resumen = CACHE_PROCESADO.obtener(clave)
+    if encontrado:
+        return dict(resumen, CUIT=cuit)
+
+    df_deudas, df_historico, df_cheques = (
+        tabla_de_respuesta(endpoint, cuerpo, hashes.get(endpoint)) for endpoint, cuerpo in cuerpos.items()
+    )
+    resumen = resumir_tablas(cuit, df_deudas, df_historico, df_cheques)
+    CACHE_PROCESADO.guardar(clave, dict(resumen), sys.getsizeof(resumen) + sum(map(sys.getsizeof, resumen.values())))
+    return resumen
+
+def procesar_cuit(cuit, incidencias=None):
+    """
+    Consulta los tres endpoints de la API para un CUIT y devuelve su fila del informe resumido.
+    Con incidencias, las respuestas distintas de 200 se agregan ahí como (cuit, endpoint, estado)
+    en lugar de mostrarse.
+    """
+    cuerpo_deudas = obtener_respuesta(f"{BCRA_API_URL}/Deudas/{cuit}", cuit, "deudas", incidencias)
+    cuerpo_historicos = obtener_respuesta(f"{BCRA_API_URL}/Deudas/Historicas/{cuit}", cuit, "historicas", incidencias)
+    cuerpo_cheques = obtener_respuesta(f"{BCRA_API_URL}/Deudas/ChequesRechazados/{cuit}", cuit, "cheques", incidencias)
+    
+    with etapa('resumen'):
+        return resumir_respuestas(cuit, cuerpo_deudas, cuerpo_historicos, cuerpo_cheques)
+
+def procesar_cuits_en_segundo_plano(cuits_validos, progress_bar, status_text, modo="async"):
+    """
+    Procesa los CUITs con el cliente asíncrono en el loop en segundo plano (y, en modo "procesos",
+    con el resumen en un grupo de procesos), actualizando el progreso desde el hilo del script.
+    Las incidencias se informan agrupadas al final.
+    """
+    # Imports diferidos: ambos módulos importan este
+    from cliente_async import ejecutar_en_segundo_plano, procesar_cuits_async
+    from procesamiento_paralelo import procesar_cuits_en_procesos
+
+    avance = {'completados': 0}
+    def al_avanzar(completados, total):
+        avance['completados'] = completados
+
+    procesar = procesar_cuits_en_procesos if modo == "procesos" else procesar_cuits_async
+    futuro = ejecutar_en_segundo_plano(procesar(cuits_validos, al_avanzar=al_avanzar))
+    while not futuro.done():
+        with etapa('progreso'):
+            completados = avance['completados']
+            progress_bar.progress(int(completados / len(cuits_validos) * 100))
+            status_text.text(f"Procesando CUITs ({completados}/{len(cuits_validos)})")
+        concurrent.futures.wait([futuro], timeout=0.2)
+
+    resultados, incidencias = futuro.result()
+    progress_bar.progress(100)
+    status_text.text(f"Procesados {len(cuits_validos)} CUITs")
+    informar_incidencias(incidencias)
+
+    return resultados
+
+def informar_incidencias(incidencias):
+    """
+    Muestra agrupadas las incidencias (cuit, endpoint, estado) de un lote: los CUITs sin
+    información y la cantidad de consultas fallidas por estado
+    """
+    sin_informacion = sorted({str(cuit) for cuit, endpoint, estado in incidencias if str(estado) == "404"})
+    if sin_informacion:
+        st.warning(
+            f"No se encontró información para {len(sin_informacion)} CUIT/CUIL/CDI: "
+            + ", ".join(sin_informacion[:20]) + (" ..." if len(sin_informacion) > 20 else "")
+        )
+    errores = [estado for cuit, endpoint, estado in incidencias if str(estado) != "404"]
+    if errores:
+        conteo = pd.Series(errores, dtype=str).value_counts()
+        st.error(
+            f"Fallaron {len(errores)} consultas a la API ("
+            + ", ".join(f"{estado}: {cantidad}" for estado, cantidad in conteo.items()) + ")"
+        )
+
+def procesar_lista_cuits(cuits_texto, modo=None):
+    """
+    Procesa una lista de CUITs separados por comas y genera un informe resumido.
+    modo puede ser "secuencial", "async" o "procesos"; por defecto se usa MODO_CONSULTA.
+    """
+    # Validar formato de cada CUIT
+    cuits_validos, cuits_invalidos = separar_cuits(cuits_texto)
+    for cuit in cuits_invalidos:
+        st.warning(f"CUIT/CUIL/CDI inválido ignorado: {cuit}")
     
     if not cuits_validos:
         st.error("No se encontraron CUITs/CUILs/CDIs válidos para procesar")
         return
     
+    # Si se publicó un período nuevo, las deudas en caché se descartan antes de procesar
+    periodo, cambio = verificar_periodo(cuits_validos)
+    if cambio:
+        st.info(f"Se publicó el período {periodo}: se actualizan las deudas de la cartera.")
+    
     # Mostrar información de procesamiento
     st.subheader(f"Procesando {len(cuits_validos)} CUITs/CUILs/CDIs")
     
@@ -211,357 +802,226 @@ def procesar_lista_cuits(cuits_texto):
     progress_bar = st.progress(0)
     status_text = st.empty()
     
-    for i, cuit in enumerate(cuits_validos):
-        # Actualizar progreso
-        progress = int((i + 1) / len(cuits_validos) * 100)
-        progress_bar.progress(progress)
-        status_text.text(f"Procesando CUIT {cuit} ({i+1}/{len(cuits_validos)})")
-        
-        # Preparar fila de resultados para este CUIT
-        resultado_cuit = {
-            'CUIT': cuit,
-            'Denominación': '',
-            'Situación Actual': 'Sin datos',
-            'Tiene Situación Irregular': 'No',
-            'Tuvo Situación Irregular': 'No',
-            'Tiene Cheques Rechazados': 'No',
-            'Deuda Total (miles $)': 0,
-            'Cantidad Entidades': 0,
-            'Detalle Situaciones': '',
-            'Cantidad Cheques Rechazados': 0
-        }
-        
-        # Obtener deudas actuales
-        datos_deudas = obtener_deudas(cuit)
-        periodo_actual = None
-        
-        if datos_deudas and 'results' in datos_deudas:
-            df_deudas = procesar_deudas(datos_deudas)
-            
-            if df_deudas is not None and not df_deudas.empty:
-                # Capturar el período actual para comparación posterior
-                if 'Período' in df_deudas.columns and not df_deudas.empty:
-                    periodo_actual = df_deudas['Período'].iloc[0]
-                
-                # Actualizar denominación
-                resultado_cuit['Denominación'] = datos_deudas['results']['denominacion']
-                
-                # Calcular resumen - situación irregular significa > 1, no simplemente ≠ 1
-                tiene_situacion_irregular = any(df_deudas['Situación'] > 1)
-                resultado_cuit['Tiene Situación Irregular'] = 'Sí' if tiene_situacion_irregular else 'No'
-                
-                # Calcular la situación más alta (peor)
-                max_situacion = df_deudas['Situación'].max()
-                resultado_cuit['Situación Actual'] = f"{int(max_situacion)}: {SITUACION_MAP.get(int(max_situacion), 'Desconocida')}"
-                
-                # Calcular deuda total
-                resultado_cuit['Deuda Total (miles $)'] = df_deudas['Monto'].sum()
-                
-                # Contar entidades
-                resultado_cuit['Cantidad Entidades'] = len(df_deudas['Entidad'].unique())
-                
-                # Crear detalle de situaciones
-                situaciones = df_deudas.groupby('Situación').size().reset_index(name='Cantidad')
-                detalles = []
-                for _, row in situaciones.iterrows():
-                    detalles.append(f"Sit.{int(row['Situación'])}: {row['Cantidad']}")
-                resultado_cuit['Detalle Situaciones'] = ", ".join(detalles)
-        
-        # Obtener deudas históricas
-        datos_historicos = obtener_deudas_historicas(cuit)
-        if datos_historicos and 'results' in datos_historicos:
-            df_historico = procesar_deudas_historicas(datos_historicos)
+    modo = modo or MODO_CONSULTA
+    if modo in ("async", "procesos"):
+        resultados = procesar_cuits_en_segundo_plano(cuits_validos, progress_bar, status_text, modo)
+    else:
+        for i, cuit in enumerate(cuits_validos):
+            # Actualizar progreso
+            with etapa('progreso'):
+                progress = int((i + 1) / len(cuits_validos) * 100)
+                progress_bar.progress(progress)
+                status_text.text(f"Procesando CUIT {cuit} ({i+1}/{len(cuits_validos)})")
             
-            if df_historico is not None and not df_historico.empty:
-                # Verificar si tuvo situación irregular en el pasado (excluyendo el período actual)
-                df_solo_historico = df_historico.copy()
-                
-                # Si hay período actual, filtrar para excluirlo del análisis histórico
-                if periodo_actual:
-                    df_solo_historico = df_historico[df_historico['Período'] != periodo_actual]
-                
-                # Solo analizar los períodos anteriores y verificar situaciones > 1 (no solo ≠ 1)
-                if not df_solo_historico.empty:
-                    # Verificar si hubo situaciones irregulares (> 1) en períodos pasados
-                    tuvo_situacion_irregular = any(df_solo_historico['Situación'] > 1)
-                    resultado_cuit['Tuvo Situación Irregular'] = 'Sí' if tuvo_situacion_irregular else 'No'
-        
-        # Obtener cheques rechazados
-        datos_cheques = obtener_cheques_rechazados(cuit)
-        if datos_cheques and 'results' in datos_cheques:
-            df_cheques = procesar_cheques_rechazados(datos_cheques)
+            # Agregar resultado a la lista
+            resultados.append(procesar_cuit(cuit))
             
-            if df_cheques is not None and not df_cheques.empty:
-                resultado_cuit['Tiene Cheques Rechazados'] = 'Sí'
-                resultado_cuit['Cantidad Cheques Rechazados'] = len(df_cheques)
-        
-        # Agregar resultado a la lista
-        resultados.append(resultado_cuit)
-        
-        # Pequeña pausa para no sobrecargar la API
-        time.sleep(0.5)
+            # Pequeña pausa para no sobrecargar la API
+            with etapa('pausa'):
+                time.sleep(PAUSA_ENTRE_CUITS)
+    
+    # Crear DataFrame con todos los resultados, con columnas booleanas y enteras
+    df_resultados = pd.DataFrame(resultados).astype(TIPOS_RESULTADOS)
+    # En modo procesos las tablas llegan a los receptores de otros procesos, no a los de este
+    df_resultados.attrs['resumido_en_proceso'] = modo != "procesos"
+    
+    # Escribir en el almacén local las tablas que quedaron acumuladas
+    volcar_datos_locales()
+    
+    # Guardar el snapshot de la corrida para compararla con las siguientes de la misma cartera
+    if GUARDAR_SNAPSHOTS:
+        from snapshots import guardar_snapshot
+        try:
+            df_resultados.attrs['snapshot'] = guardar_snapshot(df_resultados)
+        except OSError as e:
+            st.warning(f"No se pudo guardar el snapshot de la consulta: {str(e)}")
     
-    # Crear DataFrame con todos los resultados
-    df_resultados = pd.DataFrame(resultados)
+    # Agregar la exposición de la cartera por entidad, situación y período para la vista de la página
+    if GUARDAR_ALMACEN:
+        error_cubo = guardar_cubo_exposicion(df_resultados)
+        if error_cubo:
+            st.warning(f"No se pudo guardar la exposición por entidad de la cartera: {error_cubo}")
     
     return df_resultados
 
-def mostrar_resultados_multiple_cuits(df_resultados):
+def formatear_resultados(df_resultados):
     """
-    Muestra los resultados del análisis de múltiples CUITs de forma visual
+    Aplica las etiquetas en español (Sí/No y descripción de la situación) al informe resumido.
+    Se usa solo para presentación y exportación; el filtrado y las métricas trabajan sobre los tipos nativos.
     """
-    if df_resultados is None or df_resultados.empty:
-        st.warning("No se obtuvieron resultados para analizar")
-        return
+    df_formateado = df_resultados.copy()
     
-    # Crear pestañas para diferentes vistas
-    tab1, tab2 = st.tabs(["Resumen", "Análisis Detallado"])
+    for columna in COLUMNAS_SI_NO:
+        if columna in df_formateado.columns:
+            df_formateado[columna] = np.where(df_formateado[columna].to_numpy(dtype=bool), 'Sí', 'No')
     
-    with tab1:
-        # Aplicar formato condicional
-        st.subheader("Informe Resumido de CUITs/CUILs/CDIs")
-        
-        # Convertir columnas de estado a valores booleanos para filtrado
-        df_filtro = df_resultados.copy()
-        df_filtro['Tiene Situación Irregular Bool'] = df_filtro['Tiene Situación Irregular'] == 'Sí'
-        df_filtro['Tuvo Situación Irregular Bool'] = df_filtro['Tuvo Situación Irregular'] == 'Sí'
-        df_filtro['Tiene Cheques Rechazados Bool'] = df_filtro['Tiene Cheques Rechazados'] == 'Sí'
-        
-        # Opciones de filtro - usar session_state para mantener los valores entre rerenders
-        if 'mostrar_con_irregularidades' not in st.session_state:
-            st.session_state.mostrar_con_irregularidades = False
-        if 'mostrar_con_historico_irregular' not in st.session_state:
-            st.session_state.mostrar_con_historico_irregular = False
-        if 'mostrar_con_cheques' not in st.session_state:
-            st.session_state.mostrar_con_cheques = False
-        
-        st.markdown("### Filtros")
-        col1, col2, col3 = st.columns(3)
-        
-        with col1:
-            mostrar_con_irregularidades = st.checkbox(
-                "Solo con situación irregular actual", 
-                value=st.session_state.mostrar_con_irregularidades,
-                key="cb_situacion_irregular",
-                on_change=lambda: setattr(st.session_state, 'mostrar_con_irregularidades', st.session_state.cb_situacion_irregular)
-            )
-        
-        with col2:
-            mostrar_con_historico_irregular = st.checkbox(
-                "Solo con historial irregular", 
-                value=st.session_state.mostrar_con_historico_irregular,
-                key="cb_historico_irregular",
-                on_change=lambda: setattr(st.session_state, 'mostrar_con_historico_irregular', st.session_state.cb_historico_irregular)
-            )
-        
-        with col3:
-            mostrar_con_cheques = st.checkbox(
-                "Solo con cheques rechazados", 
-                value=st.session_state.mostrar_con_cheques,
-                key="cb_cheques",
-                on_change=lambda: setattr(st.session_state, 'mostrar_con_cheques', st.session_state.cb_cheques)
-            )
-        
-        # Aplicar filtros
-        df_mostrar = df_filtro.copy()
-        
-        if mostrar_con_irregularidades:
-            df_mostrar = df_mostrar[df_mostrar['Tiene Situación Irregular Bool']]
-        
-        if mostrar_con_historico_irregular:
-            df_mostrar = df_mostrar[df_mostrar['Tuvo Situación Irregular Bool']]
-        
-        if mostrar_con_cheques:
-            df_mostrar = df_mostrar[df_mostrar['Tiene Cheques Rechazados Bool']]
-        
-        # Eliminar columnas auxiliares de filtro
-        df_mostrar = df_mostrar.drop(columns=[
-            'Tiene Situación Irregular Bool', 
-            'Tuvo Situación Irregular Bool', 
-            'Tiene Cheques Rechazados Bool'
-        ])
-        
-        # Aplicar colores condicionales a la tabla
-        def highlight_si_no(val):
-            if val == 'Sí':
-                return 'background-color: rgba(255, 0, 0, 0.2);'  # Rojo claro
-            elif val == 'No':
-                return 'background-color: rgba(0, 255, 0, 0.2);'  # Verde claro
-            return ''
-            
-        # Mostrar tabla con formateo condicional
-        st.dataframe(
-            df_mostrar.style.applymap(
-                highlight_si_no, 
-                subset=['Tiene Situación Irregular', 'Tuvo Situación Irregular', 'Tiene Cheques Rechazados']
-            )
+    if 'Situación Actual' in df_formateado.columns:
+        situaciones = df_formateado['Situación Actual']
+        df_formateado['Situación Actual'] = situaciones.map(ETIQUETAS_SITUACION).fillna(
+            situaciones.astype(str) + ': Desconocida'
         )
-        
-        # Botón para descargar resultados
-        csv = df_mostrar.to_csv(index=False).encode('utf-8')
-        st.download_button(
-            "Descargar informe como CSV",
-            csv,
-            f"informe_cuits_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-            "text/csv",
-            key='download-csv-informe'
-        )
-        
-        # Mostrar métricas resumen
-        st.subheader("Resumen General")
-        total_cuits = len(df_resultados)
-        
-        # Calcular métricas generales
-        cuits_con_irregularidades = sum(df_resultados['Tiene Situación Irregular'] == 'Sí')
-        cuits_con_historico = sum(df_resultados['Tuvo Situación Irregular'] == 'Sí')
-        cuits_con_cheques = sum(df_resultados['Tiene Cheques Rechazados'] == 'Sí')
-        
-        # Mostrar métricas en columnas
-        col1, col2, col3, col4 = st.columns(4)
-        
-        with col1:
-            st.metric(
-                "Total de CUITs analizados", 
-                total_cuits
-            )
-        
-        with col2:
-            pct_irreg = (cuits_con_irregularidades / total_cuits * 100) if total_cuits > 0 else 0
-            st.metric(
-                "Con situación irregular actual", 
-                f"{cuits_con_irregularidades} ({pct_irreg:.1f}%)"
-            )
-        
-        with col3:
-            pct_hist = (cuits_con_historico / total_cuits * 100) if total_cuits > 0 else 0
-            st.metric(
-                "Con historial irregular", 
-                f"{cuits_con_historico} ({pct_hist:.1f}%)"
-            )
-        
-        with col4:
-            pct_cheques = (cuits_con_cheques / total_cuits * 100) if total_cuits > 0 else 0
-            st.metric(
-                "Con cheques rechazados", 
-                f"{cuits_con_cheques} ({pct_cheques:.1f}%)"
-            )
     
-    with tab2:
-        st.subheader("Análisis de CUITs/CUILs/CDIs por Categorías")
-        
-        # Gráfico de distribución por situación
-        st.markdown("### Distribución por Situación Crediticia")
-        
-        # Extraer la categoría de situación (solo el número)
-        df_resultados['Categoría Situación'] = df_resultados['Situación Actual'].apply(
-            lambda x: int(x.split(':')[0]) if x != 'Sin datos' else 0
+    if 'Meses Desde Última Irregularidad' in df_formateado.columns:
+        meses = df_formateado['Meses Desde Última Irregularidad']
+        df_formateado['Meses Desde Última Irregularidad'] = meses.astype(str).where(meses != SIN_IRREGULARIDAD, 'Nunca')
+    
+    return df_formateado
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def indexar_resultados(df_resultados):
+    """
+    Prepara el DataFrame de resultados para búsquedas y ordenamientos del lado del servidor.
+    Indexa por CUIT y precalcula una clave de búsqueda en minúsculas para no recalcularla en cada rerender.
+    """
+    df_indexado = df_resultados.set_index('CUIT', drop=False)
+    df_indexado['_busqueda'] = (
+        df_indexado['CUIT'].astype(str) + ' ' +
+        df_indexado['Denominación'].fillna('').astype(str).str.lower()
+    )
+    return df_indexado
+
+def buscar_y_ordenar(df_indexado, busqueda="", columna_orden=None, ascendente=True):
+    """
+    Filtra por texto (CUIT o denominación) y ordena el DataFrame indexado de forma vectorizada
+    """
+    df_busqueda = df_indexado
+
+    texto = busqueda.strip().lower() if busqueda else ""
+    if texto:
+        df_busqueda = df_busqueda[df_busqueda['_busqueda'].str.contains(texto, regex=False)]
+
+    if columna_orden and columna_orden in df_busqueda.columns:
+        df_busqueda = df_busqueda.sort_values(columna_orden, ascending=ascendente, kind='stable')
+
+    return df_busqueda
+
+def estilo_si_no(columna):
+    """
+    Devuelve los estilos de una columna booleana como un arreglo, sin callbacks por celda
+    """
+    return np.where(columna.to_numpy(dtype=bool), ESTILO_SI, ESTILO_NO)
+
+def mostrar_tabla_paginada(df_mostrar, clave="tabla_resultados"):
+    """
+    Muestra una tabla con búsqueda, ordenamiento y paginación del lado del servidor.
+    Solo la página visible se estiliza y se envía al navegador.
+    """
+    df_indexado = indexar_resultados(df_mostrar)
+    columnas_visibles = [col for col in df_indexado.columns if col != '_busqueda']
+
+    col1, col2, col3, col4 = st.columns([3, 2, 1, 1])
+
+    with col1:
+        busqueda = st.text_input("Buscar por CUIT o denominación", key=f"{clave}_busqueda")
+
+    with col2:
+        columna_orden = st.selectbox(
+            "Ordenar por",
+            options=["(sin orden)"] + columnas_visibles,
+            key=f"{clave}_orden"
         )
-        
-        # Contar CUITs por categoría
-        categoria_counts = df_resultados['Categoría Situación'].value_counts().reset_index()
-        categoria_counts.columns = ['Situación', 'Cantidad']
-        
-        # Crear diccionario para mapear cada situación con su descripción
-        situacion_map_completo = {
-            0: "Sin datos",
-            1: "Normal",
-            2: "Con seguimiento especial/Riesgo bajo",
-            3: "Con problemas/Riesgo medio",
-            4: "Alto riesgo de insolvencia/Riesgo alto",
-            5: "Irrecuperable",
-            6: "Irrecuperable por disposición técnica"
-        }
-        
-        # Agregar descripción
-        categoria_counts['Descripción'] = categoria_counts['Situación'].map(situacion_map_completo)
-        
-        # Crear gráfico
-        fig = px.pie(
-            categoria_counts,
-            values='Cantidad',
-            names='Descripción',
-            title="Distribución de CUITs por Situación Crediticia",
-            color='Situación',
-            color_discrete_map={
-                0: "#CCCCCC",  # Gris para sin datos
-                1: "#4CAF50",  # Verde
-                2: "#8BC34A",  # Verde claro
-                3: "#FFC107",  # Amarillo
-                4: "#FF9800",  # Naranja
-                5: "#F44336",  # Rojo
-                6: "#B71C1C"   # Rojo oscuro
-            }
+
+    with col3:
+        ascendente = st.radio(
+            "Sentido",
+            options=["Ascendente", "Descendente"],
+            key=f"{clave}_sentido"
+        ) == "Ascendente"
+
+    with col4:
+        filas_por_pagina = st.selectbox(
+            "Filas por página",
+            options=OPCIONES_FILAS_POR_PAGINA,
+            index=1,
+            key=f"{clave}_filas"
         )
-        st.plotly_chart(fig, use_container_width=True)
-        
-        # Gráfico de situaciones irregulares por período
-        st.markdown("### Análisis de Situaciones Irregulares")
-        
-        # Crear categorías de análisis
-        categorias = [
-            "Sin irregularidades",
-            "Con irregularidades solo actuales",
-            "Con irregularidades solo históricas",
-            "Con irregularidades actuales e históricas"
-        ]
-        
-        # Calcular conteos
-        sin_irreg = sum((df_resultados['Tiene Situación Irregular'] == 'No') & 
-                         (df_resultados['Tuvo Situación Irregular'] == 'No'))
-        
-        solo_actual = sum((df_resultados['Tiene Situación Irregular'] == 'Sí') & 
-                           (df_resultados['Tuvo Situación Irregular'] == 'No'))
-        
-        solo_historica = sum((df_resultados['Tiene Situación Irregular'] == 'No') & 
-                              (df_resultados['Tuvo Situación Irregular'] == 'Sí'))
-        
-        ambas = sum((df_resultados['Tiene Situación Irregular'] == 'Sí') & 
-                     (df_resultados['Tuvo Situación Irregular'] == 'Sí'))
-        
-        # Crear datos para gráfico
-        df_analisis = pd.DataFrame({
-            'Categoría': categorias,
-            'Cantidad': [sin_irreg, solo_actual, solo_historica, ambas]
-        })
-        
-        # Crear gráfico de barras
-        fig = px.bar(
-            df_analisis,
-            x='Categoría',
-            y='Cantidad',
-            title="Análisis de Situaciones Irregulares",
-            color='Categoría',
-            color_discrete_map={
-                "Sin irregularidades": "#4CAF50",
-                "Con irregularidades solo actuales": "#FFC107",
-                "Con irregularidades solo históricas": "#FF9800",
-                "Con irregularidades actuales e históricas": "#F44336"
-            }
+
+    df_ordenado = buscar_y_ordenar(
+        df_indexado,
+        busqueda,
+        None if columna_orden == "(sin orden)" else columna_orden,
+        ascendente
+    )
+
+    total_filas = len(df_ordenado)
+    total_paginas = max(1, math.ceil(total_filas / filas_por_pagina))
+
+    pagina = st.number_input(
+        f"Página (de {total_paginas})",
+        min_value=1,
+        max_value=total_paginas,
+        value=1,
+        step=1,
+        key=f"{clave}_pagina_{filas_por_pagina}_{total_paginas}"
+    )
+
+    inicio = (int(pagina) - 1) * filas_por_pagina
+    df_pagina = df_ordenado.iloc[inicio:inicio + filas_por_pagina][columnas_visibles]
+
+    # Calcular los estilos desde los booleanos y aplicar las etiquetas solo a la página visible
+    estilos = pd.DataFrame('', index=df_pagina.index, columns=df_pagina.columns)
+    for columna in COLUMNAS_SI_NO:
+        if columna in df_pagina.columns:
+            estilos[columna] = estilo_si_no(df_pagina[columna])
+
+    st.dataframe(
+        formatear_resultados(df_pagina).style.apply(lambda _: estilos, axis=None),
+        hide_index=True
+    )
+
+    st.caption(f"Mostrando {len(df_pagina)} de {total_filas} filas")
+
+def mostrar_panel_diagnostico():
+    """
+    Muestra un panel desplegable con las métricas de las consultas a la API:
+    resumen por endpoint y exportación en formato Prometheus
+    """
+    with st.expander("Diagnóstico de la API"):
+        filas = REGISTRO_METRICAS.resumen_por_endpoint()
+        if not filas:
+            st.caption("Todavía no se realizaron consultas a la API en este proceso.")
+            return
+
+        st.dataframe(pd.DataFrame(filas), hide_index=True, use_container_width=True)
+        st.caption(
+            "Los percentiles se calculan sobre las últimas consultas de cada endpoint. "
+            "Otros errores incluye timeouts, errores de red y códigos 400/5xx."
         )
-        st.plotly_chart(fig, use_container_width=True)
-        
-        # Análisis de cheques rechazados
-        st.markdown("### Análisis de Cheques Rechazados")
-        
-        # Crear categorías de análisis
-        df_cheques_analisis = pd.DataFrame({
-            'Categoría': ["Sin cheques rechazados", "Con cheques rechazados"],
-            'Cantidad': [
-                sum(df_resultados['Tiene Cheques Rechazados'] == 'No'),
-                sum(df_resultados['Tiene Cheques Rechazados'] == 'Sí')
-            ]
-        })
-        
-        # Crear gráfico
-        fig = px.pie(
-            df_cheques_analisis,
-            values='Cantidad',
-            names='Categoría',
-            title="Distribución de CUITs por Cheques Rechazados",
-            color='Categoría',
-            color_discrete_map={
-                "Sin cheques rechazados": "#4CAF50",
-                "Con cheques rechazados": "#F44336"
-            }
+
+        cache = CACHE_RESPUESTAS.estadisticas()
+        st.caption(
+            f"Caché compartida de respuestas: {cache['entradas']} entradas, "
+            f"{cache['mb']:.1f} de {cache['maximo_mb']:.0f} MB, "
+            f"{cache['aciertos'] + cache['aciertos_archivo']} aciertos y {cache['fallos']} fallos"
+            + (f" (tasa {cache['tasa_aciertos']:.0%})" if cache['tasa_aciertos'] is not None else "")
+            + (f", {cache['desalojos']} desalojos" if cache['desalojos'] else "")
+            + "."
         )
-        st.plotly_chart(fig, use_container_width=True)
\ No newline at end of file
+        procesado = CACHE_PROCESADO.estadisticas()
+        st.caption(
+            f"Respuestas ya procesadas: {procesado['aciertos'].get('resumen', 0)} CUITs resumidos sin volver "
+            f"a interpretar sus respuestas y {procesado['aciertos'].get('tabla', 0)} tablas reutilizadas "
+            f"({procesado['entradas']} entradas, {procesado['mb']:.1f} MB)."
+        )
+
+        texto_metricas = REGISTRO_METRICAS.exportar_prometheus()
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.download_button(
+                label="Descargar métricas (Prometheus)",
+                data=texto_metricas,
+                file_name="metricas_bcra.prom",
+                mime="text/plain"
+            )
+        with col2:
+            if st.button("Reiniciar métricas"):
+                REGISTRO_METRICAS.reiniciar()
+                CACHE_RESPUESTAS.reiniciar_estadisticas()
+                st.rerun()
+        with col3:
+            if st.button("Vaciar caché de respuestas", help="Las próximas consultas vuelven a la API"):
+                CACHE_RESPUESTAS.invalidar()
+                st.rerun()
+
+        if st.checkbox("Ver texto de métricas", key="ver_texto_metricas"):
+            st.code(texto_metricas, language="text")
@@ -0,0 +1,438 @@
+"""
+Vigilancia de una lista permanente de CUITs con revisiones periódicas e incrementales.
+
+Los CUITs vigilados y el registro de cambios se guardan en una base SQLite (en
+utils.DIRECTORIO_DATOS). Un proceso vigilante revisa los CUITs a medida que vencen, primero los
+de mayor riesgo (situación 3 o peor, o con cheques rechazados), que además se revisan más seguido.
+Las consultas se reparten en el tiempo con un limitador sin ráfagas, y en cada revisión solo se
+consultan los endpoints que pueden haber cambiado: Deudas e Históricas cuando se publicó un
+período nuevo (utils.verificar_periodo), Cheques rechazados siempre.
+
+Cada cambio detectado (situación, nuevo irregular, cheques nuevos, variación de deuda) queda en
+el registro de cambios, que la página de vigilancia lee sin consultar la API.
+
+    python vigilancia.py agregar --archivo cartera.csv
+    python vigilancia.py vigilante --consultas-por-minuto 120
+    python vigilancia.py cambios
+"""
+import argparse
+import json
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+import pandas as pd
+import requests
+
+import utils
+from cliente_async import RUTAS_ENDPOINTS
+from cola_trabajos import filas_serializables
+
+RUTA_VIGILANCIA = os.path.join(utils.DIRECTORIO_DATOS, "vigilancia.sqlite")
+
+# Consultas por minuto que el vigilante reparte entre las revisiones
+CONSULTAS_POR_MINUTO = float(os.environ.get("BCRA_VIGILANCIA_CPM", "60"))
+
+# Horas entre revisiones de un CUIT sin señales de riesgo; los de mayor riesgo se revisan antes
+HORAS_ENTRE_REVISIONES = float(os.environ.get("BCRA_VIGILANCIA_HORAS", "24"))
+
+# Fracción del intervalo base según la prioridad del CUIT
+INTERVALOS_POR_PRIORIDAD = {2: 0.25, 1: 0.5, 0: 1.0}
+
+# Segundos hasta reintentar un CUIT cuya revisión falló
+ESPERA_TRAS_ERROR = 900
+
+# CUITs que el vigilante toma por vez antes de volver a mirar las prioridades
+LOTE_REVISION = 50
+
+# Segundos entre búsquedas de revisiones vencidas cuando no hay ninguna
+ESPERA_SIN_PENDIENTES = 30.0
+
+# Segundos sin latido tras los cuales el vigilante se considera detenido
+LATIDO_MAXIMO = 300
+
+# Variación relativa de deuda a partir de la cual se registra un cambio
+UMBRAL_VARIACION_DEUDA = 0.2
+
+# Columnas del resumen que dependen solo de Cheques rechazados
+COLUMNAS_CHEQUES = ['Tiene Cheques Rechazados', 'Cantidad Cheques Rechazados', 'Monto Cheques Rechazados']
+
+TIPOS_CAMBIO = {
+    'situacion': "Cambio de situación",
+    'irregular': "Nuevo irregular",
+    'cheques': "Cheques rechazados nuevos",
+    'deuda': "Variación de deuda"
+}
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS vigilados (
+    cuit TEXT PRIMARY KEY,
+    agregado REAL NOT NULL,
+    ultima_revision REAL,
+    proxima_revision REAL NOT NULL DEFAULT 0,
+    prioridad INTEGER NOT NULL DEFAULT 0,
+    periodo TEXT,
+    fila TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_vigilados_proxima ON vigilados (proxima_revision, prioridad);
+CREATE TABLE IF NOT EXISTS cambios (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    cuit TEXT NOT NULL,
+    detectado REAL NOT NULL,
+    tipo TEXT NOT NULL,
+    anterior TEXT,
+    actual TEXT,
+    descripcion TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_cambios_detectado ON cambios (detectado);
+CREATE TABLE IF NOT EXISTS vigilante (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    latido REAL NOT NULL
+);
+"""
+
+
+def conectar(ruta=None):
+    """
+    Abre la base de vigilancia (creándola si no existe) en modo WAL, apta para varios procesos
+    """
+    ruta = ruta or RUTA_VIGILANCIA
+    os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+    conexion = sqlite3.connect(ruta, timeout=30, isolation_level=None)
+    conexion.row_factory = sqlite3.Row
+    conexion.execute("PRAGMA journal_mode=WAL")
+    conexion.execute("PRAGMA synchronous=NORMAL")
+    conexion.executescript(ESQUEMA)
+    return conexion
+
+
+def agregar_cuits(cuits_texto, ruta=None):
+    """
+    Agrega a la vigilancia los CUITs válidos de cuits_texto (los ya vigilados se ignoran).
+    Los nuevos quedan para revisar de inmediato. Devuelve (agregados, cuits inválidos).
+    """
+    cuits_validos, cuits_invalidos = utils.separar_cuits(cuits_texto)
+    conexion = conectar(ruta)
+    try:
+        antes = conexion.execute("SELECT COUNT(*) FROM vigilados").fetchone()[0]
+        conexion.executemany(
+            "INSERT OR IGNORE INTO vigilados (cuit, agregado) VALUES (?, ?)",
+            ((cuit, time.time()) for cuit in cuits_validos)
+        )
+        agregados = conexion.execute("SELECT COUNT(*) FROM vigilados").fetchone()[0] - antes
+    finally:
+        conexion.close()
+    return agregados, cuits_invalidos
+
+
+def quitar_cuits(cuits_texto, ruta=None):
+    """
+    Quita CUITs de la vigilancia (su historial de cambios se conserva). Devuelve cuántos se quitaron.
+    """
+    cuits_validos, _ = utils.separar_cuits(cuits_texto)
+    conexion = conectar(ruta)
+    try:
+        return conexion.executemany(
+            "DELETE FROM vigilados WHERE cuit = ?", ((cuit,) for cuit in cuits_validos)
+        ).rowcount
+    finally:
+        conexion.close()
+
+
+def prioridad_de(fila):
+    """
+    2: situación 3 o peor o cheques rechazados; 1: situación 2; 0: sin señales de riesgo
+    """
+    if fila['Situación Actual'] >= 3 or fila['Tiene Cheques Rechazados']:
+        return 2
+    if fila['Situación Actual'] == 2:
+        return 1
+    return 0
+
+
+def detectar_cambios(anterior, actual):
+    """
+    Compara dos filas del resumen de un CUIT y devuelve los cambios como (tipo, anterior, actual, descripción).
+    La situación 0 es "Sin datos": aparecer o desaparecer del BCRA no se registra como cambio de situación.
+    """
+    cambios = []
+    situacion_anterior, situacion_actual = int(anterior['Situación Actual']), int(actual['Situación Actual'])
+    if situacion_actual != situacion_anterior and situacion_anterior != 0 and situacion_actual != 0:
+        cambios.append((
+            'situacion', situacion_anterior, situacion_actual,
+            f"Situación {utils.ETIQUETAS_SITUACION[situacion_anterior]} → {utils.ETIQUETAS_SITUACION[situacion_actual]}"
+        ))
+    if actual['Tiene Situación Irregular'] and not anterior['Tiene Situación Irregular']:
+        cambios.append(('irregular', False, True, "Pasó a situación irregular"))
+    nuevos_cheques = actual['Cantidad Cheques Rechazados'] - anterior['Cantidad Cheques Rechazados']
+    if nuevos_cheques > 0:
+        cambios.append((
+            'cheques', anterior['Cantidad Cheques Rechazados'], actual['Cantidad Cheques Rechazados'],
+            f"{nuevos_cheques} cheque(s) rechazado(s) nuevo(s)"
+        ))
+    deuda_anterior, deuda_actual = anterior['Deuda Total (miles $)'], actual['Deuda Total (miles $)']
+    if abs(deuda_actual - deuda_anterior) > UMBRAL_VARIACION_DEUDA * max(abs(deuda_anterior), 1):
+        cambios.append((
+            'deuda', deuda_anterior, deuda_actual,
+            f"Deuda {deuda_anterior:,.0f} → {deuda_actual:,.0f} (miles $)"
+        ))
+    return cambios
+
+
+def consultar_endpoint(endpoint, cuit, limitador):
+    """
+    Consulta un endpoint sin pasar por la caché (la respuesta nueva sí queda guardada en ella).
+    Devuelve (estado, datos); datos es un diccionario vacío si el endpoint respondió sin datos (404)
+    y None si la consulta falló.
+    """
+    limitador.esperar()
+    try:
+        estado, cuerpo = utils.descargar_api(f"{utils.BCRA_API_URL}/{RUTAS_ENDPOINTS[endpoint]}/{cuit}", endpoint)
+    except requests.exceptions.RequestException:
+        return "error", None
+    utils.guardar_respuesta(endpoint, cuit, estado, cuerpo)
+    if estado != 200:
+        return estado, {} if estado == 404 else None
+    try:
+        return estado, json.loads(cuerpo)
+    except ValueError:
+        return "error", None
+
+
+def revisar_cuit(conexion, vigilado, periodo, limitador):
+    """
+    Revisa un CUIT vigilado: consulta solo los endpoints necesarios, registra los cambios y
+    reprograma la próxima revisión según su prioridad. Devuelve la cantidad de cambios.
+    """
+    cuit = vigilado['cuit']
+    anterior = json.loads(vigilado['fila']) if vigilado['fila'] else None
+    completa = anterior is None or periodo is None or vigilado['periodo'] != periodo
+
+    datos = {}
+    for endpoint in (RUTAS_ENDPOINTS if completa else ['cheques']):
+        estado, datos[endpoint] = consultar_endpoint(endpoint, cuit, limitador)
+        if estado not in (200, 404):
+            conexion.execute(
+                "UPDATE vigilados SET proxima_revision = ? WHERE cuit = ?", (time.time() + ESPERA_TRAS_ERROR, cuit)
+            )
+            return 0
+
+    if completa:
+        fila = utils.resumir_cuit(cuit, datos['deudas'], datos['historicas'], datos['cheques'])
+    else:
+        fila = dict(anterior)
+        fila.update({
+            columna: valor for columna, valor in utils.resumir_cuit(cuit, None, None, datos['cheques']).items()
+            if columna in COLUMNAS_CHEQUES
+        })
+    fila = filas_serializables([fila])[0]
+
+    cambios = detectar_cambios(anterior, fila) if anterior is not None else []
+    ahora = time.time()
+    prioridad = prioridad_de(fila)
+    conexion.execute("BEGIN IMMEDIATE")
+    try:
+        conexion.executemany(
+            "INSERT INTO cambios (cuit, detectado, tipo, anterior, actual, descripcion) VALUES (?, ?, ?, ?, ?, ?)",
+            ((cuit, ahora, tipo, str(valor_anterior), str(valor_actual), descripcion)
+             for tipo, valor_anterior, valor_actual, descripcion in cambios)
+        )
+        conexion.execute(
+            """UPDATE vigilados SET ultima_revision = ?, proxima_revision = ?, prioridad = ?,
+               periodo = COALESCE(?, periodo), fila = ? WHERE cuit = ?""",
+            (ahora, ahora + HORAS_ENTRE_REVISIONES * 3600 * INTERVALOS_POR_PRIORIDAD[prioridad], prioridad,
+             periodo if completa else None, json.dumps(fila, ensure_ascii=False), cuit)
+        )
+        conexion.execute("COMMIT")
+    except Exception:
+        conexion.execute("ROLLBACK")
+        raise
+    return len(cambios)
+
+
+def revisar_pendientes(conexion, limitador, maximo=LOTE_REVISION):
+    """
+    Revisa hasta maximo CUITs con la revisión vencida, de mayor a menor prioridad.
+    Devuelve (revisados, cambios).
+    """
+    pendientes = conexion.execute(
+        "SELECT * FROM vigilados WHERE proxima_revision <= ? ORDER BY prioridad DESC, proxima_revision LIMIT ?",
+        (time.time(), maximo)
+    ).fetchall()
+    if not pendientes:
+        return 0, 0
+
+    periodo, _ = utils.verificar_periodo([vigilado['cuit'] for vigilado in pendientes])
+    cambios = 0
+    for vigilado in pendientes:
+        cambios += revisar_cuit(conexion, vigilado, periodo, limitador)
+        registrar_latido(conexion)
+    utils.volcar_datos_locales()
+    return len(pendientes), cambios
+
+
+def registrar_latido(conexion):
+    conexion.execute("INSERT OR REPLACE INTO vigilante (id, latido) VALUES (1, ?)", (time.time(),))
+
+
+def ciclo_vigilante(consultas_por_minuto=None, una_vez=False, ruta=None):
+    """
+    Revisa los CUITs vigilados a medida que vencen, repartiendo las consultas en el tiempo.
+    Con una_vez, termina cuando no quedan revisiones vencidas.
+    """
+    # Sin ráfagas: las consultas salen espaciadas aunque haya muchas revisiones vencidas
+    limitador = utils.LimitadorTasa((consultas_por_minuto or CONSULTAS_POR_MINUTO) / 60, rafaga=1)
+    conexion = conectar(ruta)
+    try:
+        while True:
+            registrar_latido(conexion)
+            revisados, cambios = revisar_pendientes(conexion, limitador)
+            if revisados:
+                print(f"Revisados {revisados} CUITs, {cambios} cambios")
+                continue
+            if una_vez:
+                return
+            time.sleep(ESPERA_SIN_PENDIENTES)
+    finally:
+        conexion.close()
+
+
+def vigilante_activo(ruta=None):
+    """
+    Indica si hay un vigilante con latido reciente
+    """
+    conexion = conectar(ruta)
+    try:
+        fila = conexion.execute("SELECT latido FROM vigilante WHERE id = 1").fetchone()
+    finally:
+        conexion.close()
+    return fila is not None and time.time() - fila['latido'] < LATIDO_MAXIMO
+
+
+def a_fecha_local(segundos):
+    """
+    Convierte una serie de segundos epoch en fechas de la zona horaria local
+    """
+    zona = datetime.now().astimezone().tzinfo
+    return pd.to_datetime(segundos, unit='s', utc=True).dt.tz_convert(zona).dt.tz_localize(None)
+
+
+def listar_vigilados(ruta=None):
+    """
+    Devuelve los CUITs vigilados con su último resumen y sus fechas de revisión
+    """
+    conexion = conectar(ruta)
+    try:
+        filas = conexion.execute(
+            "SELECT cuit, ultima_revision, proxima_revision, prioridad, fila FROM vigilados "
+            "ORDER BY prioridad DESC, cuit"
+        ).fetchall()
+    finally:
+        conexion.close()
+
+    registros = []
+    for fila in filas:
+        resumen = json.loads(fila['fila']) if fila['fila'] else {}
+        registros.append({
+            'CUIT': fila['cuit'],
+            'Denominación': resumen.get('Denominación', ''),
+            'Situación Actual': resumen.get('Situación Actual'),
+            'Cheques Rechazados': resumen.get('Cantidad Cheques Rechazados'),
+            'Deuda Total (miles $)': resumen.get('Deuda Total (miles $)'),
+            'Prioridad': fila['prioridad'],
+            'Última Revisión': fila['ultima_revision'],
+            'Próxima Revisión': fila['proxima_revision']
+        })
+    df = pd.DataFrame(registros, columns=[
+        'CUIT', 'Denominación', 'Situación Actual', 'Cheques Rechazados', 'Deuda Total (miles $)',
+        'Prioridad', 'Última Revisión', 'Próxima Revisión'
+    ])
+    for columna in ('Última Revisión', 'Próxima Revisión'):
+        df[columna] = a_fecha_local(df[columna].astype(float))
+    return df
+
+
+def listar_cambios(desde=None, limite=1000, ruta=None):
+    """
+    Devuelve los cambios registrados (desde un momento, en segundos epoch), del más reciente al más antiguo
+    """
+    conexion = conectar(ruta)
+    try:
+        df = pd.read_sql_query(
+            "SELECT detectado, cuit, tipo, descripcion FROM cambios WHERE detectado >= ? "
+            "ORDER BY detectado DESC, id DESC LIMIT ?",
+            conexion, params=(desde or 0, limite)
+        )
+    finally:
+        conexion.close()
+    df['detectado'] = a_fecha_local(df['detectado'])
+    df['tipo'] = df['tipo'].map(TIPOS_CAMBIO)
+    return df.rename(columns={'detectado': 'Detectado', 'cuit': 'CUIT', 'tipo': 'Tipo', 'descripcion': 'Descripción'})
+
+
+def resumen_vigilancia(ruta=None):
+    """
+    Cantidades para el encabezado de la página: vigilados, vencidos, de mayor riesgo y cambios de la última semana
+    """
+    conexion = conectar(ruta)
+    try:
+        ahora = time.time()
+        fila = conexion.execute(
+            """SELECT COUNT(*) AS vigilados,
+                      COALESCE(SUM(proxima_revision <= ?), 0) AS pendientes,
+                      COALESCE(SUM(prioridad = 2), 0) AS alto_riesgo
+               FROM vigilados""",
+            (ahora,)
+        ).fetchone()
+        cambios = conexion.execute(
+            "SELECT COUNT(*) FROM cambios WHERE detectado >= ?", (ahora - 7 * 86400,)
+        ).fetchone()[0]
+    finally:
+        conexion.close()
+    return {**dict(fila), 'cambios_semana': cambios}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subcomandos = parser.add_subparsers(dest='comando', required=True)
+
+    agregar = subcomandos.add_parser('agregar', help="Agregar CUITs a la vigilancia")
+    entrada = agregar.add_mutually_exclusive_group(required=True)
+    entrada.add_argument('--cuits', help="CUITs separados por comas")
+    entrada.add_argument('--archivo', help="Archivo CSV o Excel con una columna 'CUIT'")
+
+    quitar = subcomandos.add_parser('quitar', help="Quitar CUITs de la vigilancia")
+    quitar.add_argument('--cuits', required=True, help="CUITs separados por comas")
+
+    vigilante = subcomandos.add_parser('vigilante', help="Ejecutar el vigilante")
+    vigilante.add_argument('--consultas-por-minuto', type=float, default=CONSULTAS_POR_MINUTO)
+    vigilante.add_argument('--una-vez', action='store_true', help="Terminar cuando no queden revisiones vencidas")
+
+    subcomandos.add_parser('listar', help="Listar los CUITs vigilados")
+    subcomandos.add_parser('cambios', help="Listar los últimos cambios detectados")
+
+    args = parser.parse_args()
+
+    if args.comando == 'agregar':
+        if args.archivo:
+            df_cuits = pd.read_csv(args.archivo) if args.archivo.endswith('.csv') else pd.read_excel(args.archivo)
+            cuits_texto = ','.join(df_cuits['CUIT'].astype(str).tolist())
+        else:
+            cuits_texto = args.cuits
+        agregados, invalidos = agregar_cuits(cuits_texto)
+        for cuit in invalidos:
+            print(f"CUIT/CUIL/CDI inválido ignorado: {cuit}")
+        print(f"CUITs agregados: {agregados}")
+    elif args.comando == 'quitar':
+        print(f"CUITs quitados: {quitar_cuits(args.cuits)}")
+    elif args.comando == 'vigilante':
+        ciclo_vigilante(args.consultas_por_minuto, args.una_vez)
+    elif args.comando == 'listar':
+        print(listar_vigilados().to_string(index=False))
+    elif args.comando == 'cambios':
+        print(listar_cambios(limite=100).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()